@@ -0,0 +1,149 @@
+# Benchmark baselines: runs are saved in a results directory, tagged with the fingerprint of
+# the machine and the git revision, and a new run is compared to the baseline of its machine.
+# A view/backend regressed when its frame median is slower by more than the threshold and a
+# one-sided Mann-Whitney U test on the repeats says it's not noise.
+import os
+import json
+import hashlib
+from math import comb, erf, sqrt
+
+RESULTS_DIR = "bench_results"
+# slowdown of the frame median flagged as a regression, and significance of the test
+REGRESSION_THRESHOLD = 0.05
+SIGNIFICANCE = 0.05
+# machine fields of a fingerprint: the date and commit change between runs of a machine
+FINGERPRINT_FIELDS = ("platform", "processor", "cpu_count", "python", "numpy", "numba", "cuda")
+# exact U distribution below this many arrangements, normal approximation above
+EXACT_ARRANGEMENTS = 1_000_000
+
+
+def machine_fingerprint(machine):
+    return hashlib.sha1(
+        json.dumps([machine.get(field) for field in FINGERPRINT_FIELDS]).encode()
+    ).hexdigest()[:12]
+
+
+def baseline_path(results_dir, fingerprint):
+    return os.path.join(results_dir, f"baseline-{fingerprint}.json")
+
+
+def save_results(bench, results_dir=RESULTS_DIR, baseline=False):
+    # saved as <fingerprint>-<date>-<commit>.json, and as the machine's baseline if asked
+    os.makedirs(results_dir, exist_ok=True)
+    machine = bench["machine"]
+    fingerprint = machine_fingerprint(machine)
+    bench["fingerprint"] = fingerprint
+    date = machine["date"][:19].replace(":", "").replace("-", "")
+    paths = [os.path.join(results_dir, f"{fingerprint}-{date}-{machine['commit']}.json")]
+    if baseline:
+        paths.append(baseline_path(results_dir, fingerprint))
+    for path in paths:
+        with open(path, "w") as bench_file:
+            json.dump(bench, bench_file, indent=1)
+    return paths[0]
+
+
+def load_results(path):
+    with open(path) as bench_file:
+        return json.load(bench_file)
+
+
+def find_baseline(results_dir, fingerprint, exclude=None):
+    # the machine's pinned baseline, or its latest saved run, or None
+    path = baseline_path(results_dir, fingerprint)
+    if os.path.exists(path):
+        return path
+    runs = sorted(
+        name
+        for name in os.listdir(results_dir)
+        if name.startswith(f"{fingerprint}-") and os.path.join(results_dir, name) != exclude
+    ) if os.path.isdir(results_dir) else []
+    return os.path.join(results_dir, runs[-1]) if runs else None
+
+
+def u_statistic(slower, faster):
+    # pairs where the first sample is the larger one, ties count half
+    return sum((a > b) + 0.5 * (a == b) for a in slower for b in faster)
+
+
+def u_distribution(n, m):
+    # arrangements of n and m samples giving each U, by adding the largest sample to either side
+    counts = [[[1] for _ in range(m + 1)] for _ in range(n + 1)]
+    for i in range(n + 1):
+        for j in range(m + 1):
+            if i == 0 or j == 0:
+                continue
+            # the largest is in the first group: it beats the j others
+            with_first = [0] * j + counts[i - 1][j]
+            with_second = counts[i][j - 1]
+            size = max(len(with_first), len(with_second))
+            counts[i][j] = [
+                (with_first[u] if u < len(with_first) else 0) + (with_second[u] if u < len(with_second) else 0)
+                for u in range(size)
+            ]
+    return counts[n][m]
+
+
+def mann_whitney_p(new, base):
+    # one-sided p value of "new is slower than base"
+    (n, m) = (len(new), len(base))
+    if n == 0 or m == 0:
+        return 1.0
+    u = u_statistic(new, base)
+    if comb(n + m, n) <= EXACT_ARRANGEMENTS:
+        counts = u_distribution(n, m)
+        # ties make half integers, they count with the arrangements above them
+        return sum(counts[int(-(-u // 1)):]) / comb(n + m, n)
+    mean = n * m / 2
+    deviation = sqrt(n * m * (n + m + 1) / 12)
+    z = (u - 0.5 - mean) / deviation
+    return 0.5 * (1 - erf(z / sqrt(2)))
+
+
+def compare_results(base, new, threshold=REGRESSION_THRESHOLD, significance=SIGNIFICANCE):
+    # rows (view, backend, base median, new median, change, p value, status) of the new run
+    base_results = {(result["view"], result["backend"]): result for result in base["results"]}
+    rows = []
+    for result in new["results"]:
+        key = (result["view"], result["backend"])
+        new_runs = result["stages"]["compute_fractal"]["runs"]
+        if key not in base_results:
+            rows.append((*key, None, result["stages"]["compute_fractal"]["median"], None, None, "new"))
+            continue
+        base_frame = base_results[key]["stages"]["compute_fractal"]
+        new_frame = result["stages"]["compute_fractal"]
+        change = new_frame["median"] / max(base_frame["median"], 1e-12) - 1
+        p_slower = mann_whitney_p(new_runs, base_frame["runs"])
+        p_faster = mann_whitney_p(base_frame["runs"], new_runs)
+        if change > threshold and p_slower < significance:
+            status = "REGRESSION"
+        elif change < -threshold and p_faster < significance:
+            status = "faster"
+        else:
+            status = "ok"
+        p_value = p_slower if change >= 0 else p_faster
+        rows.append((*key, base_frame["median"], new_frame["median"], change, p_value, status))
+    return rows
+
+
+def format_comparison_row(row):
+    (view, backend, base_median, new_median, change, p_value, status) = row
+    if base_median is None:
+        return f"{view:<22} {backend:<13} {'':>10} {new_median * 1000:9.1f} ms {'':>8} {'':>7} {status}"
+    return (
+        f"{view:<22} {backend:<13} {base_median * 1000:9.1f} ms {new_median * 1000:9.1f} ms"
+        f" {change:+8.1%} p={p_value:.3f} {status}"
+    )
+
+
+def comparison_warnings(base, new):
+    # differences that make the comparison meaningless or weaker
+    warnings = []
+    if machine_fingerprint(base["machine"]) != machine_fingerprint(new["machine"]):
+        warnings.append("the baseline ran on another machine")
+    if base["size"] != new["size"]:
+        warnings.append(f"frame sizes differ: {base['size']} and {new['size']}")
+    if min(base["repeats"], new["repeats"]) < 4:
+        # with 3 repeats on each side the smallest one-sided p value is 0.05
+        warnings.append("less than 4 repeats, the test can't reach significance")
+    return warnings
@@ -0,0 +1,298 @@
+# Benchmarks: every canonical view on every available backend, a frame computed and colored
+# like the ui does it. Stages are the timed functions a frame calls (fractal_*, min/max,
+# color, palette preparation), their median and p95 over the repeats are saved as JSON with
+# the machine they ran on, so machines and releases can be compared.
+import io
+import sys
+import json
+import argparse
+import platform
+import subprocess
+from os import cpu_count
+from datetime import datetime, timezone
+from contextlib import redirect_stdout
+from numpy import (
+    median as np_median,
+    percentile as np_percentile,
+    __version__ as numpy_version,
+)
+from utils import timer
+from utils.cuda import cuda_available
+from utils.numba_cpu import numba_available
+from fractal import fractal_perturbation
+from fractal.fractal_cost import frame_cost, reset_executed_iterations
+from fractal.fractal import init_arrays, compute_fractal, Compute_Backend
+from fractal.fractal_backends import available_backends, backend_supports
+from fractal.colors import Palette_Mode
+from fractal.palette import palettes_definitions, prepare_palettes, get_computed_palette
+from bench import compare
+from bench.views import BENCH_VIEWS, view_appstate
+
+BENCH_SIZE = (640, 480)
+BENCH_REPEATS = 5
+# runs before the timed ones, they compile the kernels
+BENCH_WARMUP = 1
+# the stage timing a whole frame
+FRAME_STAGE = "compute_fractal"
+
+
+def view_backends(appstate, backends):
+    # float64 pixel coordinates collapse on deep views, only arbitrary precision backends render them
+    return [
+        backend
+        for backend in backends
+        if backend_supports(backend, appstate.fractal_mode, appstate.power, appstate.yheight)
+    ]
+
+
+def machine_info():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    if numba_available():
+        import numba
+
+        numba_version = numba.__version__
+    else:
+        numba_version = None
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": cpu_count(),
+        "python": platform.python_version(),
+        "numpy": numpy_version,
+        "numba": numba_version,
+        "cuda": cuda_available(),
+        "commit": commit,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def stage_stats(durations):
+    return {
+        "median": float(np_median(durations)),
+        "p95": float(np_percentile(durations, 95)),
+        "min": float(min(durations)),
+        "runs": durations,
+    }
+
+
+def compute_frame(appstate, backend):
+    # one frame like the ui computes it, with palettes prepared first
+    computed_palettes = prepare_palettes(palettes_definitions, appstate.max_iterations)
+    if appstate.palette_mode == Palette_Mode.CUSTOM:
+        custom_palette = get_computed_palette(computed_palettes, appstate.custom_palette_name)
+    else:
+        custom_palette = []
+    (host_array_niter, host_array_z2, host_array_der2, host_array_k, host_array_rgb) = init_arrays(
+        appstate.WINDOW_SIZE
+    )
+    return compute_fractal(
+        host_array_niter,
+        0,
+        0,
+        host_array_z2,
+        0,
+        0,
+        host_array_der2,
+        0,
+        0,
+        host_array_k,
+        host_array_rgb,
+        appstate.WINDOW_SIZE,
+        appstate.xmax,
+        appstate.xmin,
+        appstate.ymin,
+        appstate.ymax,
+        appstate.fractal_mode,
+        appstate.max_iterations,
+        appstate.power,
+        appstate.escape_radius,
+        appstate.epsilon,
+        appstate.juliaxy,
+        appstate.normalization_mode,
+        appstate.palette_mode,
+        custom_palette,
+        appstate.palette_width,
+        appstate.palette_shift,
+        True,
+        True,
+        backend,
+        appstate.interior_check,
+        appstate.xcenter,
+        appstate.ycenter,
+        appstate.yheight,
+    )
+
+
+def bench_view(appstate, backend, repeats=BENCH_REPEATS, warmup=BENCH_WARMUP):
+    # stage durations of repeats frames, and the throughput of their medians
+    runs = []
+    for run in range(warmup + repeats):
+        # every frame computes its own reference orbit, like a new view in the ui
+        fractal_perturbation.reference_cache = None
+        fractal_perturbation.series_cache = None
+        reset_executed_iterations()
+        timer.start_timing_records()
+        # the stages print their timings, only the summary is shown
+        with redirect_stdout(io.StringIO()):
+            frame = compute_frame(appstate, backend)
+        records = timer.stop_timing_records()
+        if run >= warmup:
+            stages = {}
+            for name, duration in records:
+                stages[name] = stages.get(name, 0) + duration
+            runs.append(stages)
+    (width, height) = appstate.WINDOW_SIZE
+    # iterations the last frame executed, split between escaped, epsilon and interior pixels
+    cost = frame_cost(frame[0], frame[3], appstate.max_iterations, appstate.escape_radius)
+    iterations = cost["iterations"]
+    stages = {name: stage_stats([stages.get(name, 0) for stages in runs]) for name in runs[0]}
+    # the iteration stage is the fractal_* one, kernels it calls (reference orbit...) are inside it
+    iteration_stage = max(
+        (name for name in stages if name.startswith("fractal_")),
+        key=lambda name: stages[name]["median"],
+        default=FRAME_STAGE,
+    )
+    return {
+        "pixels": width * height,
+        "iterations": iterations,
+        # periodicity exits count max_iterations, iterations and Giter/s are then at most these
+        "iterations_upper_bound": cost["upper_bound"],
+        "mpixel_per_s": width * height / 1e6 / max(stages[FRAME_STAGE]["median"], 1e-9),
+        "giterations_per_s": iterations / 1e9 / max(stages[iteration_stage]["median"], 1e-9),
+        "iteration_stage": iteration_stage,
+        "exits": cost["exits"],
+        "histogram": cost["histogram"],
+        "stages": stages,
+    }
+
+
+def format_bench_result(result):
+    frame = result["stages"][FRAME_STAGE]
+    return (
+        f"{result['view']:<22} {result['backend']:<13}"
+        f" {frame['median'] * 1000:9.1f} ms median {frame['p95'] * 1000:9.1f} ms p95"
+        f" | {result['mpixel_per_s']:7.2f} Mpixel/s"
+        f" | {'<=' if result['iterations_upper_bound'] else '  '}{result['giterations_per_s']:6.3f} Giter/s"
+    )
+
+
+def run_benchmarks(views, backends, size=BENCH_SIZE, repeats=BENCH_REPEATS, warmup=BENCH_WARMUP):
+    results = []
+    for view in views:
+        appstate = view_appstate(view, size)
+        for backend in view_backends(appstate, backends):
+            result = {"view": view, "backend": backend.name.lower()}
+            result.update(bench_view(appstate, backend, repeats, warmup))
+            print(format_bench_result(result))
+            results.append(result)
+    return {
+        "machine": machine_info(),
+        "size": list(size),
+        "repeats": repeats,
+        "warmup": warmup,
+        "results": results,
+    }
+
+
+def parse_size(size):
+    (width, height) = size.lower().split("x")
+    return int(width), int(height)
+
+
+def add_run_arguments(parser):
+    parser.add_argument("--views", nargs="+", choices=list(BENCH_VIEWS), default=list(BENCH_VIEWS))
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=[backend.name.lower() for backend in available_backends()],
+        help="all the available ones by default",
+    )
+    parser.add_argument("--size", help="frame size, WIDTHxHEIGHT", default="x".join(map(str, BENCH_SIZE)))
+    parser.add_argument("--repeats", type=int, default=BENCH_REPEATS)
+    parser.add_argument("--warmup", type=int, default=BENCH_WARMUP)
+
+
+def run_from_arguments(args):
+    if args.backends is None:
+        backends = available_backends()
+    else:
+        backends = [Compute_Backend[backend.upper()] for backend in args.backends]
+    return run_benchmarks(args.views, backends, parse_size(args.size), args.repeats, args.warmup)
+
+
+def compare_command(args):
+    # compares a run, new or loaded, to the baseline of its machine, True on regressions
+    if args.input is not None:
+        bench = compare.load_results(args.input)
+    else:
+        bench = run_from_arguments(args)
+    fingerprint = compare.machine_fingerprint(bench["machine"])
+    if args.baseline is not None:
+        baseline = args.baseline
+    else:
+        baseline = compare.find_baseline(args.results_dir, fingerprint)
+    if not args.no_save:
+        saved = compare.save_results(bench, args.results_dir, args.set_baseline)
+        print(f"Saved benchmarks to {saved}")
+    if baseline is None:
+        print(f"No baseline for machine {fingerprint} in {args.results_dir}, this run is the first one")
+        return False
+    base = compare.load_results(baseline)
+    print(f"Baseline {baseline}: commit {base['machine']['commit']} of {base['machine']['date']}")
+    for warning in compare.comparison_warnings(base, bench):
+        print(f"Warning: {warning}")
+    rows = compare.compare_results(base, bench, args.threshold, args.alpha)
+    for row in rows:
+        print(compare.format_comparison_row(row))
+    regressions = [row for row in rows if row[-1] == "REGRESSION"]
+    print(
+        f"{len(regressions)} regressions over {args.threshold:.0%} (p < {args.alpha})"
+        f" in {len(rows)} views and backends"
+    )
+    return len(regressions) > 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="bench", description="fractal benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="time the canonical views on the available backends")
+    add_run_arguments(run_parser)
+    run_parser.add_argument("-o", "--output", help="JSON results", default="bench.json")
+    compare_parser = commands.add_parser(
+        "compare", help="run, save the results and compare them to the machine's baseline"
+    )
+    add_run_arguments(compare_parser)
+    compare_parser.add_argument("-i", "--input", help="compare these JSON results instead of running")
+    compare_parser.add_argument("--results-dir", help="saved results", default=compare.RESULTS_DIR)
+    compare_parser.add_argument("--baseline", help="JSON results to compare to, the machine's baseline by default")
+    compare_parser.add_argument(
+        "--set-baseline", action="store_true", help="save the results as the machine's baseline"
+    )
+    compare_parser.add_argument("--no-save", action="store_true", help="don't save the results")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=compare.REGRESSION_THRESHOLD,
+        help="slowdown of the median frame time flagged, 0.05 is 5%%",
+    )
+    compare_parser.add_argument(
+        "--alpha", type=float, default=compare.SIGNIFICANCE, help="significance of the Mann-Whitney U test"
+    )
+    args = parser.parse_args()
+    if args.command == "run":
+        bench = run_from_arguments(args)
+        with open(args.output, "w") as bench_file:
+            json.dump(bench, bench_file, indent=1)
+        print(f"Saved benchmarks to {args.output}")
+    elif args.command == "compare":
+        if compare_command(args):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# Canonical views of the benchmarks, each one stresses something else: mostly interior pixels
+# (full set), long escapes along filaments (seahorse valley), perturbation at a depth float64
+# can't reach (elephant valley), Julia sets without a cardioid shortcut, and z**power variants
+from utils.appState import AppState
+from utils.types import type_math_int, type_math_float, type_math_complex, type_math_decimal, type_enum_int
+from fractal.fractal_math import Fractal_Mode
+
+# name -> parameters differing from the defaults
+BENCH_VIEWS = {
+    "full_set": {"xcenter": "-0.5", "ycenter": "0", "yheight": 3.0},
+    "seahorse_valley": {"xcenter": "-0.7453", "ycenter": "0.1127", "yheight": 0.0065},
+    "elephant_valley_deep": {
+        "xcenter": "0.29097468966250666663497621371",
+        "ycenter": "0.01649358848014666669740193409",
+        "yheight": 1e-11,
+        "max_iterations": 10000,
+    },
+    "julia_dendrite": {
+        "xcenter": "0",
+        "ycenter": "0",
+        "yheight": 3.0,
+        "fractal_mode": Fractal_Mode.JULIA,
+        "juliaxy": 1j,
+    },
+    "julia_rabbit": {
+        "xcenter": "0",
+        "ycenter": "0",
+        "yheight": 2.4,
+        "fractal_mode": Fractal_Mode.JULIA,
+        "juliaxy": -0.123 + 0.745j,
+    },
+    "multibrot_5": {"xcenter": "0", "ycenter": "0", "yheight": 3.0, "power": 5},
+    "multibrot_8": {"xcenter": "0", "ycenter": "0", "yheight": 3.0, "power": 8},
+}
+
+
+def view_appstate(name, size):
+    appstate = AppState()
+    view = BENCH_VIEWS[name]
+    appstate.xcenter = type_math_decimal(view["xcenter"])
+    appstate.ycenter = type_math_decimal(view["ycenter"])
+    appstate.yheight = type_math_float(view["yheight"])
+    appstate.max_iterations = type_math_int(view.get("max_iterations", appstate.max_iterations))
+    appstate.power = type_math_int(view.get("power", appstate.power))
+    appstate.fractal_mode = type_enum_int(view.get("fractal_mode", appstate.fractal_mode))
+    appstate.juliaxy = type_math_complex(view.get("juliaxy", appstate.juliaxy))
+    appstate.set_window_size(size)
+    return appstate
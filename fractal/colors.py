@@ -1,7 +1,19 @@
 from math import log
 from enum import IntEnum
 from typing import Tuple, List
+from numpy import (
+    array as np_array,
+    where as np_where,
+    select as np_select,
+    unique as np_unique,
+    frompyfunc as np_frompyfunc,
+    errstate as np_errstate,
+    remainder as np_remainder,
+    zeros as np_zeros,
+    full_like as np_full_like,
+)
 from utils.cuda import cuda_jit, cuda_grid
+from utils.timer import timing_wrapper
 from utils.types import (
     type_math_float,
     type_math_int,
@@ -225,6 +237,118 @@ def color_kernel(
         device_array_rgb[x, y] = packedrgb
 
 
+# Whole-array versions of the functions above, color_numpy matches color_xy exactly
+
+# numpy's simd log can differ from libm log (used by color_xy) in the last bit
+libm_log = np_frompyfunc(log, 1, 1)
+
+
+def rgb_to_packed_numpy(r, g, b):
+    return ((r.astype(type_color_int) * 256) + g) * 256 + b
+
+
+def hsv_to_rgb_numpy(h, s: type_color_float, v: type_color_float):
+    # h is an array, s and v are scalars, like in color_xy
+    if s > 0:
+        h = np_where(h == 1.0, type_color_float(0), h)
+        i = (h * 6.0).astype(type_math_int)
+        f = h * 6.0 - i
+
+        w = v * (1.0 - s)
+        q = v * (1.0 - s * f)
+        t = v * (1.0 - s * (1.0 - f))
+
+        cases = [i == 0, i == 1, i == 2, i == 3, i == 4, i == 5]
+        r = np_select(cases, [v, q, w, w, t, v], type_color_float(0))
+        g = np_select(cases, [t, v, v, q, w, w], type_color_float(0))
+        b = np_select(cases, [w, w, t, v, v, q], type_color_float(0))
+    else:
+        r = g = b = np_full_like(h, v)
+    return rgb_to_packed_numpy(
+        (r * 255).astype(type_color_int_small),
+        (g * 255).astype(type_color_int_small),
+        (b * 255).astype(type_color_int_small),
+    )
+
+
+def get_palette_color_numpy(computed_palette: List[type_color_int], k):
+    palette = np_array(computed_palette, dtype=type_color_int)
+    k = np_where((k < 0.0) | (k > 1.0), type_math_float(0.0), k)
+    i = (k * len(palette)).astype(type_math_int)
+    return palette[i]
+
+
+def color_numpy(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    host_array_k,
+    host_array_rgb,
+    niter_min: type_math_int,
+    niter_max: type_math_int,
+    z2_min: type_math_float,
+    z2_max: type_math_float,
+    der2_min: type_math_float,
+    der2_max: type_math_float,
+    max_iterations: type_math_int,
+    escape_radius: type_math_int,
+    normalization_mode: type_enum_int,
+    palette_mode: type_enum_int,
+    custom_palette: List[type_color_int],
+    palette_width: type_math_float,
+    palette_shift: type_math_float,
+):
+    with np_errstate(all="ignore"):
+        # calculate k[0-1] based on k mode, interior pixels stay at 0
+        normalized_k = np_zeros(host_array_niter.shape, dtype=type_math_float)
+        escaped = host_array_z2 > escape_radius
+        nb_iter = host_array_niter[escaped]
+        z2 = host_array_z2[escaped]
+        match normalization_mode:
+            case Normalization_Mode.ITER_NORMALIZED:
+                normalized_k[escaped] = (nb_iter - niter_min) / (niter_max - niter_min)
+            case Normalization_Mode.ITER:
+                normalized_k[escaped] = nb_iter / max_iterations
+            case Normalization_Mode.LOG_ITER:
+                # few distinct niter values, take libm log once per value
+                values, inverse = np_unique(nb_iter, return_inverse=True)
+                log_values = np_array(
+                    [log(type_math_float(v)) for v in values], dtype=type_math_float
+                )
+                normalized_k[escaped] = log_values[inverse] / log(
+                    type_math_float(max_iterations)
+                )
+            case Normalization_Mode.R_Z2:
+                normalized_k[escaped] = type_math_float(escape_radius) / z2
+            case Normalization_Mode.LOG_R_Z2:
+                normalized_k[escaped] = log(type_math_float(escape_radius)) / libm_log(
+                    z2
+                ).astype(type_math_float)
+            case Normalization_Mode.INV_Z2:
+                normalized_k[escaped] = 1 / z2
+        # apply palette width and shift
+        shifted_k = np_remainder(
+            (normalized_k + palette_shift) / palette_width, 1, out=host_array_k
+        )
+        # calculate color from k
+        match palette_mode:
+            case Palette_Mode.HUE:
+                packedrgb = hsv_to_rgb_numpy(
+                    shifted_k, type_color_float(1), type_color_float(1)
+                )
+                packedrgb[shifted_k == float(0.0)] = 0
+            case Palette_Mode.GRAYSCALE:
+                k255 = (shifted_k * 255).astype(type_color_int_small)
+                packedrgb = rgb_to_packed_numpy(k255, k255, k255)
+            case Palette_Mode.CUSTOM:  # custom palette_mode k to rgb
+                packedrgb = get_palette_color_numpy(custom_palette, shifted_k)
+            case _:  # red
+                packedrgb = (255 * 256) * 256
+        host_array_rgb[:] = packedrgb
+    return host_array_k, host_array_rgb
+
+
+@timing_wrapper
 def color_cpu(
     host_array_niter,
     host_array_z2,
@@ -245,34 +369,58 @@ def color_cpu(
     palette_width: type_math_float,
     palette_shift: type_math_float,
 ):
-    # NON vectorized version:
-    for x in range(host_array_niter.shape[0]):
-        for y in range(host_array_niter.shape[1]):
-            nb_iter = host_array_niter[x, y]
-            z2 = host_array_z2[x, y]
-            der2 = host_array_der2[x, y]
-            k, packedrgb = color_xy(
-                type_math_int(x),
-                type_math_int(y),
-                nb_iter,
-                niter_min,
-                niter_max,
-                max_iterations,
-                z2,
-                z2_min,
-                z2_max,
-                escape_radius,
-                der2,
-                der2_min,
-                der2_max,
-                normalization_mode,
-                palette_mode,
-                custom_palette,
-                palette_width,
-                palette_shift,
-            )
-            host_array_k[x, y] = k
-            host_array_rgb[x, y] = packedrgb
+    run_vectorized = True
+    if run_vectorized:
+        # vectorized version, colors all pixels at once:
+        host_array_k, host_array_rgb = color_numpy(
+            host_array_niter,
+            host_array_z2,
+            host_array_der2,
+            host_array_k,
+            host_array_rgb,
+            niter_min,
+            niter_max,
+            z2_min,
+            z2_max,
+            der2_min,
+            der2_max,
+            max_iterations,
+            escape_radius,
+            normalization_mode,
+            palette_mode,
+            custom_palette,
+            palette_width,
+            palette_shift,
+        )
+    else:
+        # NON vectorized version:
+        for x in range(host_array_niter.shape[0]):
+            for y in range(host_array_niter.shape[1]):
+                nb_iter = host_array_niter[x, y]
+                z2 = host_array_z2[x, y]
+                der2 = host_array_der2[x, y]
+                k, packedrgb = color_xy(
+                    type_math_int(x),
+                    type_math_int(y),
+                    nb_iter,
+                    niter_min,
+                    niter_max,
+                    max_iterations,
+                    z2,
+                    z2_min,
+                    z2_max,
+                    escape_radius,
+                    der2,
+                    der2_min,
+                    der2_max,
+                    normalization_mode,
+                    palette_mode,
+                    custom_palette,
+                    palette_width,
+                    palette_shift,
+                )
+                host_array_k[x, y] = k
+                host_array_rgb[x, y] = packedrgb
     return host_array_k, host_array_rgb
 
 
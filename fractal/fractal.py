@@ -1,23 +1,32 @@
 # from timeit import default_timer
-from enum import IntEnum
+from functools import partial
 from typing import List
 from fractal.colors import Palette_Mode, Normalization_Mode
-from fractal.fractal_math import Fractal_Mode
+from fractal.fractal_math import Fractal_Mode, Interior_Check
 from utils.types import (
     type_math_int,
     type_math_float,
     type_math_complex,
+    type_math_decimal,
     type_enum_int,
     type_color_int,
 )
 from utils.cuda import (
-    cuda_available,
     init_array,
     cuda_copy_to_host,
 )
+from utils import instrumentation
 from utils.timer import timing_wrapper
-from fractal.fractal_cuda import compute_fracta_cuda
-from fractal.fractal_cpu import compute_fractal_cpu
+from fractal.fractal_backends import (
+    Compute_Backend,
+    Precision,
+    backend_registry,
+    resolve_backend,
+    backend_compute,
+    backend_work,
+)
+from fractal.fractal_cost import count_executed_iterations, interior_stops
+
 
 @timing_wrapper
 def init_arrays(WINDOW_SIZE):
@@ -73,14 +82,28 @@ def compute_fractal(
     palette_shift: type_math_float,
     recalc_fractal: bool = True,
     recalc_color: bool = False,
+    backend: Compute_Backend = Compute_Backend.AUTO,
+    interior_check: type_enum_int = Interior_Check.NONE,
+    xcenter: type_math_decimal = None,
+    ycenter: type_math_decimal = None,
+    yheight: type_math_float = None,
 ):
     # timerstart = default_timer()
-    if cuda_available():
-        compute_fractal = compute_fracta_cuda
-    else:  # No cuda
-        compute_fractal = compute_fractal_cpu
+    # AUTO is perturbation on deep zooms, the machine's fastest backend otherwise
+    backend = resolve_backend(backend, fractalmode, power, yheight)
+    compute_fractal = backend_compute(backend)
+    if backend_registry[backend]["precision"] == Precision.ARBITRARY:
+        # these backends need the arbitrary precision center
+        compute_fractal = partial(
+            compute_fractal,
+            xcenter=xcenter,
+            ycenter=ycenter,
+            yheight=yheight,
+        )
+    if recalc_fractal:
+        instrumentation.count("fractal.pixels", host_array_niter.size)
 
-    return compute_fractal(
+    frame = compute_fractal(
         host_array_niter,
         niter_min,
         niter_max,
@@ -110,4 +133,18 @@ def compute_fractal(
         palette_shift,
         recalc_fractal,
         recalc_color,
+        interior_check,
     )
+    if recalc_fractal:
+        # the frame cost counts the iterations the backend executed, the arbitrary precision
+        # backends skip the interior checks
+        if backend_registry[backend]["precision"] == Precision.FLOAT64:
+            stops = interior_stops(
+                WINDOW_SIZE, xmax, xmin, ymin, ymax, fractalmode, power, escape_radius, epsilon, interior_check
+            )
+        else:
+            stops = (None, False)
+        count_executed_iterations(
+            frame[0], frame[3], max_iterations, escape_radius, *backend_work(backend), *stops
+        )
+    return frame
@@ -0,0 +1,312 @@
+# Compute backends: every backend registers its compute function, with the same arguments as
+# compute_fractal, when it's available and what it can compute (fractal modes, powers,
+# precision, exactness). AUTO picks perturbation on deep zooms, the fastest exact backend of
+# the machine on the others: measured once on a small frame, then cached with the machine it
+# ran on. Approximate backends are only used when asked for, FRACTAL_BACKEND=<name> overrides
+# the choice.
+import os
+import io
+import json
+import platform
+from enum import IntEnum
+from os import cpu_count
+from time import perf_counter
+from contextlib import redirect_stdout
+from numpy import __version__ as numpy_version
+from fractal.colors import Palette_Mode, Normalization_Mode
+from fractal.fractal_math import Fractal_Mode, Interior_Check
+from utils.types import type_math_int, type_math_float, type_math_complex
+from utils.cuda import cuda_available, init_array, cuda_copy_to_host
+from utils.numba_cpu import numba_available
+from fractal.fractal_cuda import compute_fracta_cuda
+from fractal.fractal_cpu import compute_fractal_cpu
+from fractal.fractal_numba import compute_fractal_numba
+from fractal.fractal_pool import compute_fractal_pool, close_pool
+from fractal.fractal_threads import compute_fractal_threads
+from fractal.fractal_subdivide import compute_fractal_subdivide, subdivide_work
+from fractal.fractal_perturbation import compute_fractal_perturbation, perturbation_work, DEEP_ZOOM_HEIGHT
+
+
+class Compute_Backend(IntEnum):
+    AUTO = 0
+    CUDA = 1
+    CPU = 2
+    NUMBA = 3
+    POOL = 4
+    THREADS = 5
+    SUBDIVIDE = 6
+    PERTURBATION = 7
+
+
+class Precision(IntEnum):
+    # float64 pixel coordinates, or an arbitrary precision center for deep zooms
+    FLOAT64 = 0
+    ARBITRARY = 1
+
+
+BACKEND_ENV = "FRACTAL_BACKEND"
+BACKEND_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "fractal", "backend.json")
+# micro-benchmark frame: seahorse valley, escaped and interior pixels
+AUTO_BENCH_SIZE = (160, 120)
+AUTO_BENCH_VIEW = (-0.7453, 0.1127, 0.0065)
+AUTO_BENCH_ITERATIONS = 256
+AUTO_BENCH_REPEATS = 3
+# powers AppState cycles through
+ALL_POWERS = range(0, 16)
+
+# Session state: registered backends, and the backend AUTO picked on shallow views
+backend_registry = {}
+auto_backend = None
+# backend AUTO picked, how, and the micro-benchmark timings in seconds by backend name
+last_auto_backend_stats = {}
+
+
+def register_backend(
+    backend,
+    compute,
+    available,
+    modes=tuple(Fractal_Mode),
+    powers=ALL_POWERS,
+    precision=Precision.FLOAT64,
+    release=None,
+    exact=True,
+    work=None,
+):
+    # available is called when the backend is needed, release frees what a benchmark run created,
+    # an approximate backend computes some pixels differently than iterating each of them,
+    # work returns (iterations skipped per pixel, mask of the pixels iterated or None for all)
+    # of its last frame, when it doesn't iterate all the iterations of all the pixels
+    backend_registry[backend] = {
+        "compute": compute,
+        "available": available,
+        "modes": tuple(modes),
+        "powers": powers,
+        "precision": precision,
+        "release": release,
+        "exact": exact,
+        "work": work,
+    }
+
+
+def backend_available(backend):
+    return backend in backend_registry and backend_registry[backend]["available"]()
+
+
+def backend_supports(backend, fractalmode, power, yheight=None):
+    capabilities = backend_registry[backend]
+    deep = yheight is not None and yheight < DEEP_ZOOM_HEIGHT
+    return (
+        fractalmode in capabilities["modes"]
+        and power in capabilities["powers"]
+        and (not deep or capabilities["precision"] == Precision.ARBITRARY)
+    )
+
+
+def backend_work(backend):
+    work = backend_registry[backend]["work"]
+    return (0, None) if work is None else work()
+
+
+def available_backends(precision=None, exact=None):
+    return [
+        backend
+        for backend in backend_registry
+        if backend_available(backend)
+        and (precision is None or backend_registry[backend]["precision"] == precision)
+        and (exact is None or backend_registry[backend]["exact"] == exact)
+    ]
+
+
+def auto_backends(precision):
+    # the backends AUTO chooses from
+    return available_backends(precision, exact=True)
+
+
+def format_auto_backend_stats(auto_backend_stats):
+    return " | ".join(
+        [f"Backend: {auto_backend_stats['backend']} ({auto_backend_stats['source']})"]
+        + [f"{name} {seconds * 1000:.1f} ms" for name, seconds in auto_backend_stats["timings"].items()]
+    )
+
+
+def machine_key():
+    # what the fastest backend depends on, a cached choice is only reused on the same machine
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": cpu_count(),
+        "python": platform.python_version(),
+        "numpy": numpy_version,
+        "numba": numba_available(),
+        "cuda": cuda_available(),
+        "backends": [backend.name for backend in auto_backends(Precision.FLOAT64)],
+    }
+
+
+def time_backend(backend, repeats=AUTO_BENCH_REPEATS, fastest=None):
+    # best time of a small colored frame, after a run compiling the kernels, a single
+    # run when it's already twice as slow as the fastest one
+    (screenw, screenh) = AUTO_BENCH_SIZE
+    (xcenter, ycenter, yheight) = AUTO_BENCH_VIEW
+    xwidth = yheight * screenw / screenh
+    arrays = [
+        cuda_copy_to_host(init_array(screenw, screenh, dtype))
+        for dtype in (type_math_int, type_math_float, type_math_float, type_math_float, type_math_int)
+    ]
+    best = None
+    for run in range(1 + repeats):
+        timerstart = perf_counter()
+        backend_registry[backend]["compute"](
+            arrays[0],
+            0,
+            0,
+            arrays[1],
+            0,
+            0,
+            arrays[2],
+            0,
+            0,
+            arrays[3],
+            arrays[4],
+            AUTO_BENCH_SIZE,
+            type_math_float(xcenter + xwidth / 2),
+            type_math_float(xcenter - xwidth / 2),
+            type_math_float(ycenter - yheight / 2),
+            type_math_float(ycenter + yheight / 2),
+            Fractal_Mode.MANDELBROT,
+            type_math_int(AUTO_BENCH_ITERATIONS),
+            type_math_int(2),
+            type_math_int(4),
+            type_math_float(0.001),
+            type_math_complex(0),
+            Normalization_Mode.ITER_NORMALIZED,
+            Palette_Mode.HUE,
+            [],
+            type_math_float(1.0),
+            type_math_float(0.0),
+            True,
+            True,
+            Interior_Check.ALL,
+        )
+        elapsed = perf_counter() - timerstart
+        if run > 0:
+            best = elapsed if best is None else min(best, elapsed)
+            if fastest is not None and best > 2 * fastest:
+                break
+    return best
+
+
+def benchmark_backends():
+    # fastest exact float64 backend of this machine, and the time of each one
+    timings = {}
+    for backend in auto_backends(Precision.FLOAT64):
+        # backends print their stats, only the choice is shown
+        with redirect_stdout(io.StringIO()):
+            timings[backend.name.lower()] = time_backend(backend, fastest=min(timings.values(), default=None))
+    fastest = Compute_Backend[min(timings, key=timings.get).upper()]
+    for backend in auto_backends(Precision.FLOAT64):
+        release = backend_registry[backend]["release"]
+        if backend != fastest and release is not None:
+            release()
+    return fastest, timings
+
+
+def read_backend_cache(path=BACKEND_CACHE_FILE):
+    # the cached choice when it was measured on this machine, or None
+    try:
+        with open(path) as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+    if cache.get("machine") != json.loads(json.dumps(machine_key())):
+        return None
+    backend = Compute_Backend.__members__.get(str(cache.get("backend")).upper())
+    if backend is None or backend not in auto_backends(Precision.FLOAT64):
+        return None
+    return backend, cache["timings"]
+
+
+def write_backend_cache(backend, timings, path=BACKEND_CACHE_FILE):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as cache_file:
+            json.dump({"machine": machine_key(), "backend": backend.name.lower(), "timings": timings}, cache_file, indent=1)
+        os.replace(path + ".tmp", path)
+    except OSError as error:
+        # the choice is measured again next time
+        print(f"Backend choice not cached: {error}")
+
+
+def select_auto_backend(rebenchmark=False):
+    # the backend AUTO uses on shallow views: FRACTAL_BACKEND, the cached choice or a new
+    # micro-benchmark, chosen once per session
+    global auto_backend, last_auto_backend_stats
+    if auto_backend is not None and not rebenchmark:
+        return auto_backend
+    override = os.environ.get(BACKEND_ENV, "").upper()
+    cached = None if rebenchmark else read_backend_cache()
+    if override not in ("", "AUTO"):
+        if override not in Compute_Backend.__members__:
+            raise ValueError(
+                f"{BACKEND_ENV}={override.lower()}: unknown backend, one of"
+                f" {', '.join(backend.name.lower() for backend in Compute_Backend)}"
+            )
+        (auto_backend, timings, source) = (Compute_Backend[override], {}, BACKEND_ENV)
+    elif cached is not None:
+        (auto_backend, timings) = cached
+        source = "cached"
+    else:
+        (auto_backend, timings) = benchmark_backends()
+        source = "measured"
+        write_backend_cache(auto_backend, timings)
+    last_auto_backend_stats = {"backend": auto_backend.name.lower(), "source": source, "timings": timings}
+    print(format_auto_backend_stats(last_auto_backend_stats))
+    return auto_backend
+
+
+def resolve_backend(backend, fractalmode, power, yheight=None):
+    # the backend computing a frame: AUTO becomes perturbation on deep zooms, the machine's
+    # fastest backend otherwise, or the first exact one supporting the frame
+    if backend != Compute_Backend.AUTO:
+        return backend
+    if yheight is not None and yheight < DEEP_ZOOM_HEIGHT:
+        candidates = auto_backends(Precision.ARBITRARY)
+    else:
+        candidates = [select_auto_backend()] + auto_backends(Precision.FLOAT64)
+    for candidate in candidates:
+        if backend_supports(candidate, fractalmode, power, yheight):
+            return candidate
+    raise ValueError(f"no available backend computes mode {Fractal_Mode(fractalmode).name} power {power}")
+
+
+def backend_compute(backend):
+    return backend_registry[backend]["compute"]
+
+
+def always_available():
+    return True
+
+
+register_backend(Compute_Backend.CUDA, compute_fracta_cuda, cuda_available)
+# NumPy engine, and numba kernels compiled for the cpu cores
+register_backend(Compute_Backend.CPU, compute_fractal_cpu, always_available)
+register_backend(Compute_Backend.NUMBA, compute_fractal_numba, numba_available)
+register_backend(Compute_Backend.POOL, compute_fractal_pool, always_available, release=close_pool)
+register_backend(Compute_Backend.THREADS, compute_fractal_threads, always_available)
+# fills interior rectangles from their border, misses the details they enclose, its loop is a numba kernel
+register_backend(
+    Compute_Backend.SUBDIVIDE, compute_fractal_subdivide, numba_available, exact=False, work=subdivide_work
+)
+# needs the arbitrary precision center, compute_fractal passes it
+register_backend(
+    Compute_Backend.PERTURBATION,
+    compute_fractal_perturbation,
+    always_available,
+    precision=Precision.ARBITRARY,
+    work=perturbation_work,
+)
+
+
+if __name__ == "__main__":
+    # measures the backends again and caches the choice
+    select_auto_backend(rebenchmark=True)
@@ -0,0 +1,232 @@
+# Tile cache: computed samples are kept in TILE_SIZE square tiles of the grid of pixels of
+# their frame, one grid per pixel size. Zooming by 2 halves the pixel size, so the grids of
+# successive zoom levels make a quadtree, and a frame seen again (panning back, zooming back
+# out) is assembled from its tiles. A grid is the lattice of points center + k * pixel size,
+# its phase is the fractional part of k: frames moved by whole pixels (pan, snapped zoom)
+# share the grid and its tiles. Sub-grids (progressive levels) fill their samples of a tile.
+from collections import OrderedDict
+from decimal import localcontext
+from utils.types import (
+    type_math_int,
+    type_math_float,
+    type_math_decimal,
+)
+from numpy import empty as np_empty, zeros as np_zeros, bool_ as np_bool_
+from utils import instrumentation
+from fractal.fractal_perturbation import decimal_digits
+from fractal.fractal_store import (
+    tile_store_open,
+    refresh_tile_store,
+    stored_tile,
+    write_tile,
+    flush_tile_store,
+)
+
+TILE_SIZE = 64
+# resolution of the grid phase, 1/2**PHASE_BITS of a pixel
+PHASE_BITS = 20
+# default memory for the tiles, in bytes
+TILE_CACHE_BUDGET = 256 * 1024 * 1024
+
+# Session state: key -> (niter, z2, der2, computed) tile, least recently used first
+tile_cache = OrderedDict()
+tile_cache_bytes = 0
+tile_cache_budget = TILE_CACHE_BUDGET
+# counters since the start of the session, hits and misses are in tiles
+tile_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def format_tile_cache_stats(cache_stats):
+    hits = cache_stats["hits"]
+    misses = cache_stats["misses"]
+    evictions = cache_stats["evictions"]
+    return (
+        f"Tile cache: {hits} hits | {misses} misses ({hits / max(1, hits + misses):.1%} hit rate)"
+        f" | {evictions} evictions | {len(tile_cache)} tiles"
+        f" {tile_cache_bytes / 2**20:.0f}/{tile_cache_budget / 2**20:.0f} MB"
+    )
+
+
+def evict_tiles():
+    global tile_cache_bytes
+    while tile_cache and tile_cache_bytes > tile_cache_budget:
+        (_, tile) = tile_cache.popitem(last=False)
+        tile_cache_bytes -= sum(tile_array.nbytes for tile_array in tile)
+        tile_cache_stats["evictions"] += 1
+
+
+def set_tile_cache_budget(budget):
+    # in bytes, 0 disables the cache
+    global tile_cache_budget
+    tile_cache_budget = budget
+    evict_tiles()
+
+
+def tile_cache_enabled():
+    return tile_cache_budget > 0
+
+
+def caching_enabled():
+    # tiles are looked up in memory or on disk
+    return tile_cache_enabled() or tile_store_open()
+
+
+def clear_tile_cache():
+    global tile_cache_bytes
+    tile_cache.clear()
+    tile_cache_bytes = 0
+
+
+def store_tile(key, tile):
+    global tile_cache_bytes
+    tile_cache[key] = tile
+    tile_cache_bytes += sum(tile_array.nbytes for tile_array in tile)
+    evict_tiles()
+
+
+def grid_position(
+    xcenter: type_math_decimal,
+    ycenter: type_math_decimal,
+    yheight: type_math_float,
+    WINDOW_SIZE,
+    xstart,
+    ystart,
+):
+    # ((x index, x phase), (y index, y phase), pixel size) of the pixel (xstart, ystart)
+    # on the grid of its frame's pixels, indexes grow with x and y like pixels
+    (screenw, screenh) = WINDOW_SIZE
+    pixel_size = yheight / screenh
+    with localcontext(prec=decimal_digits(pixel_size) + 10):
+        step = type_math_decimal(pixel_size)
+        scale = 1 << PHASE_BITS
+        xindex = int(
+            ((xcenter / step + xstart - type_math_decimal(screenw) / 2) * scale).to_integral_value()
+        )
+        yindex = int(
+            ((-ycenter / step + ystart - type_math_decimal(screenh) / 2) * scale).to_integral_value()
+        )
+    return (
+        (xindex >> PHASE_BITS, xindex & (scale - 1)),
+        (yindex >> PHASE_BITS, yindex & (scale - 1)),
+        pixel_size,
+    )
+
+
+def subgrid_range(index, grid_step, tile_start, tile_end):
+    # [start, end) of the n whose grid index + n * grid_step is in [tile_start, tile_end)
+    return -((index - tile_start) // grid_step), -((index - tile_end) // grid_step)
+
+
+def missing_rectangles(missing):
+    # group missing tiles (tx, ty) in rectangles (txstart, txend, tystart, tyend),
+    # runs of a row merge with the same runs of the rows above them
+    rows = {}
+    for tx, ty in sorted(missing, key=lambda tile: (tile[1], tile[0])):
+        runs = rows.setdefault(ty, [])
+        if runs and runs[-1][1] == tx:
+            runs[-1][1] = tx + 1
+        else:
+            runs.append([tx, tx + 1])
+    rectangles = []
+    open_rectangles = {}  # (txstart, txend) -> [tystart, tyend]
+    for ty in sorted(rows):
+        row_runs = {tuple(run) for run in rows[ty]}
+        for run in list(open_rectangles):
+            if run not in row_runs or open_rectangles[run][1] != ty:
+                rectangles.append((*run, *open_rectangles.pop(run)))
+        for run in row_runs:
+            if run in open_rectangles:
+                open_rectangles[run][1] = ty + 1
+            else:
+                open_rectangles[run] = [ty, ty + 1]
+    rectangles.extend((*run, *rows_range) for run, rows_range in open_rectangles.items())
+    return rectangles
+
+
+def new_tile():
+    # niter, z2, der2 and which of their samples are computed
+    return (
+        np_zeros((TILE_SIZE, TILE_SIZE), dtype=type_math_int),
+        np_zeros((TILE_SIZE, TILE_SIZE), dtype=type_math_float),
+        np_zeros((TILE_SIZE, TILE_SIZE), dtype=type_math_float),
+        np_zeros((TILE_SIZE, TILE_SIZE), dtype=np_bool_),
+    )
+
+
+def cached_subgrid(subgrid_size, grid_step, position, params_key, compute_region):
+    # (niter, z2, der2) of a sub-grid, every grid_step pixels from position, from the tiles
+    # of its frame's pixels, the ones missing samples of the sub-grid are computed by
+    # compute_region(istart, iend, jstart, jend), in samples relative to the sub-grid's first
+    ((xindex, xphase), (yindex, yphase), pixel_size) = position
+    (subgrid_w, subgrid_h) = subgrid_size
+    grid_key = (params_key, pixel_size, xphase, yphase)
+
+    def tile_slices(tx, ty, istart, iend, jstart, jend):
+        # slices of the samples [istart, iend) x [jstart, jend) of the sub-grid in the tile,
+        # relative to (istart, jstart), and of the same samples in the tile
+        (i0, i1) = subgrid_range(xindex, grid_step, tx * TILE_SIZE, (tx + 1) * TILE_SIZE)
+        (j0, j1) = subgrid_range(yindex, grid_step, ty * TILE_SIZE, (ty + 1) * TILE_SIZE)
+        (i0, i1) = (max(i0, istart), min(i1, iend))
+        (j0, j1) = (max(j0, jstart), min(j1, jend))
+        tile_x = xindex + i0 * grid_step - tx * TILE_SIZE
+        tile_y = yindex + j0 * grid_step - ty * TILE_SIZE
+        return (
+            (slice(i0 - istart, i1 - istart), slice(j0 - jstart, j1 - jstart)),
+            (
+                slice(tile_x, tile_x + (i1 - i0) * grid_step, grid_step),
+                slice(tile_y, tile_y + (j1 - j0) * grid_step, grid_step),
+            ),
+        )
+
+    refresh_tile_store()
+    tiles = {}
+    missing = []
+    for ty in range(yindex // TILE_SIZE, (yindex + (subgrid_h - 1) * grid_step) // TILE_SIZE + 1):
+        for tx in range(xindex // TILE_SIZE, (xindex + (subgrid_w - 1) * grid_step) // TILE_SIZE + 1):
+            key = (grid_key, tx, ty)
+            (_, tile_slice) = tile_slices(tx, ty, 0, subgrid_w, 0, subgrid_h)
+            if key in tile_cache:
+                tile_cache.move_to_end(key)
+                tile = tile_cache[key]
+            else:
+                tile = stored_tile(grid_key, tx, ty)
+                if tile is not None and tile[3][tile_slice].all():
+                    # memmap views are only read, the memory cache keeps its own tiles
+                    tiles[(tx, ty)] = tile
+                    continue
+                tile = new_tile() if tile is None else tuple(tile_array.copy() for tile_array in tile)
+                if tile_cache_enabled():
+                    store_tile(key, tile)
+            tiles[(tx, ty)] = tile
+            if not tile[3][tile_slice].all():
+                missing.append((tx, ty))
+    tile_cache_stats["hits"] += len(tiles) - len(missing)
+    tile_cache_stats["misses"] += len(missing)
+    instrumentation.count("tile_cache.hits", len(tiles) - len(missing))
+    instrumentation.count("tile_cache.misses", len(missing))
+    # the sub-grid's samples of whole tiles are computed, next frames find them past this one's border
+    for txstart, txend, tystart, tyend in missing_rectangles(missing):
+        (istart, iend) = subgrid_range(xindex, grid_step, txstart * TILE_SIZE, txend * TILE_SIZE)
+        (jstart, jend) = subgrid_range(yindex, grid_step, tystart * TILE_SIZE, tyend * TILE_SIZE)
+        region = compute_region(istart, iend, jstart, jend)
+        for ty in range(tystart, tyend):
+            for tx in range(txstart, txend):
+                (region_slice, tile_slice) = tile_slices(tx, ty, istart, iend, jstart, jend)
+                tile = tiles[(tx, ty)]
+                for tile_array, region_array in zip(tile, region):
+                    tile_array[tile_slice] = region_array[region_slice]
+                tile[3][tile_slice] = True
+    subgrid = (
+        np_empty(subgrid_size, dtype=type_math_int),
+        np_empty(subgrid_size, dtype=type_math_float),
+        np_empty(subgrid_size, dtype=type_math_float),
+    )
+    for (tx, ty), tile in tiles.items():
+        (subgrid_slice, tile_slice) = tile_slices(tx, ty, 0, subgrid_w, 0, subgrid_h)
+        for subgrid_array, tile_array in zip(subgrid, tile):
+            subgrid_array[subgrid_slice] = tile_array[tile_slice]
+    # after the sub-grid is assembled, a write can reuse the slot of a tile read from the store
+    for tx, ty in missing:
+        write_tile(grid_key, tx, ty, tiles[(tx, ty)])
+    flush_tile_store()
+    return subgrid
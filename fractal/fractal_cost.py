@@ -0,0 +1,170 @@
+# Frame cost: iterations executed to compute a frame, split by how their iteration loop
+# stopped, escaped, epsilon (the derivative vanished, an attracting cycle) or interior
+# (max_iterations, or an interior check). compute_fractal counts what its backends iterate:
+# pixels reused from the previous frame or read from the tile cache aren't counted, nor the
+# pixels the subdivide backend fills or the iterations the series approximation skips.
+# Interior pixels report max_iterations: the ones the cardioid and bulb test stops count no
+# iterations, the periodicity check stops the others at an iteration they don't keep, with it
+# the interior count is an upper bound.
+# The histogram and the cost heatmap show the iterations of each pixel (its niter) on a log scale.
+from enum import IntEnum
+from numpy import (
+    zeros as np_zeros,
+    log1p as np_log1p,
+    clip as np_clip,
+    rint as np_rint,
+    bincount as np_bincount,
+    frexp as np_frexp,
+    minimum as np_minimum,
+    maximum as np_maximum,
+    arange as np_arange,
+    int64 as np_int64,
+    uint8 as np_uint8,
+    uint32 as np_uint32,
+)
+from utils import instrumentation
+from fractal.fractal_math import Fractal_Mode, Interior_Check
+
+
+class Pixel_Exit(IntEnum):
+    ESCAPED = 0
+    EPSILON = 1
+    INTERIOR = 2
+
+
+# histogram buckets of iterations: 0, 1, 2-3, 4-7... up to 2^31
+COST_HISTOGRAM_BUCKETS = 33
+
+# Session state: iterations executed by exit since reset_executed_iterations, a frame's
+# levels and tiles add up
+executed_iterations = np_zeros(len(Pixel_Exit), dtype=np_int64)
+# whether interior pixels the periodicity check stopped are in them
+executed_upper_bound = False
+# pixels and iterations of the last frame, by exit and in power of 2 buckets
+last_frame_cost_stats = {}
+
+
+def format_frame_cost_stats(frame_cost_stats):
+    iterations = frame_cost_stats["iterations"]
+    exits = " | ".join(
+        f"{name.lower()} {exit_stats['pixels'] / max(1, frame_cost_stats['pixels']):.0%}"
+        f" px {exit_stats['iterations'] / max(1, iterations):.0%} it"
+        for name, exit_stats in frame_cost_stats["exits"].items()
+    )
+    return (
+        f"Cost: {'<=' if frame_cost_stats['upper_bound'] else ''}{iterations / 1e6:.1f} M iterations executed"
+        f" {iterations / max(1, frame_cost_stats['pixels']):.0f}/pixel"
+        f" ({frame_cost_stats['pixel_iterations'] / 1e6:.1f} M in the pixels' niter) | {exits}"
+    )
+
+
+def format_cost_histogram(frame_cost_stats):
+    # non empty buckets, "<lowest iteration count>+: pixels"
+    return " ".join(
+        f"{0 if bucket == 0 else 1 << (bucket - 1)}+:{pixels}"
+        for bucket, pixels in enumerate(frame_cost_stats["histogram"])
+        if pixels > 0
+    )
+
+
+def pixel_exits(host_array_niter, host_array_z2, max_iterations, escape_radius):
+    # Pixel_Exit of each pixel, from the loop condition of fractal_xy
+    exits = np_zeros(host_array_niter.shape, dtype=np_uint8)
+    escaped = host_array_z2 >= escape_radius
+    exits[~escaped & (host_array_niter < max_iterations)] = Pixel_Exit.EPSILON
+    exits[~escaped & (host_array_niter >= max_iterations)] = Pixel_Exit.INTERIOR
+    return exits
+
+
+def reset_executed_iterations():
+    # at the start of a frame
+    global executed_upper_bound
+    executed_iterations[:] = 0
+    executed_upper_bound = False
+
+
+def interior_stops(
+    WINDOW_SIZE,
+    xmax,
+    xmin,
+    ymin,
+    ymax,
+    fractalmode,
+    power,
+    escape_radius,
+    epsilon,
+    interior_check,
+):
+    # (pixels the cardioid and bulb test stops before iterating or None, whether the
+    # periodicity check runs), same conditions as fractal_xy
+    if epsilon != 0 or escape_radius < 4:
+        return None, False
+    periodicity = bool(interior_check & Interior_Check.PERIODICITY)
+    if not (interior_check & Interior_Check.CARDIOID and fractalmode == Fractal_Mode.MANDELBROT and power == 2):
+        return None, periodicity
+    (screenw, screenh) = WINDOW_SIZE
+    x = xmin + np_arange(screenw)[:, None] * (abs(xmax - xmin) / screenw)
+    y = ymax - np_arange(screenh)[None, :] * (abs(ymax - ymin) / screenh)
+    xq = x - 0.25
+    q = xq * xq + y * y
+    return (q * (q + xq) < 0.25 * y * y) | ((x + 1) * (x + 1) + y * y < 0.0625), periodicity
+
+
+def count_executed_iterations(
+    host_array_niter,
+    host_array_z2,
+    max_iterations,
+    escape_radius,
+    skipped=0,
+    iterated=None,
+    cardioid=None,
+    periodicity=False,
+):
+    # pixels a backend computed: skipped iterations each pixel started from, iterated the
+    # mask of the pixels it iterated, None for all of them, cardioid and periodicity from
+    # interior_stops
+    global executed_upper_bound
+    exits = pixel_exits(host_array_niter, host_array_z2, max_iterations, escape_radius)
+    niter = np_maximum(host_array_niter.astype(np_int64) - skipped, 0)
+    if cardioid is not None:
+        niter[cardioid & (exits == Pixel_Exit.INTERIOR)] = 0
+    executed_upper_bound |= periodicity and bool((exits == Pixel_Exit.INTERIOR).any())
+    if iterated is not None:
+        (exits, niter) = (exits[iterated], niter[iterated])
+    iterations = np_bincount(exits.ravel(), weights=niter.ravel(), minlength=len(Pixel_Exit))
+    executed_iterations[:] += iterations.astype(np_int64)
+    instrumentation.count("fractal.iterations", int(iterations.sum()))
+    for exit in Pixel_Exit:
+        instrumentation.count(f"fractal.iterations.{exit.name.lower()}", int(iterations[exit]))
+
+
+def frame_cost(host_array_niter, host_array_z2, max_iterations, escape_radius):
+    # iterations executed since reset_executed_iterations, pixels of the frame by exit
+    global last_frame_cost_stats
+    niter = host_array_niter.ravel()
+    exits = pixel_exits(host_array_niter, host_array_z2, max_iterations, escape_radius).ravel()
+    exit_pixels = np_bincount(exits, minlength=len(Pixel_Exit))
+    # exponent of frexp is the bit length: bucket of 2^(b-1) to 2^b - 1
+    (_, buckets) = np_frexp(niter)
+    last_frame_cost_stats = {
+        "pixels": int(niter.size),
+        "iterations": int(executed_iterations.sum()),
+        "pixel_iterations": int(niter.sum(dtype=np_int64)),
+        "upper_bound": executed_upper_bound,
+        "exits": {
+            exit.name: {"pixels": int(exit_pixels[exit]), "iterations": int(executed_iterations[exit])}
+            for exit in Pixel_Exit
+        },
+        "histogram": np_bincount(np_minimum(buckets, COST_HISTOGRAM_BUCKETS - 1), minlength=COST_HISTOGRAM_BUCKETS).tolist(),
+    }
+    return last_frame_cost_stats
+
+
+def cost_heatmap(host_array_niter, max_iterations):
+    # packed rgb [x, y], black to red to yellow to white as log(niter) goes to log(max_iterations)
+    t = np_log1p(host_array_niter) / np_log1p(max(1, max_iterations))
+    r = np_clip(t * 3, 0, 1)
+    g = np_clip(t * 3 - 1, 0, 1)
+    b = np_clip(t * 3 - 2, 0, 1)
+    (r, g, b) = (np_rint(channel * 255).astype(np_uint32) for channel in (r, g, b))
+    return (r << 16) | (g << 8) | b
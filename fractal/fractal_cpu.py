@@ -1,7 +1,6 @@
 # from timeit import default_timer
 from typing import List
 from numpy import (
-    vectorize as np_vectorize,
     minimum as np_minimum,
     maximum as np_maximum,
 )
@@ -13,7 +12,8 @@ from utils.types import (
     type_color_int,
 )
 from utils.timer import timing_wrapper
-from fractal.fractal_math import fractal_xy, Fractal_Mode
+from fractal.fractal_math import fractal_xy, Fractal_Mode, Interior_Check
+from fractal.fractal_numpy import fractal_numpy
 from fractal.colors import Normalization_Mode, Palette_Mode, color_cpu
 
 
@@ -31,28 +31,15 @@ def fractal_cpu(
     escape_radius: type_math_int,
     epsilon: type_math_float,
     juliaxy: type_math_complex,
+    interior_check: type_enum_int,
 ):
     run_vectorized = True
     if run_vectorized:
-        # vectorized version:
-        vectorized_fractal_xy = np_vectorize(
-            fractal_xy,
-            otypes=[type_math_int, type_math_float, type_math_float],
-        )  # fractal_xy returns nb_iter, z2, der2
-        # vector_x and vector_y need to be same size, and represent all matrix cells:
-        matrix_x = []
-        matrix_y = []
-        for x in range(host_array_niter.shape[0]):
-            vector_x = []
-            vector_y = []
-            for y in range(host_array_niter.shape[1]):
-                vector_x.append(x)
-                vector_y.append(y)
-            matrix_x.append(vector_x)
-            matrix_y.append(vector_y)
-        result_arrays = vectorized_fractal_xy(
-            matrix_x,
-            matrix_y,
+        # vectorized version, iterates all pixels at once:
+        host_array_niter, host_array_z2, host_array_der2 = fractal_numpy(
+            host_array_niter,
+            host_array_z2,
+            host_array_der2,
             topleft,
             xstep,
             ystep,
@@ -62,8 +49,8 @@ def fractal_cpu(
             escape_radius,
             epsilon,
             juliaxy,
+            interior_check,
         )
-        host_array_niter, host_array_z2, host_array_der2 = result_arrays
     else:
         # NON vectorized version:
         for x in range(host_array_niter.shape[0]):
@@ -80,6 +67,7 @@ def fractal_cpu(
                     escape_radius,
                     epsilon,
                     juliaxy,
+                    interior_check,
                 )
                 host_array_niter[x, y] = niter
                 host_array_z2[x, y] = z2
@@ -127,6 +115,7 @@ def compute_fractal_cpu(
     palette_shift: type_math_float,
     recalc_fractal: bool = True,
     recalc_color: bool = False,
+    interior_check: type_enum_int = Interior_Check.NONE,
 ):
     # timerstart = default_timer()
     (screenw, screenh) = WINDOW_SIZE
@@ -149,6 +138,7 @@ def compute_fractal_cpu(
             escape_radius,
             epsilon,
             juliaxy,
+            interior_check,
         )
         # compute min/max of niter and z2, so palette step can set k based on min/max niter of current image
         niter_min, niter_max = compute_min_max_cpu(host_array_niter)
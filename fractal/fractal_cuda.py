@@ -22,11 +22,11 @@ from utils.cuda import (
 from utils.timer import timing_wrapper
 
 from fractal.colors import Normalization_Mode, Palette_Mode, color_kernel
-from fractal.fractal_math import fractal_xy, Fractal_Mode
+from fractal.fractal_math import fractal_xy, Fractal_Mode, Interior_Check
 
 
 @cuda_jit(
-    "(int32[:,:], float64[:,:], float64[:,:], complex128, float64, float64, uint8, int32, int32, int32, float64, complex128)"
+    "(int32[:,:], float64[:,:], float64[:,:], complex128, float64, float64, uint8, int32, int32, int32, float64, complex128, uint8)"
 )
 def fractal_kernel(
     device_array_niter,
@@ -41,6 +41,7 @@ def fractal_kernel(
     escape_radius: type_math_int,
     epsilon: type_math_float,
     juliaxy: type_math_complex,
+    interior_check: type_enum_int,
 ) -> None:
     x, y = cuda_grid(2)
     if x < device_array_niter.shape[0] and y < device_array_niter.shape[1]:
@@ -56,6 +57,7 @@ def fractal_kernel(
             escape_radius,
             epsilon,
             juliaxy,
+            interior_check,
         )
         device_array_niter[x, y] = nb_iter
         device_array_z2[x, y] = z2
@@ -113,6 +115,7 @@ def compute_fracta_cuda(
     palette_shift: type_math_float,
     recalc_fractal: bool = True,
     recalc_color: bool = False,
+    interior_check: type_enum_int = Interior_Check.NONE,
 ):
     # timerstart = default_timer()
     (screenw, screenh) = WINDOW_SIZE
@@ -148,6 +151,7 @@ def compute_fracta_cuda(
             escape_radius,
             epsilon,
             juliaxy,
+            interior_check,
         )
         # compute min/max of niter and z2, so palette step can set k based on min/max niter of current image
         niter_min, niter_max = compute_min_max_cuda(device_array_niter)
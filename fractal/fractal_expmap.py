@@ -0,0 +1,199 @@
+# Exponential map: the samples of a zoom on a log-polar strip around its target, angle along
+# the strip and log radius across it, so each scale is computed once whatever the frame count.
+# Angle and log radius steps are equal, samples are square at every radius, one per pixel at
+# the corners of the frames the strip was sized for. Any frame of the zoom is a lookup of its
+# pixels' (angle, log radius) in the strip.
+# Strips are saved in a directory (strip.json, one .npy per field, rows by radius) and reused
+# by re-encodes at other frame counts, frame rates or smaller sizes.
+import os
+import json
+from math import ceil, log, pi, hypot
+from time import perf_counter
+from numpy import (
+    arange as np_arange,
+    exp as np_exp,
+    log as np_log,
+    arctan2 as np_arctan2,
+    rint as np_rint,
+    clip as np_clip,
+    empty as np_empty,
+    errstate as np_errstate,
+    lib as np_lib,
+)
+from utils.types import type_math_int, type_math_float, type_math_complex
+from fractal.fractal_perturbation import fractal_perturbation_points
+
+STRIP_FILE = "strip.json"
+# fields kept for coloring, der2 isn't used by colors
+STRIP_FIELDS = (("niter", type_math_int), ("z2", type_math_float))
+# samples computed together
+STRIP_BAND_PIXELS = 4 * 1024 * 1024
+
+# size, computed or reused, and time of the last strip
+last_strip_stats = {}
+
+
+def format_strip_stats(strip_stats):
+    (angles, rows) = strip_stats["size"]
+    return (
+        f"Exponential map: {angles}x{rows} samples {angles * rows / 1e6:.1f} Mpixels"
+        f" | {'reused' if strip_stats['reused'] else 'computed'} in {strip_stats['time']:.1f}s"
+    )
+
+
+def strip_geometry(WINDOW_SIZE, yheight_start, yheight_end):
+    # (smallest radius, largest radius, angles) covering frames of this size from one height to the other
+    (screenw, screenh) = WINDOW_SIZE
+    corner = hypot(screenw / 2, screenh / 2)
+    angles = ceil(2 * pi * corner)
+    # pixels of a frame are half a pixel or more from its center, but the center one of even sizes
+    rmin = min(yheight_start, yheight_end) / screenh / 2
+    rmax = max(yheight_start, yheight_end) / screenh * corner
+    return rmin, rmax, angles
+
+
+def strip_params(
+    xcenter,
+    ycenter,
+    fractalmode,
+    max_iterations,
+    power,
+    escape_radius,
+    epsilon,
+    juliaxy,
+):
+    # what the samples depend on, as saved in strip.json
+    return {
+        "xcenter": str(xcenter),
+        "ycenter": str(ycenter),
+        "fractal_mode": int(fractalmode),
+        "max_iterations": int(max_iterations),
+        "power": int(power),
+        "escape_radius": int(escape_radius),
+        "epsilon": float(epsilon),
+        "juliaxy": [float(juliaxy.real), float(juliaxy.imag)],
+    }
+
+
+def open_strip(path, params, rmin, rmax, angles):
+    # the saved strip when it has the params, covers the radii and is as fine, or None
+    strip_path = os.path.join(path, STRIP_FILE)
+    if not os.path.exists(strip_path):
+        return None
+    with open(strip_path) as strip_file:
+        strip = json.load(strip_file)
+    step = 2 * pi / strip["angles"]
+    if (
+        strip["params"] != json.loads(json.dumps(params))
+        or strip["angles"] < angles
+        or strip["log_rmin"] > log(rmin) + step / 2
+        or strip["log_rmin"] + (strip["rows"] - 1) * step < log(rmax) - step / 2
+    ):
+        return None
+    for name, _ in STRIP_FIELDS:
+        strip[name] = np_lib.format.open_memmap(os.path.join(path, f"{name}.npy"), mode="r")
+    return strip
+
+
+def exponential_map(
+    path,
+    rmin,
+    rmax,
+    angles,
+    xcenter,
+    ycenter,
+    fractalmode,
+    max_iterations,
+    power,
+    escape_radius,
+    epsilon,
+    juliaxy,
+):
+    # strip of the samples around (xcenter, ycenter) from rmin to rmax, computed in bands of
+    # radii by perturbation around the center, or the saved one when it covers them
+    global last_strip_stats
+    timerstart = perf_counter()
+    params = strip_params(xcenter, ycenter, fractalmode, max_iterations, power, escape_radius, epsilon, juliaxy)
+    strip = open_strip(path, params, rmin, rmax, angles)
+    reused = strip is not None
+    if strip is None:
+        step = 2 * pi / angles
+        log_rmin = log(rmin)
+        rows = ceil((log(rmax) - log_rmin) / step) + 1
+        os.makedirs(path, exist_ok=True)
+        fields = [
+            np_lib.format.open_memmap(os.path.join(path, f"{name}.npy"), mode="w+", dtype=dtype, shape=(rows, angles))
+            for name, dtype in STRIP_FIELDS
+        ]
+        unit = np_exp(1j * step * np_arange(angles))
+        band_rows = max(1, STRIP_BAND_PIXELS // angles)
+        for rowstart in range(0, rows, band_rows):
+            rowend = min(rowstart + band_rows, rows)
+            radius = np_exp(log_rmin + step * np_arange(rowstart, rowend))
+            # [x, y] like frames: angle, radius
+            band_dc = (unit[:, None] * radius[None, :]).astype(type_math_complex)
+            (band_niter, band_z2, _) = fractal_perturbation_points(
+                np_empty(band_dc.shape, dtype=type_math_int),
+                np_empty(band_dc.shape, dtype=type_math_float),
+                np_empty(band_dc.shape, dtype=type_math_float),
+                band_dc,
+                xcenter,
+                ycenter,
+                # samples of the band are at least this far apart
+                radius[0] * step,
+                fractalmode,
+                max_iterations,
+                power,
+                escape_radius,
+                epsilon,
+                juliaxy,
+            )
+            for field, band_array in zip(fields, (band_niter, band_z2)):
+                field[rowstart:rowend] = band_array.T
+        for field in fields:
+            field.flush()
+        strip = {"params": params, "angles": angles, "rows": rows, "log_rmin": log_rmin}
+        # the description last, replaced at once: a strip.json always describes complete files
+        strip_path = os.path.join(path, STRIP_FILE)
+        with open(strip_path + ".tmp", "w") as strip_file:
+            json.dump(strip, strip_file)
+        os.replace(strip_path + ".tmp", strip_path)
+        for (name, _), field in zip(STRIP_FIELDS, fields):
+            strip[name] = field
+    last_strip_stats = {
+        "size": (strip["angles"], strip["rows"]),
+        "reused": reused,
+        "time": perf_counter() - timerstart,
+    }
+    print(format_strip_stats(last_strip_stats))
+    return strip
+
+
+def frame_polar(strip, WINDOW_SIZE):
+    # (log of the distance to the center in pixels, strip angle index) of a frame's pixels,
+    # the same for every frame of a size
+    (screenw, screenh) = WINDOW_SIZE
+    step = 2 * pi / strip["angles"]
+    # same pixel mapping as fractal_xy, around the frame center
+    dx = (np_arange(screenw, dtype=type_math_float) - screenw / 2)[:, None]
+    dy = (screenh / 2 - np_arange(screenh, dtype=type_math_float))[None, :]
+    with np_errstate(divide="ignore"):
+        log_radius = np_log(dx * dx + dy * dy) / 2
+    angle_index = np_rint(np_arctan2(dy, dx) / step).astype(type_math_int) % strip["angles"]
+    return log_radius, angle_index
+
+
+def strip_frame(strip, polar, WINDOW_SIZE, yheight, host_array_niter, host_array_z2):
+    # niter and z2 of the frame of height yheight around the strip's center, nearest samples
+    (log_radius, angle_index) = polar
+    (_, screenh) = WINDOW_SIZE
+    step = 2 * pi / strip["angles"]
+    # the center pixel of even sizes takes the smallest radius
+    row_index = np_clip(
+        np_rint((log_radius + log(yheight / screenh) - strip["log_rmin"]) / step),
+        0,
+        strip["rows"] - 1,
+    ).astype(type_math_int)
+    host_array_niter[:] = strip["niter"][row_index, angle_index]
+    host_array_z2[:] = strip["z2"][row_index, angle_index]
+    return host_array_niter, host_array_z2
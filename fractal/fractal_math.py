@@ -18,8 +18,176 @@ class Fractal_Mode(IntEnum):
     JULIA = 1
 
 
+class Interior_Check(IntEnum):
+    # flags, ALL = CARDIOID | PERIODICITY
+    NONE = 0
+    CARDIOID = 1
+    PERIODICITY = 2
+    ALL = 3
+
+
+# orbit points closer than this (squared distance) are considered a cycle
+PERIODICITY_EPSILON = 1e-24
+
+
+# z**power variants, power is only passed so they all share the signature of zpow
+# products use the numpy complex multiplication formula, so fractal_numpy matches them
+@cuda_jit("complex128(complex128, int32)", device=True)
+def zpow2(z: type_math_complex, power: type_math_int) -> type_math_complex:
+    return complex(z.real * z.real - z.imag * z.imag, 2 * z.real * z.imag)
+
+
+@cuda_jit("complex128(complex128, int32)", device=True)
+def zpow3(z: type_math_complex, power: type_math_int) -> type_math_complex:
+    # z * z**2
+    sr = z.real * z.real - z.imag * z.imag
+    si = 2 * z.real * z.imag
+    return complex(z.real * sr - z.imag * si, z.real * si + z.imag * sr)
+
+
+@cuda_jit("complex128(complex128, int32)", device=True)
+def zpow_n(z: type_math_complex, power: type_math_int) -> type_math_complex:
+    # repeated squaring
+    result: type_math_complex = complex(1, 0)
+    z_pow2k: type_math_complex = z
+    mask = 1
+    while True:
+        if power & mask:
+            result = result * z_pow2k
+        mask <<= 1
+        if power < mask:
+            break
+        z_pow2k = z_pow2k * z_pow2k
+    return result
+
+
+@cuda_jit("complex128(complex128, int32)", device=True)
+def zpow(z: type_math_complex, power: type_math_int) -> type_math_complex:
+    # generic, the cpu kernels are compiled with the variant of their power instead
+    if power == 2:
+        return zpow2(z, power)
+    if power == 3:
+        return zpow3(z, power)
+    return zpow_n(z, power)
+
+
+# orbit loop variants, with the signature of orbit: iterate z from the pixel until it
+# escapes, reaches max_iterations or the derivative vanishes, (nb_iter, z2, der2)
+@cuda_jit("(complex128, complex128, int32, int32, int32, float64, uint8)", device=True)
+def orbit_track(
+    z: type_math_complex,
+    c: type_math_complex,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    interior_check: type_enum_int,
+) -> Tuple[type_math_int, type_math_float, type_math_float]:
+    # epsilon > 0: the derivative exit stops attracting cycles
+    nb_iter: type_math_int = type_math_int(0)
+    z2: type_math_float = type_math_float(0)
+    der: type_math_complex = type_math_complex(1 + 0j)
+    der2: type_math_float = type_math_float(1)
+    while nb_iter < max_iterations and z2 < escape_radius and der2 > epsilon:
+        der = der * power * z
+        z = zpow(z, power) + c
+        nb_iter += 1
+        z2 = z.real**2 + z.imag**2
+        der2 = der.real**2 + der.imag**2
+    return nb_iter, z2, der2
+
+
+@cuda_jit("(complex128, complex128, int32, int32, int32, float64, uint8)", device=True)
+def orbit_skip(
+    z: type_math_complex,
+    c: type_math_complex,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    interior_check: type_enum_int,
+) -> Tuple[type_math_int, type_math_float, type_math_float]:
+    # epsilon 0: the derivative exit can't happen, der2 stays 1
+    nb_iter: type_math_int = type_math_int(0)
+    z2: type_math_float = type_math_float(0)
+    while nb_iter < max_iterations and z2 < escape_radius:
+        z = zpow(z, power) + c
+        nb_iter += 1
+        z2 = z.real**2 + z.imag**2
+    return nb_iter, z2, type_math_float(1)
+
+
+@cuda_jit("(complex128, complex128, int32, int32, int32, float64, uint8)", device=True)
+def orbit_periodic(
+    z: type_math_complex,
+    c: type_math_complex,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    interior_check: type_enum_int,
+) -> Tuple[type_math_int, type_math_float, type_math_float]:
+    # epsilon 0 and the periodicity check, a cycle reports max_iterations
+    # Brent: compare z with a saved orbit point, saved again at power of two intervals
+    nb_iter: type_math_int = type_math_int(0)
+    z2: type_math_float = type_math_float(0)
+    z_saved: type_math_complex = z
+    period: type_math_int = type_math_int(1)
+    period_steps: type_math_int = type_math_int(0)
+    while nb_iter < max_iterations and z2 < escape_radius:
+        z = zpow(z, power) + c
+        nb_iter += 1
+        z2 = z.real**2 + z.imag**2
+        if z2 < escape_radius:
+            dz = z - z_saved
+            if dz.real * dz.real + dz.imag * dz.imag < PERIODICITY_EPSILON:
+                return max_iterations, z2, type_math_float(1)
+            period_steps += 1
+            if period_steps == period:
+                z_saved = z
+                period *= 2
+                period_steps = 0
+    return nb_iter, z2, type_math_float(1)
+
+
+@cuda_jit("(complex128, complex128, int32, int32, int32, float64, uint8)", device=True)
+def orbit(
+    z: type_math_complex,
+    c: type_math_complex,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    interior_check: type_enum_int,
+) -> Tuple[type_math_int, type_math_float, type_math_float]:
+    # generic, the cpu kernels are compiled with the variant of their frame instead
+    if epsilon != 0:
+        return orbit_track(z, c, max_iterations, power, escape_radius, epsilon, interior_check)
+    if escape_radius >= 4 and interior_check & Interior_Check.PERIODICITY:
+        return orbit_periodic(z, c, max_iterations, power, escape_radius, epsilon, interior_check)
+    return orbit_skip(z, c, max_iterations, power, escape_radius, epsilon, interior_check)
+
+
+def zpow_variant(power: type_math_int):
+    # z**power device function of a power, selected once per frame
+    if power == 2:
+        return zpow2
+    if power == 3:
+        return zpow3
+    return zpow_n
+
+
+def orbit_variant(epsilon: type_math_float, escape_radius: type_math_int, interior_check: type_enum_int):
+    # same choice as orbit, once per frame
+    if epsilon != 0:
+        return orbit_track
+    if escape_radius >= 4 and interior_check & Interior_Check.PERIODICITY:
+        return orbit_periodic
+    return orbit_skip
+
+
 @cuda_jit(
-    "(int32, int32, complex128, float64, float64, uint8, int32, int32, int32, float64, complex128)",
+    "(int32, int32, complex128, float64, float64, uint8, int32, int32, int32, float64, complex128, uint8)",
     device=True,
 )
 def fractal_xy(
@@ -34,21 +202,30 @@ def fractal_xy(
     escape_radius: type_math_int,
     epsilon: type_math_float,
     juliaxy: type_math_complex,
+    interior_check: type_enum_int,
 ) -> Tuple[type_math_int, type_math_float, type_math_float]:
     z: type_math_complex = type_math_complex(
         topleft + type_math_float(x) * xstep - 1j * y * ystep
     )
     c: type_math_complex = z if fractalmode == Fractal_Mode.MANDELBROT else juliaxy
-    nb_iter: type_math_int = type_math_int(0)
-    z2: type_math_float = type_math_float(0)
-    der: type_math_complex = type_math_complex(1 + 0j)
-    der2: type_math_float = type_math_float(1)
-    while nb_iter < max_iterations and z2 < escape_radius and der2 > epsilon:
-        der = der * power * z
-        z = z**power + c
-        nb_iter += 1
-        z2 = z.real**2 + z.imag**2
-        der2 = der.real**2 + der.imag**2
-    return nb_iter, z2, der2
+    # Interior checks report interior points as reaching max_iterations.
+    # Only when epsilon is 0: otherwise the derivative exit already stops them, with its own niter.
+    # Escape radius must be at least 4 (|z|=2), or points of the set can still escape.
+    # The periodicity check is in the orbit loop of these frames.
+    check_interior = epsilon == 0 and escape_radius >= 4
+    if (
+        check_interior
+        and interior_check & Interior_Check.CARDIOID
+        and fractalmode == Fractal_Mode.MANDELBROT
+        and power == 2
+    ):
+        # main cardioid and period-2 bulb
+        xq = c.real - 0.25
+        q = xq * xq + c.imag * c.imag
+        if q * (q + xq) < 0.25 * c.imag * c.imag:
+            return max_iterations, type_math_float(0), type_math_float(1)
+        if (c.real + 1) * (c.real + 1) + c.imag * c.imag < 0.0625:
+            return max_iterations, type_math_float(0), type_math_float(1)
+    return orbit(z, c, max_iterations, power, escape_radius, epsilon, interior_check)
 
 
@@ -0,0 +1,502 @@
+# from timeit import default_timer
+from typing import List
+from numpy import array as np_array
+from utils.types import (
+    type_math_int,
+    type_math_float,
+    type_math_complex,
+    type_enum_int,
+    type_color_int,
+)
+from utils.numba_cpu import (
+    cpu_jit,
+    cpu_prange,
+    cpu_device,
+    cpu_rebind,
+    numba_available,
+)
+from utils.timer import timing_wrapper
+from fractal.fractal_math import (
+    fractal_xy,
+    zpow_variant,
+    orbit_variant,
+    Fractal_Mode,
+    Interior_Check,
+)
+from fractal.fractal_numpy import fractal_numpy, fractal_numpy_points
+from fractal.fractal_cpu import compute_min_max_cpu
+from fractal.colors import (
+    Normalization_Mode,
+    Palette_Mode,
+    color_xy,
+    hsv_to_rgb,
+    rgb_to_packed,
+    get_palette_color,
+)
+
+# cpu compiled versions of the cuda device functions
+rgb_to_packed_cpu = cpu_device(rgb_to_packed)
+hsv_to_rgb_cpu = cpu_device(hsv_to_rgb, rgb_to_packed=rgb_to_packed_cpu)
+get_palette_color_cpu = cpu_device(get_palette_color)
+color_xy_cpu = cpu_device(
+    color_xy,
+    rgb_to_packed=rgb_to_packed_cpu,
+    hsv_to_rgb=hsv_to_rgb_cpu,
+    get_palette_color=get_palette_color_cpu,
+)
+
+# Session state: fractal kernels compiled per (z**power, orbit loop) variant, when a frame first needs it
+fractal_kernels = {}
+
+
+def fractal_variant(
+    power: type_math_int,
+    epsilon: type_math_float,
+    escape_radius: type_math_int,
+    interior_check: type_enum_int,
+):
+    # (key, name) of the kernel variant of a frame, the name tells compiled kernels apart
+    zpow_device = zpow_variant(power)
+    orbit_device = orbit_variant(epsilon, escape_radius, interior_check)
+    variant = "_".join(
+        getattr(device, "py_func", device).__name__ for device in (zpow_device, orbit_device)
+    )
+    return (zpow_device, orbit_device), variant
+
+
+def get_fractal_kernels(
+    power: type_math_int,
+    epsilon: type_math_float,
+    escape_radius: type_math_int,
+    interior_check: type_enum_int,
+):
+    # (frame kernel, tile kernel, points kernel) with the power, derivative and periodicity
+    # branches out of the loop
+    (key, variant) = fractal_variant(power, epsilon, escape_radius, interior_check)
+    if key not in fractal_kernels:
+        (zpow_device, orbit_device) = key
+        fractal_xy_cpu = cpu_device(
+            fractal_xy,
+            variant,
+            orbit=cpu_device(orbit_device, variant, zpow=cpu_device(zpow_device)),
+        )
+        fractal_kernels[key] = (
+            cpu_jit(parallel=True, nogil=True, cache=True)(
+                cpu_rebind(fractal_kernel_numba, variant, fractal_xy_cpu=fractal_xy_cpu)
+            ),
+            cpu_jit(nogil=True, cache=True)(
+                cpu_rebind(
+                    fractal_tile_kernel_numba, variant, fractal_xy_cpu=fractal_xy_cpu
+                )
+            ),
+            cpu_jit(parallel=True, nogil=True, cache=True)(
+                cpu_rebind(
+                    fractal_points_kernel_numba, variant, fractal_xy_cpu=fractal_xy_cpu
+                )
+            ),
+        )
+    return fractal_kernels[key]
+
+
+# kernel templates, compiled by get_fractal_kernels with the fractal_xy_cpu of a variant
+def fractal_kernel_numba(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    topleft: type_math_complex,
+    xstep: type_math_float,
+    ystep: type_math_float,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    interior_check: type_enum_int,
+) -> None:
+    # one row (x) per thread
+    for x in cpu_prange(host_array_niter.shape[0]):
+        for y in range(host_array_niter.shape[1]):
+            nb_iter, z2, der2 = fractal_xy_cpu(
+                x,
+                y,
+                topleft,
+                xstep,
+                ystep,
+                fractalmode,
+                max_iterations,
+                power,
+                escape_radius,
+                epsilon,
+                juliaxy,
+                interior_check,
+            )
+            host_array_niter[x, y] = nb_iter
+            host_array_z2[x, y] = z2
+            host_array_der2[x, y] = der2
+
+
+def fractal_tile_kernel_numba(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    topleft: type_math_complex,
+    xstep: type_math_float,
+    ystep: type_math_float,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    interior_check: type_enum_int,
+    xstart: type_math_int,
+    xend: type_math_int,
+    ystart: type_math_int,
+    yend: type_math_int,
+) -> None:
+    # single threaded, releases the gil so tiles can run on a thread pool
+    for x in range(xstart, xend):
+        for y in range(ystart, yend):
+            nb_iter, z2, der2 = fractal_xy_cpu(
+                x,
+                y,
+                topleft,
+                xstep,
+                ystep,
+                fractalmode,
+                max_iterations,
+                power,
+                escape_radius,
+                epsilon,
+                juliaxy,
+                interior_check,
+            )
+            host_array_niter[x, y] = nb_iter
+            host_array_z2[x, y] = z2
+            host_array_der2[x, y] = der2
+
+
+def fractal_points_kernel_numba(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    host_array_c,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    interior_check: type_enum_int,
+) -> None:
+    # points anywhere, not on the pixel grid: each is the topleft of a zero step grid
+    for x in cpu_prange(host_array_niter.shape[0]):
+        for y in range(host_array_niter.shape[1]):
+            nb_iter, z2, der2 = fractal_xy_cpu(
+                0,
+                0,
+                host_array_c[x, y],
+                0.0,
+                0.0,
+                fractalmode,
+                max_iterations,
+                power,
+                escape_radius,
+                epsilon,
+                juliaxy,
+                interior_check,
+            )
+            host_array_niter[x, y] = nb_iter
+            host_array_z2[x, y] = z2
+            host_array_der2[x, y] = der2
+
+
+def fractal_tile_cpu(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    params,
+    tile,
+) -> None:
+    # compute one (xstart, xend, ystart, yend) rectangle in place, params are the casted
+    # topleft..interior_check scalars of fractal_tile_kernel_numba
+    (xstart, xend, ystart, yend) = tile
+    if numba_available():
+        (_, tile_kernel, _) = get_fractal_kernels(params[5], params[7], params[6], params[9])
+        tile_kernel(host_array_niter, host_array_z2, host_array_der2, *params, *tile)
+    else:  # numpy releases the gil inside its array operations
+        fractal_numpy(
+            host_array_niter[xstart:xend, ystart:yend],
+            host_array_z2[xstart:xend, ystart:yend],
+            host_array_der2[xstart:xend, ystart:yend],
+            *params,
+            xstart,
+            ystart,
+        )
+
+
+def fractal_points_cpu(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    host_array_c,
+    fractalmode: Fractal_Mode,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    interior_check: type_enum_int,
+):
+    # fractal_xy on the points of host_array_c [x, y], like pixels of a frame at these coordinates
+    params = (
+        type_enum_int(fractalmode),
+        type_math_int(max_iterations),
+        type_math_int(power),
+        type_math_int(escape_radius),
+        type_math_float(epsilon),
+        type_math_complex(juliaxy),
+        type_enum_int(interior_check),
+    )
+    if numba_available():
+        (_, _, points_kernel) = get_fractal_kernels(power, epsilon, escape_radius, interior_check)
+        points_kernel(host_array_niter, host_array_z2, host_array_der2, host_array_c, *params)
+    else:
+        fractal_numpy_points(
+            host_array_niter,
+            host_array_z2,
+            host_array_der2,
+            host_array_c.real.ravel(),
+            host_array_c.imag.ravel(),
+            *params,
+        )
+    return host_array_niter, host_array_z2, host_array_der2
+
+
+@cpu_jit(parallel=True, nogil=True, cache=True)
+def color_kernel_numba(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    host_array_k,
+    host_array_rgb,
+    niter_min: type_math_int,
+    niter_max: type_math_int,
+    z2_min: type_math_float,
+    z2_max: type_math_float,
+    der2_min: type_math_float,
+    der2_max: type_math_float,
+    max_iterations: type_math_int,
+    escape_radius: type_math_int,
+    normalization_mode: type_enum_int,
+    palette_mode: type_enum_int,
+    custom_palette: List[type_color_int],
+    palette_width: type_math_float,
+    palette_shift: type_math_float,
+) -> None:
+    # one row (x) per thread
+    for x in cpu_prange(host_array_niter.shape[0]):
+        for y in range(host_array_niter.shape[1]):
+            k, packedrgb = color_xy_cpu(
+                x,
+                y,
+                host_array_niter[x, y],
+                niter_min,
+                niter_max,
+                max_iterations,
+                host_array_z2[x, y],
+                z2_min,
+                z2_max,
+                escape_radius,
+                host_array_der2[x, y],
+                der2_min,
+                der2_max,
+                normalization_mode,
+                palette_mode,
+                custom_palette,
+                palette_width,
+                palette_shift,
+            )
+            host_array_k[x, y] = k
+            host_array_rgb[x, y] = packedrgb
+
+
+@timing_wrapper
+def fractal_numba(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    topleft: type_math_complex,
+    xstep: type_math_float,
+    ystep: type_math_float,
+    fractalmode: Fractal_Mode,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    interior_check: type_enum_int,
+):
+    # cast scalars so the kernel is compiled once, whatever python types the ui passes
+    (fractal_kernel, _, _) = get_fractal_kernels(power, epsilon, escape_radius, interior_check)
+    fractal_kernel(
+        host_array_niter,
+        host_array_z2,
+        host_array_der2,
+        type_math_complex(topleft),
+        type_math_float(xstep),
+        type_math_float(ystep),
+        type_enum_int(fractalmode),
+        type_math_int(max_iterations),
+        type_math_int(power),
+        type_math_int(escape_radius),
+        type_math_float(epsilon),
+        type_math_complex(juliaxy),
+        type_enum_int(interior_check),
+    )
+    return host_array_niter, host_array_z2, host_array_der2
+
+
+@timing_wrapper
+def color_numba(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    host_array_k,
+    host_array_rgb,
+    niter_min: type_math_int,
+    niter_max: type_math_int,
+    z2_min: type_math_float,
+    z2_max: type_math_float,
+    der2_min: type_math_float,
+    der2_max: type_math_float,
+    max_iterations: type_math_int,
+    escape_radius: type_math_int,
+    normalization_mode: type_enum_int,
+    palette_mode: type_enum_int,
+    custom_palette: List[type_color_int],
+    palette_width: type_math_float,
+    palette_shift: type_math_float,
+):
+    # cast scalars so the kernels are compiled once, whatever python types the ui passes
+    color_kernel_numba(
+        host_array_niter,
+        host_array_z2,
+        host_array_der2,
+        host_array_k,
+        host_array_rgb,
+        type_math_int(niter_min),
+        type_math_int(niter_max),
+        type_math_float(z2_min),
+        type_math_float(z2_max),
+        type_math_float(der2_min),
+        type_math_float(der2_max),
+        type_math_int(max_iterations),
+        type_math_int(escape_radius),
+        type_enum_int(normalization_mode),
+        type_enum_int(palette_mode),
+        np_array(custom_palette, dtype=type_color_int),
+        type_math_float(palette_width),
+        type_math_float(palette_shift),
+    )
+    return host_array_k, host_array_rgb
+
+
+# TODO read stuff from AppState
+@timing_wrapper
+def compute_fractal_numba(
+    host_array_niter,
+    niter_min,
+    niter_max,
+    host_array_z2,
+    z2_min,
+    z2_max,
+    host_array_der2,
+    der2_min,
+    der2_max,
+    host_array_k,
+    host_array_rgb,
+    WINDOW_SIZE,
+    xmax: type_math_float,
+    xmin: type_math_float,
+    ymin: type_math_float,
+    ymax: type_math_float,
+    fractalmode: Fractal_Mode,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    normalization_mode: Normalization_Mode,
+    palette_mode: Palette_Mode,
+    custom_palette: List[type_color_int],
+    palette_width: type_math_float,
+    palette_shift: type_math_float,
+    recalc_fractal: bool = True,
+    recalc_color: bool = False,
+    interior_check: type_enum_int = Interior_Check.NONE,
+):
+    # timerstart = default_timer()
+    (screenw, screenh) = WINDOW_SIZE
+    xstep = abs(xmax - xmin) / screenw
+    ystep = abs(ymax - ymin) / screenh
+    topleft = type_math_complex(xmin + 1j * ymax)
+
+    if recalc_fractal:
+        host_array_niter, host_array_z2, host_array_der2 = fractal_numba(
+            host_array_niter,
+            host_array_z2,
+            host_array_der2,
+            topleft,
+            xstep,
+            ystep,
+            fractalmode,
+            max_iterations,
+            power,
+            escape_radius,
+            epsilon,
+            juliaxy,
+            interior_check,
+        )
+        # compute min/max of niter and z2, so palette step can set k based on min/max niter of current image
+        niter_min, niter_max = compute_min_max_cpu(host_array_niter)
+        z2_min, z2_max = compute_min_max_cpu(host_array_z2)
+        der2_min, der2_max = compute_min_max_cpu(host_array_der2)
+        # TODO: store niter_min, niter_max, z2_min, z2_max, der2_min, der2_max in AppState
+    if recalc_fractal or recalc_color:
+        # color is calculated with fractal when it's called, but can be called by itself
+        host_array_k, host_array_rgb = color_numba(
+            host_array_niter,
+            host_array_z2,
+            host_array_der2,
+            host_array_k,
+            host_array_rgb,
+            niter_min,
+            niter_max,
+            z2_min,
+            z2_max,
+            der2_min,
+            der2_max,
+            max_iterations,
+            escape_radius,
+            normalization_mode,
+            palette_mode,
+            custom_palette,
+            palette_width,
+            palette_shift,
+        )
+    # TODO store stuff from AppState
+    return (
+        host_array_niter,
+        niter_min,
+        niter_max,
+        host_array_z2,
+        z2_min,
+        z2_max,
+        host_array_der2,
+        der2_min,
+        der2_max,
+        host_array_k,
+        host_array_rgb,
+    )
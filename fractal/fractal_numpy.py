@@ -0,0 +1,224 @@
+# Whole-array escape-time engine: iterates every pixel at once on split real/imag arrays
+# Mirrors fractal_math.fractal_xy operation by operation so niter/z2/der2 match exactly
+from numpy import (
+    arange as np_arange,
+    empty as np_empty,
+    zeros as np_zeros,
+    ones_like as np_ones_like,
+    zeros_like as np_zeros_like,
+    full as np_full,
+    errstate as np_errstate,
+    count_nonzero as np_count_nonzero,
+    flatnonzero as np_flatnonzero,
+    float_power as np_float_power,
+)
+from utils.types import (
+    type_math_int,
+    type_math_float,
+    type_math_complex,
+    type_enum_int,
+)
+from fractal.fractal_math import Fractal_Mode, Interior_Check, PERIODICITY_EPSILON
+
+# Drop finished pixels from the working set once they are this share of it
+COMPACT_RATIO = 0.25
+
+
+def cmul(ar, ai, br, bi):
+    # same formula as numpy complex multiplication, so results are bit-identical
+    return ar * br - ai * bi, ar * bi + ai * br
+
+
+def cpow(zr, zi, power: type_math_int):
+    # same algorithms as the zpow variants of fractal_math
+    if power == 2:
+        return cmul(zr, zi, zr, zi)
+    if power == 3:
+        sr, si = cmul(zr, zi, zr, zi)
+        return cmul(zr, zi, sr, si)
+    # repeated squaring
+    ar, ai = np_ones_like(zr), np_zeros_like(zi)
+    pr, pi = zr, zi
+    mask = 1
+    while True:
+        if power & mask:
+            ar, ai = cmul(ar, ai, pr, pi)
+        mask <<= 1
+        if power < mask:
+            break
+        pr, pi = cmul(pr, pi, pr, pi)
+    return ar, ai
+
+
+def square(x):
+    # fractal_xy squares with x**2 on scalars (libm pow), x*x can differ in the last bit
+    return np_float_power(x, 2)
+
+
+def fractal_numpy(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    topleft: type_math_complex,
+    xstep: type_math_float,
+    ystep: type_math_float,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    interior_check: type_enum_int,
+    xstart: type_math_int = 0,
+    ystart: type_math_int = 0,
+):
+    # host arrays can be a tile of the frame, starting at pixel (xstart, ystart)
+    (screenw, screenh) = host_array_niter.shape
+    # pixel coordinates, flattened in (x, y) C order like the host arrays
+    vector_x = (
+        topleft.real
+        + np_arange(xstart, xstart + screenw, dtype=type_math_float) * xstep
+    )
+    vector_y = (
+        topleft.imag
+        - np_arange(ystart, ystart + screenh, dtype=type_math_float) * ystep
+    )
+    zr = vector_x.repeat(screenh)
+    zi = np_empty(screenw * screenh, dtype=type_math_float)
+    zi.reshape(screenw, screenh)[:] = vector_y
+    return fractal_numpy_points(
+        host_array_niter,
+        host_array_z2,
+        host_array_der2,
+        zr,
+        zi,
+        fractalmode,
+        max_iterations,
+        power,
+        escape_radius,
+        epsilon,
+        juliaxy,
+        interior_check,
+    )
+
+
+def fractal_numpy_points(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    zr,
+    zi,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    interior_check: type_enum_int,
+):
+    # starting points flattened in (x, y) C order like the host arrays
+    (screenw, screenh) = host_array_niter.shape
+    if fractalmode == Fractal_Mode.MANDELBROT:
+        cr, ci = zr.copy(), zi.copy()
+    else:
+        cr = np_full(zr.shape, juliaxy.real, dtype=type_math_float)
+        ci = np_full(zi.shape, juliaxy.imag, dtype=type_math_float)
+    dr = np_ones_like(zr)
+    di = np_zeros_like(zi)
+    z2 = np_zeros_like(zr)
+    der2 = np_ones_like(zr)
+    power_float = type_math_float(power)
+    # epsilon 0: the derivative exit can't happen, der2 stays 1
+    track_derivative = epsilon != 0
+    # outputs, pixels that never iterate keep the initial values
+    flat_niter = np_zeros(zr.shape, dtype=type_math_int)
+    flat_z2 = z2.copy()
+    flat_der2 = der2.copy()
+    # working set: flat index of each pixel still iterated
+    indexes = np_arange(zr.size)
+    running = (z2 < escape_radius) & (der2 > epsilon)
+    # interior checks, same conditions as fractal_xy
+    check_interior = epsilon == 0 and escape_radius >= 4
+    if (
+        check_interior
+        and interior_check & Interior_Check.CARDIOID
+        and fractalmode == Fractal_Mode.MANDELBROT
+        and power == 2
+    ):
+        # main cardioid and period-2 bulb
+        xq = cr - 0.25
+        q = xq * xq + ci * ci
+        interior = (q * (q + xq) < 0.25 * ci * ci) | (
+            (cr + 1) * (cr + 1) + ci * ci < 0.0625
+        )
+        flat_niter[interior] = max_iterations
+        running &= ~interior
+    # Brent: all pixels iterate in lockstep, so they share the period counters
+    check_periodicity = check_interior and interior_check & Interior_Check.PERIODICITY
+    zr_saved, zi_saved = zr, zi
+    period = 1
+    period_steps = 0
+    nb_running = np_count_nonzero(running)
+    nb_iter = 0
+    with np_errstate(all="ignore"):
+        while nb_iter < max_iterations and nb_running > 0:
+            if nb_running < (1 - COMPACT_RATIO) * indexes.size:
+                # compact: late iterations only touch pixels still running
+                indexes = indexes[running]
+                zr, zi, cr, ci = zr[running], zi[running], cr[running], ci[running]
+                dr, di, der2 = dr[running], di[running], der2[running]
+                zr_saved, zi_saved = zr_saved[running], zi_saved[running]
+                running = running[running]
+            if track_derivative:
+                # der = der * power * z
+                dr, di = cmul(dr, di, power_float, 0.0)
+                dr, di = cmul(dr, di, zr, zi)
+            # z = z**power + c
+            zr, zi = cpow(zr, zi, power)
+            # not in place: zr can be the saved orbit point
+            zr = zr + cr
+            zi = zi + ci
+            nb_iter += 1
+            z2 = square(zr) + square(zi)
+            if track_derivative:
+                der2 = square(dr) + square(di)
+            if check_periodicity:
+                dzr = zr - zr_saved
+                dzi = zi - zi_saved
+                periodic = (
+                    running
+                    & (z2 < escape_radius)
+                    & (der2 > epsilon)
+                    & (dzr * dzr + dzi * dzi < PERIODICITY_EPSILON)
+                )
+                if periodic.any():
+                    periodic_indexes = indexes[periodic]
+                    flat_niter[periodic_indexes] = max_iterations
+                    flat_z2[periodic_indexes] = z2[periodic]
+                    flat_der2[periodic_indexes] = der2[periodic]
+                    running &= ~periodic
+                    nb_running = np_count_nonzero(running)
+                period_steps += 1
+                if period_steps == period:
+                    zr_saved, zi_saved = zr, zi
+                    period *= 2
+                    period_steps = 0
+            # finished pixels keep iterating until next compaction, but only their first exit is recorded
+            stopped = running & ~((z2 < escape_radius) & (der2 > epsilon))
+            if stopped.any():
+                stopped_indexes = indexes[stopped]
+                flat_niter[stopped_indexes] = nb_iter
+                flat_z2[stopped_indexes] = z2[stopped]
+                flat_der2[stopped_indexes] = der2[stopped]
+                running &= ~stopped
+                nb_running = np_count_nonzero(running)
+        if nb_running > 0:
+            # reached max_iterations
+            still_running = np_flatnonzero(running)
+            flat_niter[indexes[still_running]] = nb_iter
+            flat_z2[indexes[still_running]] = z2[still_running]
+            flat_der2[indexes[still_running]] = der2[still_running]
+    host_array_niter[:] = flat_niter.reshape(screenw, screenh)
+    host_array_z2[:] = flat_z2.reshape(screenw, screenh)
+    host_array_der2[:] = flat_der2.reshape(screenw, screenh)
+    return host_array_niter, host_array_z2, host_array_der2
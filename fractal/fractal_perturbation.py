@@ -0,0 +1,978 @@
+# Perturbation deep zoom backend: one reference orbit is iterated in integer fixed point, at the
+# precision the zoom needs, then each pixel only iterates its float64 difference to that orbit.
+# complex128 pixels collapse into blocks around 1e-13 widths, differences stay exact far below.
+# The series approximation skips the first iterations of all the pixels while the check probes
+# keep their niter: from 1e-8 on views away from the boundary (seahorse valley skips 300 to 1000
+# iterations down to 1e-14), while views covered with boundary filaments like elephant valley
+# only skip a few iterations above about 1e-14, their probes' niter change as soon as they do.
+from decimal import localcontext
+from fractions import Fraction
+from math import ceil, log2, log10
+from typing import List
+from numpy import (
+    abs as np_abs,
+    arange as np_arange,
+    array as np_array,
+    convolve as np_convolve,
+    linspace as np_linspace,
+    zeros as np_zeros,
+    ones as np_ones,
+    full as np_full,
+    where as np_where,
+    errstate as np_errstate,
+    count_nonzero as np_count_nonzero,
+    flatnonzero as np_flatnonzero,
+    repeat as np_repeat,
+    tile as np_tile,
+)
+from utils.types import (
+    type_math_int,
+    type_math_float,
+    type_math_complex,
+    type_math_decimal,
+    type_enum_int,
+    type_color_int,
+)
+from utils.numba_cpu import cpu_jit, cpu_prange, numba_available
+from utils import instrumentation
+from utils.timer import timing_wrapper
+from fractal.fractal_math import Fractal_Mode, Interior_Check
+from fractal.fractal_numpy import COMPACT_RATIO
+from fractal.fractal_cpu import compute_min_max_cpu
+from fractal.colors import Normalization_Mode, Palette_Mode, color_cpu
+
+# auto backend switches to perturbation below this height, plain float64 is faster above
+DEEP_ZOOM_HEIGHT = 1e-10
+# precision kept beyond the pixel size, for the reference orbit (bits) and centers (digits)
+GUARD_BITS = 64
+GUARD_DIGITS = 20
+# the reference is reused while the frame center stays this many heights away from it
+REFERENCE_REUSE_HEIGHTS = 4
+# series approximation: terms of the polynomial in the pixel offset (0 disables it),
+# probes per frame side whose error is checked at each step, error allowed at the probes,
+# as a share of a pixel, probes per side whose niter must match without the series, and the
+# share of them that may not: one of 576, they change with any rounding near the boundary
+SERIES_TERMS = 8
+SERIES_PROBES = 8
+SERIES_TOLERANCE = 1e-7
+SERIES_CHECK_PROBES = 24
+SERIES_CHECK_MISMATCHES = 0.002
+
+# Session state: last reference orbit, so pans and progressive levels don't recompute it,
+# and last series approximation, valid for any frame inside the one it was checked on
+reference_cache = None
+series_cache = None
+
+# reference length, precision, skipped iterations and pixel rebases of the last frame
+last_perturbation_stats = {}
+
+
+def decimal_digits(yheight):
+    # significant digits for center coordinates at this zoom
+    return GUARD_DIGITS + max(0, ceil(-log10(yheight)))
+
+
+def to_fixed(value, bits):
+    # exact: Fraction takes floats, Decimals and strings without rounding
+    return round(Fraction(value) * (1 << bits))
+
+
+def fixed_mul(ar, ai, br, bi, bits):
+    return (ar * br - ai * bi) >> bits, (ar * bi + ai * br) >> bits
+
+
+def fixed_pow(zr, zi, power, bits):
+    # binary exponentiation, like fractal_numpy.cpow
+    ar, ai = 1 << bits, 0
+    while power > 0:
+        if power & 1:
+            ar, ai = fixed_mul(ar, ai, zr, zi, bits)
+        power >>= 1
+        if power > 0:
+            zr, zi = fixed_mul(zr, zi, zr, zi, bits)
+    return ar, ai
+
+
+@timing_wrapper
+def reference_orbit(
+    xref: type_math_decimal,
+    yref: type_math_decimal,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    juliaxy: type_math_complex,
+    bits,
+):
+    # orbit of the reference point, rounded to complex128 once it's computed
+    scale = 1 << bits
+    power = int(power)
+    zr, zi = to_fixed(xref, bits), to_fixed(yref, bits)
+    if fractalmode == Fractal_Mode.MANDELBROT:
+        cr, ci = zr, zi
+        # start from the critical point 0, pixels start one step later at c,
+        # and rebase on it when they get closer to 0 than to the reference
+        orbit = [0j]
+    else:
+        cr, ci = to_fixed(juliaxy.real, bits), to_fixed(juliaxy.imag, bits)
+        orbit = []
+    orbit.append(complex(zr / scale, zi / scale))
+    escape_limit = int(escape_radius) << (2 * bits)
+    for _ in range(max_iterations):
+        zr, zi = fixed_pow(zr, zi, power, bits)
+        zr += cr
+        zi += ci
+        orbit.append(complex(zr / scale, zi / scale))
+        if zr * zr + zi * zi >= escape_limit:
+            # pixels that outlive the reference rebase on its start
+            break
+    return np_array(orbit, dtype=type_math_complex)
+
+
+def get_reference(
+    xcenter: type_math_decimal,
+    ycenter: type_math_decimal,
+    yheight: type_math_float,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    juliaxy: type_math_complex,
+    bits,
+):
+    # reference point and orbit for a frame, reused when only the center moved a little
+    global reference_cache
+    key = (fractalmode, max_iterations, power, escape_radius, juliaxy)
+    if reference_cache is not None:
+        (cached_key, cached_bits, xref, yref, orbit) = reference_cache
+        with localcontext(prec=decimal_digits(yheight)):
+            distance = max(abs(xcenter - xref), abs(ycenter - yref))
+        if (
+            cached_key == key
+            and cached_bits >= bits
+            and distance <= REFERENCE_REUSE_HEIGHTS * yheight
+        ):
+            instrumentation.count("perturbation.references_reused")
+            return xref, yref, orbit
+    instrumentation.count("perturbation.references_computed")
+    orbit = reference_orbit(
+        xcenter,
+        ycenter,
+        fractalmode,
+        max_iterations,
+        power,
+        escape_radius,
+        juliaxy,
+        bits,
+    )
+    reference_cache = (key, bits, xcenter, ycenter, orbit)
+    return xcenter, ycenter, orbit
+
+
+def series_mul(a, b):
+    # product of two polynomials (lowest degree first), truncated to their length
+    return np_convolve(a, b)[: a.size]
+
+
+def series_eval(series, u):
+    # horner
+    value = np_zeros(u.shape, dtype=type_math_complex)
+    for coefficient in series[::-1]:
+        value = value * u + coefficient
+    return value
+
+
+@timing_wrapper
+def series_approximation(
+    orbit,
+    probes,
+    step: type_math_float,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+):
+    # dz and der as polynomials of u = dc / radius, iterated along the reference orbit
+    # while they match probes over the frame (border, corners and inside) iterated exactly
+    # returns the iterations all probes can skip, the radius, and the polynomials after
+    # each skipped iteration, so the skip can be backed off
+    radius = np_abs(probes).max()
+    # powers of u at each probe, polynomials are evaluated with a matrix product
+    u_powers = (probes / radius)[:, None] ** np_arange(SERIES_TERMS + 1)
+    terms = np_arange(1, SERIES_TERMS + 1)
+    series = np_zeros(SERIES_TERMS + 1, dtype=type_math_complex)
+    series[1] = radius
+    der_series = np_zeros(SERIES_TERMS + 1, dtype=type_math_complex)
+    der_series[0] = 1
+    dz = probes
+    der = np_ones(probes.shape, dtype=type_math_complex)
+    if fractalmode == Fractal_Mode.MANDELBROT:
+        start = 1
+        dc_series = series.copy()
+        dzc = probes
+    else:
+        start = 0
+        dc_series = np_zeros(SERIES_TERMS + 1, dtype=type_math_complex)
+        dzc = 0
+    orbit_end = orbit.shape[0] - 1
+    skip = 0
+    history = [(series, der_series)]
+    with np_errstate(all="ignore"):
+        while skip < max_iterations and start + skip + 1 < orbit_end:
+            zm = orbit[start + skip]
+            # same step as perturbation_xy, on the probes and on the polynomials
+            z = zm + dz
+            z_series = series.copy()
+            z_series[0] += zm
+            der = der * power * z
+            der_series = series_mul(der_series, z_series) * power
+            t = np_zeros(probes.shape, dtype=type_math_complex) + (power != 0)
+            t_series = np_zeros(SERIES_TERMS + 1, dtype=type_math_complex)
+            t_series[0] = power != 0
+            zj = np_ones(probes.shape, dtype=type_math_complex)
+            zj_series = t_series.copy()
+            for _ in range(1, power):
+                zj = zj * z
+                t = t * zm + zj
+                zj_series = series_mul(zj_series, z_series)
+                t_series = t_series * zm + zj_series
+            dz = dz * t + dzc
+            series = series_mul(series, t_series) + dc_series
+            z = orbit[start + skip + 1] + dz
+            z2 = z.real * z.real + z.imag * z.imag
+            der2 = der.real * der.real + der.imag * der.imag
+            zs = z - orbit[0]
+            # error allowed: the dz shift of moving the pixel by a share of a pixel
+            dz_du = u_powers[:, :-1] @ (series[1:] * terms)
+            valid = (
+                (z2 < escape_radius).all()
+                and (der2 > epsilon).all()
+                and (np_abs(zs) >= np_abs(dz)).all()
+                and (
+                    np_abs(u_powers @ series - dz)
+                    <= SERIES_TOLERANCE * np_abs(dz_du) / radius * step
+                ).all()
+                and (
+                    np_abs(u_powers @ der_series - der) <= SERIES_TOLERANCE * np_abs(der)
+                ).all()
+            )
+            if not valid:
+                break
+            skip += 1
+            history.append((series, der_series))
+    return skip, radius, history
+
+
+def probes_niter(
+    orbit,
+    probes,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    skip,
+    radius,
+    series,
+    der_series,
+):
+    # niter of the probes, starting from the series after skip iterations
+    shape = (probes.size, 1)
+    params = (
+        orbit,
+        probes.reshape(shape).astype(type_math_complex),
+        type_enum_int(fractalmode),
+        type_math_int(max_iterations),
+        type_math_int(power),
+        type_math_int(escape_radius),
+        type_math_float(epsilon),
+        type_math_int(skip),
+        type_math_float(radius),
+        series,
+        der_series,
+    )
+    arrays = (
+        np_zeros(shape, dtype=type_math_int),
+        np_zeros(shape, dtype=type_math_float),
+        np_zeros(shape, dtype=type_math_float),
+    )
+    if numba_available():
+        perturbation_points_kernel_numba(*arrays, *params)
+    else:
+        perturbation_points_numpy(*arrays, *params)
+    return arrays[0]
+
+
+def checked_series(
+    orbit,
+    check_probes,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    skip,
+    radius,
+    history,
+):
+    # the skip is halved until the check probes get the niter they get without the series,
+    # but SERIES_CHECK_MISMATCHES of them: the error bound at the probes doesn't bound it between
+    # them, niter does at the probes, and probes near the boundary change niter with any rounding
+    params = (orbit, check_probes, fractalmode, max_iterations, power, escape_radius, epsilon)
+    exact_niter = probes_niter(*params, 0, 1.0, *history[0])
+    allowed = int(SERIES_CHECK_MISMATCHES * exact_niter.size)
+    while skip > 0:
+        if np_count_nonzero(probes_niter(*params, skip, radius, *history[skip]) != exact_niter) <= allowed:
+            break
+        skip //= 2
+    return skip, radius, history[skip][0], history[skip][1]
+
+
+def get_series(
+    orbit,
+    probes,
+    check_probes,
+    step: type_math_float,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+):
+    # checked on the probes of a frame, it holds for the frames inside it
+    global series_cache
+    key = (fractalmode, max_iterations, power, escape_radius, epsilon)
+    bounds = (
+        probes.real.min(),
+        probes.real.max(),
+        probes.imag.min(),
+        probes.imag.max(),
+    )
+    if series_cache is not None:
+        (cached_orbit, cached_key, cached_bounds, cached_step, series) = series_cache
+        # the probes are one pixel out of the frame, its pixels must be in the checked frame
+        if (
+            cached_orbit is orbit
+            and cached_key == key
+            and cached_step <= step
+            and cached_bounds[0] <= bounds[0] + step
+            and bounds[1] - step <= cached_bounds[1]
+            and cached_bounds[2] <= bounds[2] + step
+            and bounds[3] - step <= cached_bounds[3]
+        ):
+            return series
+    (skip, radius, history) = series_approximation(
+        orbit,
+        probes,
+        step,
+        fractalmode,
+        max_iterations,
+        power,
+        escape_radius,
+        epsilon,
+    )
+    series = checked_series(
+        orbit,
+        check_probes,
+        fractalmode,
+        max_iterations,
+        power,
+        escape_radius,
+        epsilon,
+        skip,
+        radius,
+        history,
+    )
+    series_cache = (orbit, key, bounds, step, series)
+    return series
+
+
+def frame_probes(screenw, screenh, xoffset, yoffset, step, probes=SERIES_PROBES):
+    # offsets to the reference of a probes x probes grid over the frame: corners, border and
+    # inside, one pixel out so the shifted sub-grids of a progressive frame fit in the first one's
+    xs = np_linspace(-1, screenw, probes)
+    ys = np_linspace(-1, screenh, probes)
+    x = np_repeat(xs, probes)
+    y = np_tile(ys, probes)
+    return (xoffset + (x - screenw / 2) * step) + 1j * (yoffset + (screenh / 2 - y) * step)
+
+
+@cpu_jit(nogil=True, cache=True)
+def perturbation_xy(
+    dc: type_math_complex,
+    orbit,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    skip: type_math_int,
+    radius: type_math_float,
+    series,
+    der_series,
+):
+    # fractal_xy on z = orbit[m] + dz, dc is the pixel offset to the reference point
+    orbit_end = orbit.shape[0] - 1
+    if fractalmode == Fractal_Mode.MANDELBROT:
+        m = 1
+        dzc = dc
+    else:
+        m = 0
+        dzc = 0j
+    dz = dc
+    nb_iter = 0
+    z2 = 0.0
+    der = 1 + 0j
+    der2 = 1.0
+    # epsilon 0: the derivative exit can't happen, der2 stays 1 like in fractal_xy
+    track_derivative = epsilon != 0
+    if skip > 0:
+        # start after the iterations the series approximation covers
+        u = dc / radius
+        dz = 0j
+        der = 0j
+        for k in range(series.shape[0] - 1, -1, -1):
+            dz = dz * u + series[k]
+            der = der * u + der_series[k]
+        m += skip
+        nb_iter = skip
+    z = orbit[m] + dz
+    if skip > 0:
+        z2 = z.real * z.real + z.imag * z.imag
+        if track_derivative:
+            der2 = der.real * der.real + der.imag * der.imag
+    rebases = 0
+    while nb_iter < max_iterations and z2 < escape_radius and der2 > epsilon:
+        if track_derivative:
+            der = der * power * z
+        # (Z+dz)**p - Z**p = dz * sum(z**j * Z**(p-1-j)), without the cancellation
+        zm = orbit[m]
+        if power == 2:
+            dz = dz * (zm + z) + dzc
+        else:
+            t = 0j if power == 0 else 1 + 0j
+            zj = 1 + 0j
+            for _ in range(1, power):
+                zj = zj * z
+                t = t * zm + zj
+            dz = dz * t + dzc
+        m += 1
+        z = orbit[m] + dz
+        nb_iter += 1
+        z2 = z.real * z.real + z.imag * z.imag
+        if track_derivative:
+            der2 = der.real * der.real + der.imag * der.imag
+        # glitch: z got closer to the orbit start than to the reference, rebase on it
+        zs = z - orbit[0]
+        if m == orbit_end or (
+            zs.real * zs.real + zs.imag * zs.imag < dz.real * dz.real + dz.imag * dz.imag
+        ):
+            dz = zs
+            m = 0
+            rebases += 1
+    return nb_iter, z2, der2, rebases
+
+
+@cpu_jit(parallel=True, nogil=True, cache=True)
+def perturbation_kernel_numba(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    orbit,
+    xoffset: type_math_float,
+    yoffset: type_math_float,
+    step: type_math_float,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    skip: type_math_int,
+    radius: type_math_float,
+    series,
+    der_series,
+):
+    (screenw, screenh) = host_array_niter.shape
+    rebases = 0
+    # one row (x) per thread
+    for x in cpu_prange(screenw):
+        for y in range(screenh):
+            # same pixel mapping as fractal_xy, around the frame center
+            dc = complex(
+                xoffset + (x - screenw / 2) * step, yoffset + (screenh / 2 - y) * step
+            )
+            nb_iter, z2, der2, pixel_rebases = perturbation_xy(
+                dc,
+                orbit,
+                fractalmode,
+                max_iterations,
+                power,
+                escape_radius,
+                epsilon,
+                skip,
+                radius,
+                series,
+                der_series,
+            )
+            host_array_niter[x, y] = nb_iter
+            host_array_z2[x, y] = z2
+            host_array_der2[x, y] = der2
+            rebases += pixel_rebases
+    return rebases
+
+
+@cpu_jit(parallel=True, nogil=True, cache=True)
+def perturbation_points_kernel_numba(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    orbit,
+    host_array_dc,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    skip: type_math_int,
+    radius: type_math_float,
+    series,
+    der_series,
+):
+    # perturbation_xy on points at any offset to the reference, not only on a pixel grid
+    (screenw, screenh) = host_array_niter.shape
+    rebases = 0
+    # one row (x) per thread
+    for x in cpu_prange(screenw):
+        for y in range(screenh):
+            nb_iter, z2, der2, pixel_rebases = perturbation_xy(
+                host_array_dc[x, y],
+                orbit,
+                fractalmode,
+                max_iterations,
+                power,
+                escape_radius,
+                epsilon,
+                skip,
+                radius,
+                series,
+                der_series,
+            )
+            host_array_niter[x, y] = nb_iter
+            host_array_z2[x, y] = z2
+            host_array_der2[x, y] = der2
+            rebases += pixel_rebases
+    return rebases
+
+
+def perturbation_numpy(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    orbit,
+    xoffset: type_math_float,
+    yoffset: type_math_float,
+    step: type_math_float,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    skip: type_math_int,
+    radius: type_math_float,
+    series,
+    der_series,
+):
+    # perturbation_xy on every pixel at once, compacted like fractal_numpy
+    (screenw, screenh) = host_array_niter.shape
+    dcr = xoffset + (np_arange(screenw, dtype=type_math_float) - screenw / 2) * step
+    dci = yoffset + (screenh / 2 - np_arange(screenh, dtype=type_math_float)) * step
+    return perturbation_points_numpy(
+        host_array_niter,
+        host_array_z2,
+        host_array_der2,
+        orbit,
+        dcr[:, None] + 1j * dci[None, :],
+        fractalmode,
+        max_iterations,
+        power,
+        escape_radius,
+        epsilon,
+        skip,
+        radius,
+        series,
+        der_series,
+    )
+
+
+def perturbation_points_numpy(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    orbit,
+    host_array_dc,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    skip: type_math_int,
+    radius: type_math_float,
+    series,
+    der_series,
+):
+    # perturbation_xy on points at any offset to the reference, host_array_dc [x, y]
+    (screenw, screenh) = host_array_niter.shape
+    dc = host_array_dc.ravel()
+    orbit_end = orbit.shape[0] - 1
+    if fractalmode == Fractal_Mode.MANDELBROT:
+        m = np_full(dc.shape, 1, dtype=type_math_int)
+        dzc = dc
+    else:
+        m = np_zeros(dc.shape, dtype=type_math_int)
+        dzc = np_zeros(dc.shape, dtype=type_math_complex)
+    dz = dc
+    der = np_ones(dc.shape, dtype=type_math_complex)
+    z2 = np_zeros(dc.shape, dtype=type_math_float)
+    der2 = np_ones(dc.shape, dtype=type_math_float)
+    track_derivative = epsilon != 0
+    nb_iter = 0
+    if skip > 0:
+        # start after the iterations the series approximation covers
+        u = dc / radius
+        dz = series_eval(series, u)
+        der = series_eval(der_series, u)
+        m += skip
+        nb_iter = skip
+    z = orbit[m] + dz
+    if skip > 0:
+        z2 = z.real * z.real + z.imag * z.imag
+        if track_derivative:
+            der2 = der.real * der.real + der.imag * der.imag
+    # outputs, pixels that never iterate keep the initial values
+    flat_niter = np_zeros(dc.shape, dtype=type_math_int)
+    flat_z2 = z2.copy()
+    flat_der2 = der2.copy()
+    # working set: flat index of each pixel still iterated
+    indexes = np_arange(dc.size)
+    running = (z2 < escape_radius) & (der2 > epsilon)
+    nb_running = np_count_nonzero(running)
+    rebases = 0
+    with np_errstate(all="ignore"):
+        while nb_iter < max_iterations and nb_running > 0:
+            if nb_running < (1 - COMPACT_RATIO) * indexes.size:
+                # compact: late iterations only touch pixels still running
+                indexes = indexes[running]
+                z, dz, dzc, m, der, der2 = (
+                    z[running],
+                    dz[running],
+                    dzc[running],
+                    m[running],
+                    der[running],
+                    der2[running],
+                )
+                running = running[running]
+            if track_derivative:
+                der = der * power * z
+            # (Z+dz)**p - Z**p = dz * sum(z**j * Z**(p-1-j)), without the cancellation
+            zm = orbit[m]
+            t = np_zeros(z.shape, dtype=type_math_complex) + (power != 0)
+            zj = np_ones(z.shape, dtype=type_math_complex)
+            for _ in range(1, power):
+                zj = zj * z
+                t = t * zm + zj
+            dz = dz * t + dzc
+            m = m + 1
+            z = orbit[m] + dz
+            nb_iter += 1
+            z2 = z.real * z.real + z.imag * z.imag
+            if track_derivative:
+                der2 = der.real * der.real + der.imag * der.imag
+            # glitch: z got closer to the orbit start than to the reference, rebase on it
+            zs = z - orbit[0]
+            rebase = (m == orbit_end) | (
+                zs.real * zs.real + zs.imag * zs.imag
+                < dz.real * dz.real + dz.imag * dz.imag
+            )
+            if rebase.any():
+                dz = np_where(rebase, zs, dz)
+                m = np_where(rebase, 0, m)
+                rebases += np_count_nonzero(rebase & running)
+            # finished pixels keep iterating until next compaction, but only their first exit is recorded
+            stopped = running & ~((z2 < escape_radius) & (der2 > epsilon))
+            if stopped.any():
+                stopped_indexes = indexes[stopped]
+                flat_niter[stopped_indexes] = nb_iter
+                flat_z2[stopped_indexes] = z2[stopped]
+                flat_der2[stopped_indexes] = der2[stopped]
+                running &= ~stopped
+                nb_running = np_count_nonzero(running)
+        if nb_running > 0:
+            # reached max_iterations
+            still_running = np_flatnonzero(running)
+            flat_niter[indexes[still_running]] = nb_iter
+            flat_z2[indexes[still_running]] = z2[still_running]
+            flat_der2[indexes[still_running]] = der2[still_running]
+    host_array_niter[:] = flat_niter.reshape(screenw, screenh)
+    host_array_z2[:] = flat_z2.reshape(screenw, screenh)
+    host_array_der2[:] = flat_der2.reshape(screenw, screenh)
+    return rebases
+
+
+@timing_wrapper
+def fractal_perturbation(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    xcenter: type_math_decimal,
+    ycenter: type_math_decimal,
+    yheight: type_math_float,
+    fractalmode: Fractal_Mode,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+):
+    global last_perturbation_stats
+    (screenw, screenh) = host_array_niter.shape
+    # square pixels, like AppState.recalc_size
+    step = type_math_float(yheight / screenh)
+    bits = GUARD_BITS + max(0, ceil(-log2(step)))
+    xref, yref, orbit = get_reference(
+        xcenter,
+        ycenter,
+        yheight,
+        type_enum_int(fractalmode),
+        type_math_int(max_iterations),
+        type_math_int(power),
+        type_math_int(escape_radius),
+        type_math_complex(juliaxy),
+        bits,
+    )
+    # frame center relative to the reference point, small enough for float64
+    with localcontext(prec=decimal_digits(yheight)):
+        xoffset = type_math_float(xcenter - xref)
+        yoffset = type_math_float(ycenter - yref)
+    if SERIES_TERMS > 0:
+        skip, radius, series, der_series = get_series(
+            orbit,
+            frame_probes(screenw, screenh, xoffset, yoffset, step),
+            frame_probes(screenw, screenh, xoffset, yoffset, step, SERIES_CHECK_PROBES),
+            step,
+            fractalmode,
+            max_iterations,
+            power,
+            escape_radius,
+            epsilon,
+        )
+    else:
+        skip, radius = 0, 1.0
+        series = der_series = np_zeros(1, dtype=type_math_complex)
+    params = (
+        orbit,
+        xoffset,
+        yoffset,
+        step,
+        type_enum_int(fractalmode),
+        type_math_int(max_iterations),
+        type_math_int(power),
+        type_math_int(escape_radius),
+        type_math_float(epsilon),
+        type_math_int(skip),
+        type_math_float(radius),
+        series,
+        der_series,
+    )
+    if numba_available():
+        rebases = perturbation_kernel_numba(
+            host_array_niter, host_array_z2, host_array_der2, *params
+        )
+    else:
+        rebases = perturbation_numpy(
+            host_array_niter, host_array_z2, host_array_der2, *params
+        )
+    last_perturbation_stats = {
+        "reference_iterations": orbit.shape[0] - 1,
+        "bits": bits,
+        "skipped_iterations": skip,
+        "rebases": int(rebases),
+    }
+    instrumentation.count("perturbation.rebases", int(rebases))
+    instrumentation.count("perturbation.skipped_iterations", skip)
+    return host_array_niter, host_array_z2, host_array_der2
+
+
+@timing_wrapper
+def fractal_perturbation_points(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    host_array_dc,
+    xcenter: type_math_decimal,
+    ycenter: type_math_decimal,
+    min_step: type_math_float,
+    fractalmode: Fractal_Mode,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+):
+    # points at offsets host_array_dc to the center, min_step is the finest distance between
+    # them, it sets the reference precision. No series approximation: the points don't
+    # make a frame whose border bounds its error
+    global last_perturbation_stats
+    bits = GUARD_BITS + max(0, ceil(-log2(min_step)))
+    xref, yref, orbit = get_reference(
+        xcenter,
+        ycenter,
+        min_step,
+        type_enum_int(fractalmode),
+        type_math_int(max_iterations),
+        type_math_int(power),
+        type_math_int(escape_radius),
+        type_math_complex(juliaxy),
+        bits,
+    )
+    with localcontext(prec=decimal_digits(min_step)):
+        offset = type_math_complex(
+            type_math_float(xcenter - xref) + 1j * type_math_float(ycenter - yref)
+        )
+    params = (
+        orbit,
+        host_array_dc + offset if offset != 0 else host_array_dc,
+        type_enum_int(fractalmode),
+        type_math_int(max_iterations),
+        type_math_int(power),
+        type_math_int(escape_radius),
+        type_math_float(epsilon),
+        type_math_int(0),
+        type_math_float(1.0),
+        np_zeros(1, dtype=type_math_complex),
+        np_zeros(1, dtype=type_math_complex),
+    )
+    if numba_available():
+        rebases = perturbation_points_kernel_numba(
+            host_array_niter, host_array_z2, host_array_der2, *params
+        )
+    else:
+        rebases = perturbation_points_numpy(
+            host_array_niter, host_array_z2, host_array_der2, *params
+        )
+    last_perturbation_stats = {
+        "reference_iterations": orbit.shape[0] - 1,
+        "bits": bits,
+        "skipped_iterations": 0,
+        "rebases": int(rebases),
+    }
+    instrumentation.count("perturbation.rebases", int(rebases))
+    return host_array_niter, host_array_z2, host_array_der2
+
+
+def perturbation_work():
+    # every pixel starts at the iteration the series skips to
+    return last_perturbation_stats["skipped_iterations"], None
+
+
+# TODO read stuff from AppState
+@timing_wrapper
+def compute_fractal_perturbation(
+    host_array_niter,
+    niter_min,
+    niter_max,
+    host_array_z2,
+    z2_min,
+    z2_max,
+    host_array_der2,
+    der2_min,
+    der2_max,
+    host_array_k,
+    host_array_rgb,
+    WINDOW_SIZE,
+    xmax: type_math_float,
+    xmin: type_math_float,
+    ymin: type_math_float,
+    ymax: type_math_float,
+    fractalmode: Fractal_Mode,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    normalization_mode: Normalization_Mode,
+    palette_mode: Palette_Mode,
+    custom_palette: List[type_color_int],
+    palette_width: type_math_float,
+    palette_shift: type_math_float,
+    recalc_fractal: bool = True,
+    recalc_color: bool = False,
+    interior_check: type_enum_int = Interior_Check.NONE,
+    xcenter: type_math_decimal = None,
+    ycenter: type_math_decimal = None,
+    yheight: type_math_float = None,
+):
+    # interior checks are skipped: at deep zooms float64 orbits of points just outside
+    # the set come back within PERIODICITY_EPSILON of themselves
+    # without the arbitrary precision center, fall back on the float bounds
+    if xcenter is None:
+        xcenter = type_math_decimal(float(xmin + (xmax - xmin) / 2))
+        ycenter = type_math_decimal(float(ymin + (ymax - ymin) / 2))
+        yheight = type_math_float(ymax - ymin)
+
+    if recalc_fractal:
+        host_array_niter, host_array_z2, host_array_der2 = fractal_perturbation(
+            host_array_niter,
+            host_array_z2,
+            host_array_der2,
+            xcenter,
+            ycenter,
+            yheight,
+            fractalmode,
+            max_iterations,
+            power,
+            escape_radius,
+            epsilon,
+            juliaxy,
+        )
+        # compute min/max of niter and z2, so palette step can set k based on min/max niter of current image
+        niter_min, niter_max = compute_min_max_cpu(host_array_niter)
+        z2_min, z2_max = compute_min_max_cpu(host_array_z2)
+        der2_min, der2_max = compute_min_max_cpu(host_array_der2)
+        # TODO: store niter_min, niter_max, z2_min, z2_max, der2_min, der2_max in AppState
+    if recalc_fractal or recalc_color:
+        # color is calculated with fractal when it's called, but can be called by itself
+        host_array_k, host_array_rgb = color_cpu(
+            host_array_niter,
+            host_array_z2,
+            host_array_der2,
+            host_array_k,
+            host_array_rgb,
+            niter_min,
+            niter_max,
+            z2_min,
+            z2_max,
+            der2_min,
+            der2_max,
+            max_iterations,
+            escape_radius,
+            normalization_mode,
+            palette_mode,
+            custom_palette,
+            palette_width,
+            palette_shift,
+        )
+    # TODO store stuff from AppState
+    return (
+        host_array_niter,
+        niter_min,
+        niter_max,
+        host_array_z2,
+        z2_min,
+        z2_max,
+        host_array_der2,
+        der2_min,
+        der2_max,
+        host_array_k,
+        host_array_rgb,
+    )
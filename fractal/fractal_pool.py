@@ -0,0 +1,270 @@
+# Process pool backend: the frame is split in tiles computed by a persistent pool of workers
+# Workers write into shared memory buffers reused by every frame, the tiles are then copied to
+# host_array_niter/z2/der2: the buffers never leave this module, so they can be resized or freed
+import atexit
+from os import cpu_count
+from typing import List
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from concurrent.futures import ProcessPoolExecutor
+from numpy import ndarray as np_ndarray, dtype as np_dtype
+from utils.types import (
+    type_math_int,
+    type_math_float,
+    type_math_complex,
+    type_enum_int,
+    type_color_int,
+)
+from utils.timer import timing_wrapper
+from fractal.fractal_math import Fractal_Mode, Interior_Check
+from fractal.fractal_numpy import fractal_numpy
+from fractal.fractal_cpu import compute_min_max_cpu
+from fractal.scheduler import split_tiles
+from fractal.colors import Normalization_Mode, Palette_Mode, color_cpu
+
+TILE_SIZE = 128
+
+# Session state: the pool and the shared buffers are created once, then reused by every frame
+# Buffers only grow, smaller frames use their start, so their names rarely change
+pool = None
+shared_buffers = {}  # main process: field -> SharedMemory
+attached_buffers = {}  # workers: shared memory name -> SharedMemory
+
+
+def get_pool():
+    global pool
+    if pool is None:
+        pool = ProcessPoolExecutor(
+            max_workers=cpu_count(), mp_context=get_context("spawn")
+        )
+        atexit.register(close_pool)
+    return pool
+
+
+def close_pool():
+    global pool
+    if pool is not None:
+        pool.shutdown()
+        pool = None
+    for field in list(shared_buffers.keys()):
+        release_shared_array(field)
+
+
+def release_shared_array(field):
+    # arrays on the buffer are local to fractal_pool, none is left when it's released
+    shm = shared_buffers.pop(field)
+    shm.close()
+    shm.unlink()
+
+
+def shared_array(field, shape, dtype):
+    # the shared buffer of a field and an array of shape at its start, the buffer is
+    # reallocated when a frame doesn't fit in it
+    size = max(1, shape[0] * shape[1] * np_dtype(dtype).itemsize)
+    if field in shared_buffers and shared_buffers[field].size < size:
+        release_shared_array(field)
+    if field not in shared_buffers:
+        shared_buffers[field] = SharedMemory(create=True, size=size)
+    shm = shared_buffers[field]
+    return shm, np_ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def attach_shared_array(name, shape, dtype):
+    # worker side, attach once per buffer
+    if name not in attached_buffers:
+        # spawned workers share the main process resource tracker, which unlinks it at exit
+        attached_buffers[name] = SharedMemory(name=name)
+    return np_ndarray(shape, dtype=dtype, buffer=attached_buffers[name].buf)
+
+
+def detach_shared_arrays(live_names):
+    # worker side, buffers the main process replaced stay mapped until they're closed here
+    for name in [name for name in attached_buffers if name not in live_names]:
+        attached_buffers.pop(name).close()
+
+
+def fractal_tile(task) -> None:
+    (
+        (name_niter, name_z2, name_der2),
+        shape,
+        (xstart, xend, ystart, yend),
+        topleft,
+        xstep,
+        ystep,
+        fractalmode,
+        max_iterations,
+        power,
+        escape_radius,
+        epsilon,
+        juliaxy,
+        interior_check,
+    ) = task
+    detach_shared_arrays((name_niter, name_z2, name_der2))
+    host_array_niter = attach_shared_array(name_niter, shape, type_math_int)
+    host_array_z2 = attach_shared_array(name_z2, shape, type_math_float)
+    host_array_der2 = attach_shared_array(name_der2, shape, type_math_float)
+    # tile views, fractal_numpy writes in place
+    fractal_numpy(
+        host_array_niter[xstart:xend, ystart:yend],
+        host_array_z2[xstart:xend, ystart:yend],
+        host_array_der2[xstart:xend, ystart:yend],
+        topleft,
+        xstep,
+        ystep,
+        fractalmode,
+        max_iterations,
+        power,
+        escape_radius,
+        epsilon,
+        juliaxy,
+        interior_check,
+        xstart,
+        ystart,
+    )
+
+
+@timing_wrapper
+def fractal_pool(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    topleft: type_math_complex,
+    xstep: type_math_float,
+    ystep: type_math_float,
+    fractalmode: Fractal_Mode,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    interior_check: type_enum_int,
+):
+    shape = host_array_niter.shape
+    shm_niter, shared_niter = shared_array("niter", shape, type_math_int)
+    shm_z2, shared_z2 = shared_array("z2", shape, type_math_float)
+    shm_der2, shared_der2 = shared_array("der2", shape, type_math_float)
+    names = (shm_niter.name, shm_z2.name, shm_der2.name)
+    tasks = [
+        (
+            names,
+            shape,
+            tile,
+            topleft,
+            xstep,
+            ystep,
+            fractalmode,
+            max_iterations,
+            power,
+            escape_radius,
+            epsilon,
+            juliaxy,
+            interior_check,
+        )
+        for tile in split_tiles(shape, TILE_SIZE)
+    ]
+    # wait for all tiles, list() also raises worker exceptions
+    list(get_pool().map(fractal_tile, tasks))
+    # the next frame overwrites the buffers, callers keep their own arrays
+    host_array_niter[:] = shared_niter
+    host_array_z2[:] = shared_z2
+    host_array_der2[:] = shared_der2
+    return host_array_niter, host_array_z2, host_array_der2
+
+
+# TODO read stuff from AppState
+@timing_wrapper
+def compute_fractal_pool(
+    host_array_niter,
+    niter_min,
+    niter_max,
+    host_array_z2,
+    z2_min,
+    z2_max,
+    host_array_der2,
+    der2_min,
+    der2_max,
+    host_array_k,
+    host_array_rgb,
+    WINDOW_SIZE,
+    xmax: type_math_float,
+    xmin: type_math_float,
+    ymin: type_math_float,
+    ymax: type_math_float,
+    fractalmode: Fractal_Mode,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    normalization_mode: Normalization_Mode,
+    palette_mode: Palette_Mode,
+    custom_palette: List[type_color_int],
+    palette_width: type_math_float,
+    palette_shift: type_math_float,
+    recalc_fractal: bool = True,
+    recalc_color: bool = False,
+    interior_check: type_enum_int = Interior_Check.NONE,
+):
+    # timerstart = default_timer()
+    (screenw, screenh) = WINDOW_SIZE
+    xstep = abs(xmax - xmin) / screenw
+    ystep = abs(ymax - ymin) / screenh
+    topleft = type_math_complex(xmin + 1j * ymax)
+
+    if recalc_fractal:
+        host_array_niter, host_array_z2, host_array_der2 = fractal_pool(
+            host_array_niter,
+            host_array_z2,
+            host_array_der2,
+            topleft,
+            xstep,
+            ystep,
+            fractalmode,
+            max_iterations,
+            power,
+            escape_radius,
+            epsilon,
+            juliaxy,
+            interior_check,
+        )
+        # compute min/max of niter and z2, so palette step can set k based on min/max niter of current image
+        niter_min, niter_max = compute_min_max_cpu(host_array_niter)
+        z2_min, z2_max = compute_min_max_cpu(host_array_z2)
+        der2_min, der2_max = compute_min_max_cpu(host_array_der2)
+        # TODO: store niter_min, niter_max, z2_min, z2_max, der2_min, der2_max in AppState
+    if recalc_fractal or recalc_color:
+        # color is calculated with fractal when it's called, but can be called by itself
+        host_array_k, host_array_rgb = color_cpu(
+            host_array_niter,
+            host_array_z2,
+            host_array_der2,
+            host_array_k,
+            host_array_rgb,
+            niter_min,
+            niter_max,
+            z2_min,
+            z2_max,
+            der2_min,
+            der2_max,
+            max_iterations,
+            escape_radius,
+            normalization_mode,
+            palette_mode,
+            custom_palette,
+            palette_width,
+            palette_shift,
+        )
+    # TODO store stuff from AppState
+    return (
+        host_array_niter,
+        niter_min,
+        niter_max,
+        host_array_z2,
+        z2_min,
+        z2_max,
+        host_array_der2,
+        der2_min,
+        der2_max,
+        host_array_k,
+        host_array_rgb,
+    )
@@ -0,0 +1,330 @@
+# Progressive rendering: the frame is computed at 1/16, 1/4 then all of its pixels
+# Each level only computes the samples the previous one doesn't have, on sub-grids
+# offset by whole pixels, and the frame is yielded after each level so the ui shows it at once
+from decimal import localcontext
+from typing import List
+from numpy import repeat as np_repeat, empty as np_empty
+from utils.types import (
+    type_math_int,
+    type_math_float,
+    type_math_complex,
+    type_math_decimal,
+    type_enum_int,
+    type_color_int,
+)
+from utils.timer import timing_wrapper
+from fractal.fractal_math import Fractal_Mode, Interior_Check
+from fractal.fractal_cpu import compute_min_max_cpu
+from fractal.colors import Normalization_Mode, Palette_Mode
+from fractal.fractal import init_arrays, compute_fractal, Compute_Backend
+from fractal.fractal_perturbation import decimal_digits
+from fractal.fractal_cache import (
+    caching_enabled,
+    cached_subgrid,
+    grid_position,
+)
+
+# distance between samples of each level, each one half of the previous
+PROGRESSIVE_STEPS = (4, 2, 1)
+
+
+def upscale(level_array, step, shape):
+    # nearest neighbour, each sample covers its step x step block of pixels
+    return np_repeat(np_repeat(level_array, step, axis=0), step, axis=1)[
+        : shape[0], : shape[1]
+    ]
+
+
+def compute_subgrid_arrays(
+    tile,
+    grid_step,
+    WINDOW_SIZE,
+    xmax: type_math_float,
+    xmin: type_math_float,
+    ymin: type_math_float,
+    ymax: type_math_float,
+    fractal_args,
+    backend: Compute_Backend,
+    interior_check: type_enum_int,
+    xcenter: type_math_decimal = None,
+    ycenter: type_math_decimal = None,
+    yheight: type_math_float = None,
+):
+    # niter, z2 and der2 of the pixels [xstart:xend:grid_step, ystart:yend:grid_step]
+    # computed as a smaller frame, the tile can reach past the frame's border
+    (xstart, xend, ystart, yend) = tile
+    (screenw, screenh) = WINDOW_SIZE
+    xstep = (xmax - xmin) / screenw
+    ystep = (ymax - ymin) / screenh
+    subgrid_size = (
+        len(range(xstart, xend, grid_step)),
+        len(range(ystart, yend, grid_step)),
+    )
+    subgrid_xmin = xmin + xstart * xstep
+    subgrid_ymax = ymax - ystart * ystep
+    subgrid_center = {}
+    if xcenter is not None:
+        # same sub-grid around the arbitrary precision center, for deep zooms
+        step = yheight / screenh
+        with localcontext(prec=decimal_digits(yheight)):
+            subgrid_center["xcenter"] = xcenter + type_math_decimal(
+                (xstart + subgrid_size[0] * grid_step / 2 - screenw / 2) * step
+            )
+            subgrid_center["ycenter"] = ycenter + type_math_decimal(
+                (screenh / 2 - ystart - subgrid_size[1] * grid_step / 2) * step
+            )
+        subgrid_center["yheight"] = subgrid_size[1] * grid_step * step
+    (
+        subgrid_niter,
+        subgrid_z2,
+        subgrid_der2,
+        subgrid_k,
+        subgrid_rgb,
+    ) = init_arrays(subgrid_size)
+    (
+        subgrid_niter,
+        _,
+        _,
+        subgrid_z2,
+        _,
+        _,
+        subgrid_der2,
+        _,
+        _,
+        _,
+        _,
+    ) = compute_fractal(
+        subgrid_niter,
+        0,
+        0,
+        subgrid_z2,
+        0,
+        0,
+        subgrid_der2,
+        0,
+        0,
+        subgrid_k,
+        subgrid_rgb,
+        subgrid_size,
+        subgrid_xmin + subgrid_size[0] * grid_step * xstep,
+        subgrid_xmin,
+        subgrid_ymax - subgrid_size[1] * grid_step * ystep,
+        subgrid_ymax,
+        *fractal_args,
+        True,
+        False,
+        backend,
+        interior_check,
+        **subgrid_center,
+    )
+    return subgrid_niter, subgrid_z2, subgrid_der2
+
+
+@timing_wrapper
+def compute_subgrid(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    tile,
+    grid_step,
+    WINDOW_SIZE,
+    xmax: type_math_float,
+    xmin: type_math_float,
+    ymin: type_math_float,
+    ymax: type_math_float,
+    fractal_args,
+    backend: Compute_Backend,
+    interior_check: type_enum_int,
+    xcenter: type_math_decimal = None,
+    ycenter: type_math_decimal = None,
+    yheight: type_math_float = None,
+):
+    # compute the pixels [xstart:xend:grid_step, ystart:yend:grid_step] as a smaller frame
+    # the tile cache needs the frame's center to place its samples on their grid
+    (xstart, xend, ystart, yend) = tile
+    subgrid_args = (
+        WINDOW_SIZE,
+        xmax,
+        xmin,
+        ymin,
+        ymax,
+        fractal_args,
+        backend,
+        interior_check,
+        xcenter,
+        ycenter,
+        yheight,
+    )
+    if xcenter is None or not caching_enabled():
+        (subgrid_niter, subgrid_z2, subgrid_der2) = compute_subgrid_arrays(
+            tile, grid_step, *subgrid_args
+        )
+    else:
+
+        def compute_region(istart, iend, jstart, jend):
+            return compute_subgrid_arrays(
+                (
+                    xstart + istart * grid_step,
+                    xstart + iend * grid_step,
+                    ystart + jstart * grid_step,
+                    ystart + jend * grid_step,
+                ),
+                grid_step,
+                *subgrid_args,
+            )
+
+        # the math parameters of fractal_args, colors don't change the samples
+        params_key = (*fractal_args[:6], backend, interior_check)
+        (subgrid_niter, subgrid_z2, subgrid_der2) = cached_subgrid(
+            (len(range(xstart, xend, grid_step)), len(range(ystart, yend, grid_step))),
+            grid_step,
+            grid_position(xcenter, ycenter, yheight, WINDOW_SIZE, xstart, ystart),
+            params_key,
+            compute_region,
+        )
+    host_array_niter[xstart:xend:grid_step, ystart:yend:grid_step] = subgrid_niter
+    host_array_z2[xstart:xend:grid_step, ystart:yend:grid_step] = subgrid_z2
+    host_array_der2[xstart:xend:grid_step, ystart:yend:grid_step] = subgrid_der2
+
+
+# TODO read stuff from AppState
+def compute_fractal_progressive(
+    host_array_niter,
+    niter_min,
+    niter_max,
+    host_array_z2,
+    z2_min,
+    z2_max,
+    host_array_der2,
+    der2_min,
+    der2_max,
+    host_array_k,
+    host_array_rgb,
+    WINDOW_SIZE,
+    xmax: type_math_float,
+    xmin: type_math_float,
+    ymin: type_math_float,
+    ymax: type_math_float,
+    fractalmode: Fractal_Mode,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    normalization_mode: Normalization_Mode,
+    palette_mode: Palette_Mode,
+    custom_palette: List[type_color_int],
+    palette_width: type_math_float,
+    palette_shift: type_math_float,
+    backend: Compute_Backend = Compute_Backend.AUTO,
+    interior_check: type_enum_int = Interior_Check.NONE,
+    xcenter: type_math_decimal = None,
+    ycenter: type_math_decimal = None,
+    yheight: type_math_float = None,
+):
+    # generator, yields the same tuple as compute_fractal after each level
+    # on coarse levels k and rgb are upscaled previews, niter/z2/der2 are only partly filled
+    fractal_args = (
+        fractalmode,
+        max_iterations,
+        power,
+        escape_radius,
+        epsilon,
+        juliaxy,
+        normalization_mode,
+        palette_mode,
+        custom_palette,
+        palette_width,
+        palette_shift,
+    )
+    (screenw, screenh) = WINDOW_SIZE
+    previous_step = None
+    for step in PROGRESSIVE_STEPS:
+        if previous_step is None:
+            subgrids = [(0, 0, step)]
+        else:
+            # the previous level has (0, 0), add the 3 other corners of its cells
+            subgrids = [
+                (step, 0, previous_step),
+                (0, step, previous_step),
+                (step, step, previous_step),
+            ]
+        for xoffset, yoffset, grid_step in subgrids:
+            compute_subgrid(
+                host_array_niter,
+                host_array_z2,
+                host_array_der2,
+                (xoffset, screenw, yoffset, screenh),
+                grid_step,
+                WINDOW_SIZE,
+                xmax,
+                xmin,
+                ymin,
+                ymax,
+                fractal_args,
+                backend,
+                interior_check,
+                xcenter,
+                ycenter,
+                yheight,
+            )
+        # color the samples of this level together, so min/max cover all of them
+        level_niter = host_array_niter[::step, ::step].copy()
+        level_z2 = host_array_z2[::step, ::step].copy()
+        level_der2 = host_array_der2[::step, ::step].copy()
+        niter_min, niter_max = compute_min_max_cpu(level_niter)
+        z2_min, z2_max = compute_min_max_cpu(level_z2)
+        der2_min, der2_max = compute_min_max_cpu(level_der2)
+        level_k = np_empty(level_niter.shape, dtype=type_math_float)
+        level_rgb = np_empty(level_niter.shape, dtype=type_math_int)
+        (
+            _,
+            _,
+            _,
+            _,
+            _,
+            _,
+            _,
+            _,
+            _,
+            level_k,
+            level_rgb,
+        ) = compute_fractal(
+            level_niter,
+            niter_min,
+            niter_max,
+            level_z2,
+            z2_min,
+            z2_max,
+            level_der2,
+            der2_min,
+            der2_max,
+            level_k,
+            level_rgb,
+            level_niter.shape,
+            xmax,
+            xmin,
+            ymin,
+            ymax,
+            *fractal_args,
+            False,
+            True,
+            backend,
+            interior_check,
+        )
+        host_array_k[:] = upscale(level_k, step, host_array_k.shape)
+        host_array_rgb[:] = upscale(level_rgb, step, host_array_rgb.shape)
+        previous_step = step
+        yield (
+            host_array_niter,
+            niter_min,
+            niter_max,
+            host_array_z2,
+            z2_min,
+            z2_max,
+            host_array_der2,
+            der2_min,
+            der2_max,
+            host_array_k,
+            host_array_rgb,
+        )
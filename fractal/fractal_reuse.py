@@ -0,0 +1,538 @@
+# Frame reuse: when the view only moved or zoomed by an integer factor, the samples
+# of the previous frame that are exactly on the new pixel grid are kept, and only
+# the other pixels are computed
+from typing import List
+from numpy import (
+    empty as np_empty,
+    arange as np_arange,
+    clip as np_clip,
+    ix_ as np_ix_,
+    where as np_where,
+)
+from utils.types import (
+    type_math_int,
+    type_math_float,
+    type_math_complex,
+    type_math_decimal,
+    type_enum_int,
+    type_color_int,
+)
+from utils import instrumentation
+from utils.timer import timing_wrapper
+from fractal.fractal_math import Fractal_Mode, Interior_Check
+from fractal.fractal_cpu import compute_min_max_cpu
+from fractal.colors import Normalization_Mode, Palette_Mode
+from fractal.fractal import compute_fractal, Compute_Backend
+from fractal.fractal_progressive import compute_subgrid
+
+# pixels kept, pixels in the frame, tiles computed and whether only they were colored
+last_reuse_stats = {}
+
+
+def format_reuse_stats(reuse_stats):
+    reused = reuse_stats["reused"]
+    pixels = reuse_stats["pixels"]
+    tiles = reuse_stats["tiles"]
+    colored = "tiles" if reuse_stats["tiles_colored"] else "frame"
+    return f"Reuse: kept {reused}/{pixels} pixels ({reused / max(1, pixels):.1%}) | computed {tiles} tiles | colored {colored}"
+
+
+def shift_array(host_array, xshift, yshift):
+    # in place host_array[x, y] = host_array[x + xshift, y + yshift], for the pixels that have one
+    (screenw, screenh) = host_array.shape
+    # numpy buffers overlapping copies
+    host_array[
+        max(0, -xshift) : screenw - max(0, xshift),
+        max(0, -yshift) : screenh - max(0, yshift),
+    ] = host_array[
+        max(0, xshift) : screenw - max(0, -xshift),
+        max(0, yshift) : screenh - max(0, -yshift),
+    ]
+
+
+def source_range(origin, scale, count, source_count):
+    # [start, end) of the n < count whose source origin + n * scale is in [0, source_count)
+    start = max(0, -(origin // scale))
+    end = min(count, (source_count - 1 - origin) // scale + 1)
+    return start, max(start, end)
+
+
+def outside_tiles(size, inside):
+    # (xstart, xend, ystart, yend) tiles covering size, except the inside rectangle
+    (screenw, screenh) = size
+    (xstart, xend, ystart, yend) = inside
+    if xstart >= xend or ystart >= yend:
+        return [(0, screenw, 0, screenh)]
+    # full height columns, then the rows between them
+    tiles = [
+        (0, xstart, 0, screenh),
+        (xend, screenw, 0, screenh),
+        (xstart, xend, 0, ystart),
+        (xstart, xend, yend, screenh),
+    ]
+    return [tile for tile in tiles if tile[0] < tile[1] and tile[2] < tile[3]]
+
+
+def recolor(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    host_array_k,
+    host_array_rgb,
+    WINDOW_SIZE,
+    xmax: type_math_float,
+    xmin: type_math_float,
+    ymin: type_math_float,
+    ymax: type_math_float,
+    fractal_args,
+    backend: Compute_Backend,
+    interior_check: type_enum_int,
+    tiles=None,
+    previous_niter_range=None,
+):
+    # min/max of the whole new frame, then color it with them
+    niter_min, niter_max = compute_min_max_cpu(host_array_niter)
+    z2_min, z2_max = compute_min_max_cpu(host_array_z2)
+    der2_min, der2_max = compute_min_max_cpu(host_array_der2)
+    if tiles is not None and (niter_min, niter_max) == previous_niter_range:
+        # colors only depend on niter min/max, the kept pixels still have theirs
+        for xstart, xend, ystart, yend in tiles:
+            tile_niter = host_array_niter[xstart:xend, ystart:yend].copy()
+            (_, _, _, _, _, _, _, _, _, tile_k, tile_rgb) = compute_fractal(
+                tile_niter,
+                niter_min,
+                niter_max,
+                host_array_z2[xstart:xend, ystart:yend].copy(),
+                z2_min,
+                z2_max,
+                host_array_der2[xstart:xend, ystart:yend].copy(),
+                der2_min,
+                der2_max,
+                np_empty(tile_niter.shape, dtype=type_math_float),
+                np_empty(tile_niter.shape, dtype=type_math_int),
+                tile_niter.shape,
+                xmax,
+                xmin,
+                ymin,
+                ymax,
+                *fractal_args,
+                False,
+                True,
+                backend,
+                interior_check,
+            )
+            host_array_k[xstart:xend, ystart:yend] = tile_k
+            host_array_rgb[xstart:xend, ystart:yend] = tile_rgb
+        return (
+            host_array_niter,
+            niter_min,
+            niter_max,
+            host_array_z2,
+            z2_min,
+            z2_max,
+            host_array_der2,
+            der2_min,
+            der2_max,
+            host_array_k,
+            host_array_rgb,
+        )
+    return compute_fractal(
+        host_array_niter,
+        niter_min,
+        niter_max,
+        host_array_z2,
+        z2_min,
+        z2_max,
+        host_array_der2,
+        der2_min,
+        der2_max,
+        host_array_k,
+        host_array_rgb,
+        WINDOW_SIZE,
+        xmax,
+        xmin,
+        ymin,
+        ymax,
+        *fractal_args,
+        False,
+        True,
+        backend,
+        interior_check,
+    )
+
+
+# TODO read stuff from AppState
+@timing_wrapper
+def compute_fractal_pan(
+    host_array_niter,
+    niter_min,
+    niter_max,
+    host_array_z2,
+    z2_min,
+    z2_max,
+    host_array_der2,
+    der2_min,
+    der2_max,
+    host_array_k,
+    host_array_rgb,
+    WINDOW_SIZE,
+    xmax: type_math_float,
+    xmin: type_math_float,
+    ymin: type_math_float,
+    ymax: type_math_float,
+    fractalmode: Fractal_Mode,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    normalization_mode: Normalization_Mode,
+    palette_mode: Palette_Mode,
+    custom_palette: List[type_color_int],
+    palette_width: type_math_float,
+    palette_shift: type_math_float,
+    backend: Compute_Backend = Compute_Backend.AUTO,
+    interior_check: type_enum_int = Interior_Check.NONE,
+    xcenter: type_math_decimal = None,
+    ycenter: type_math_decimal = None,
+    yheight: type_math_float = None,
+    xshift: type_math_int = 0,
+    yshift: type_math_int = 0,
+):
+    # the host arrays hold the frame before the view moved by (xshift, yshift) whole pixels,
+    # with the same parameters, pixel (x, y) of the new frame was (x + xshift, y + yshift)
+    global last_reuse_stats
+    fractal_args = (
+        fractalmode,
+        max_iterations,
+        power,
+        escape_radius,
+        epsilon,
+        juliaxy,
+        normalization_mode,
+        palette_mode,
+        custom_palette,
+        palette_width,
+        palette_shift,
+    )
+    for host_array in (
+        host_array_niter,
+        host_array_z2,
+        host_array_der2,
+        host_array_k,
+        host_array_rgb,
+    ):
+        shift_array(host_array, xshift, yshift)
+    (screenw, screenh) = WINDOW_SIZE
+    tiles = outside_tiles(
+        WINDOW_SIZE,
+        (
+            *source_range(xshift, 1, screenw, screenw),
+            *source_range(yshift, 1, screenh, screenh),
+        ),
+    )
+    for tile in tiles:
+        compute_subgrid(
+            host_array_niter,
+            host_array_z2,
+            host_array_der2,
+            tile,
+            1,
+            WINDOW_SIZE,
+            xmax,
+            xmin,
+            ymin,
+            ymax,
+            fractal_args,
+            backend,
+            interior_check,
+            xcenter,
+            ycenter,
+            yheight,
+        )
+    frame = recolor(
+        host_array_niter,
+        host_array_z2,
+        host_array_der2,
+        host_array_k,
+        host_array_rgb,
+        WINDOW_SIZE,
+        xmax,
+        xmin,
+        ymin,
+        ymax,
+        fractal_args,
+        backend,
+        interior_check,
+        tiles,
+        (niter_min, niter_max),
+    )
+    computed = sum((xend - xstart) * (yend - ystart) for (xstart, xend, ystart, yend) in tiles)
+    last_reuse_stats = {
+        "reused": screenw * screenh - computed,
+        "pixels": screenw * screenh,
+        "tiles": len(tiles),
+        "tiles_colored": (frame[1], frame[2]) == (niter_min, niter_max),
+    }
+    instrumentation.count("reuse.pixels_kept", last_reuse_stats["reused"])
+    instrumentation.count("reuse.pixels", last_reuse_stats["pixels"])
+    return frame
+
+
+
+# TODO read stuff from AppState
+def compute_fractal_zoom(
+    host_array_niter,
+    niter_min,
+    niter_max,
+    host_array_z2,
+    z2_min,
+    z2_max,
+    host_array_der2,
+    der2_min,
+    der2_max,
+    host_array_k,
+    host_array_rgb,
+    WINDOW_SIZE,
+    xmax: type_math_float,
+    xmin: type_math_float,
+    ymin: type_math_float,
+    ymax: type_math_float,
+    fractalmode: Fractal_Mode,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    normalization_mode: Normalization_Mode,
+    palette_mode: Palette_Mode,
+    custom_palette: List[type_color_int],
+    palette_width: type_math_float,
+    palette_shift: type_math_float,
+    backend: Compute_Backend = Compute_Backend.AUTO,
+    interior_check: type_enum_int = Interior_Check.NONE,
+    xcenter: type_math_decimal = None,
+    ycenter: type_math_decimal = None,
+    yheight: type_math_float = None,
+    xorigin: type_math_int = 0,
+    yorigin: type_math_int = 0,
+    zoom_rate: type_math_float = 1,
+):
+    # generator, yields a preview scaled from the previous frame then the computed frame
+    # pixel (x, y) of the new frame was (xorigin + x / zoom_rate, yorigin + y / zoom_rate),
+    # zoom_rate or its inverse is an integer
+    global last_reuse_stats
+    fractal_args = (
+        fractalmode,
+        max_iterations,
+        power,
+        escape_radius,
+        epsilon,
+        juliaxy,
+        normalization_mode,
+        palette_mode,
+        custom_palette,
+        palette_width,
+        palette_shift,
+    )
+    (screenw, screenh) = WINDOW_SIZE
+    # samples (i, j) of the grid of step grid_step were (xorigin + i * scale, yorigin + j * scale)
+    if zoom_rate > 1:
+        (grid_step, scale) = (round(zoom_rate), 1)
+    else:
+        (grid_step, scale) = (1, round(1 / zoom_rate))
+    grid_size = (
+        len(range(0, screenw, grid_step)),
+        len(range(0, screenh, grid_step)),
+    )
+    inside = (
+        *source_range(xorigin, scale, grid_size[0], screenw),
+        *source_range(yorigin, scale, grid_size[1], screenh),
+    )
+    previous_niter = host_array_niter.copy()
+    previous_z2 = host_array_z2.copy()
+    previous_der2 = host_array_der2.copy()
+
+    # preview: the previous pixel of each new one, black where there is none
+    xsource = xorigin + np_arange(screenw) * scale // grid_step
+    ysource = yorigin + np_arange(screenh) * scale // grid_step
+    xsource_inside = (xsource >= 0) & (xsource < screenw)
+    ysource_inside = (ysource >= 0) & (ysource < screenh)
+    source_inside = xsource_inside[:, None] & ysource_inside[None, :]
+    preview_index = np_ix_(
+        np_clip(xsource, 0, screenw - 1), np_clip(ysource, 0, screenh - 1)
+    )
+    host_array_k[:] = np_where(source_inside, host_array_k[preview_index], 0)
+    host_array_rgb[:] = np_where(source_inside, host_array_rgb[preview_index], 0)
+    yield (
+        host_array_niter,
+        niter_min,
+        niter_max,
+        host_array_z2,
+        z2_min,
+        z2_max,
+        host_array_der2,
+        der2_min,
+        der2_max,
+        host_array_k,
+        host_array_rgb,
+    )
+
+    # samples of the new grid that are exactly previous ones
+    (istart, iend, jstart, jend) = inside
+    new_samples = (
+        slice(istart * grid_step, iend * grid_step, grid_step),
+        slice(jstart * grid_step, jend * grid_step, grid_step),
+    )
+    previous_samples = (
+        slice(xorigin + istart * scale, xorigin + (iend - 1) * scale + 1, scale),
+        slice(yorigin + jstart * scale, yorigin + (jend - 1) * scale + 1, scale),
+    )
+    host_array_niter[new_samples] = previous_niter[previous_samples]
+    host_array_z2[new_samples] = previous_z2[previous_samples]
+    host_array_der2[new_samples] = previous_der2[previous_samples]
+    # the rest: grid samples outside the previous frame, then the sub-grids between samples
+    tiles = [
+        (
+            gxstart * grid_step,
+            min(screenw, gxend * grid_step),
+            gystart * grid_step,
+            min(screenh, gyend * grid_step),
+        )
+        for (gxstart, gxend, gystart, gyend) in outside_tiles(grid_size, inside)
+    ]
+    tiles_steps = [(tile, grid_step) for tile in tiles] + [
+        ((xoffset, screenw, yoffset, screenh), grid_step)
+        for xoffset in range(grid_step)
+        for yoffset in range(grid_step)
+        if xoffset > 0 or yoffset > 0
+    ]
+    for tile, tile_step in tiles_steps:
+        compute_subgrid(
+            host_array_niter,
+            host_array_z2,
+            host_array_der2,
+            tile,
+            tile_step,
+            WINDOW_SIZE,
+            xmax,
+            xmin,
+            ymin,
+            ymax,
+            fractal_args,
+            backend,
+            interior_check,
+            xcenter,
+            ycenter,
+            yheight,
+        )
+    reused = (iend - istart) * (jend - jstart)
+    last_reuse_stats = {
+        "reused": reused,
+        "pixels": screenw * screenh,
+        "tiles": len(tiles_steps),
+        "tiles_colored": False,
+    }
+    instrumentation.count("reuse.pixels_kept", last_reuse_stats["reused"])
+    instrumentation.count("reuse.pixels", last_reuse_stats["pixels"])
+    yield recolor(
+        host_array_niter,
+        host_array_z2,
+        host_array_der2,
+        host_array_k,
+        host_array_rgb,
+        WINDOW_SIZE,
+        xmax,
+        xmin,
+        ymin,
+        ymax,
+        fractal_args,
+        backend,
+        interior_check,
+    )
+
+
+# TODO read stuff from AppState
+@timing_wrapper
+def compute_fractal_cached(
+    host_array_niter,
+    niter_min,
+    niter_max,
+    host_array_z2,
+    z2_min,
+    z2_max,
+    host_array_der2,
+    der2_min,
+    der2_max,
+    host_array_k,
+    host_array_rgb,
+    WINDOW_SIZE,
+    xmax: type_math_float,
+    xmin: type_math_float,
+    ymin: type_math_float,
+    ymax: type_math_float,
+    fractalmode: Fractal_Mode,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    normalization_mode: Normalization_Mode,
+    palette_mode: Palette_Mode,
+    custom_palette: List[type_color_int],
+    palette_width: type_math_float,
+    palette_shift: type_math_float,
+    backend: Compute_Backend = Compute_Backend.AUTO,
+    interior_check: type_enum_int = Interior_Check.NONE,
+    xcenter: type_math_decimal = None,
+    ycenter: type_math_decimal = None,
+    yheight: type_math_float = None,
+):
+    # whole frame from the tile cache, only the tiles it doesn't have are computed
+    fractal_args = (
+        fractalmode,
+        max_iterations,
+        power,
+        escape_radius,
+        epsilon,
+        juliaxy,
+        normalization_mode,
+        palette_mode,
+        custom_palette,
+        palette_width,
+        palette_shift,
+    )
+    (screenw, screenh) = WINDOW_SIZE
+    compute_subgrid(
+        host_array_niter,
+        host_array_z2,
+        host_array_der2,
+        (0, screenw, 0, screenh),
+        1,
+        WINDOW_SIZE,
+        xmax,
+        xmin,
+        ymin,
+        ymax,
+        fractal_args,
+        backend,
+        interior_check,
+        xcenter,
+        ycenter,
+        yheight,
+    )
+    return recolor(
+        host_array_niter,
+        host_array_z2,
+        host_array_der2,
+        host_array_k,
+        host_array_rgb,
+        WINDOW_SIZE,
+        xmax,
+        xmin,
+        ymin,
+        ymax,
+        fractal_args,
+        backend,
+        interior_check,
+    )
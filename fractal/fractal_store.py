@@ -0,0 +1,254 @@
+# On-disk tile store: the tiles of the tile cache in numpy memmap files, one file per field,
+# so rendered tiles survive restarts. index.json maps "parameters hash:pixel size:x:y" to a slot
+# of the files, the writer's lookups return views of the memmaps without copying them.
+# One process writes the store, any number of others can open it read-only at the same time,
+# they reload the index when the writer replaces it. Their index can be older than the slots:
+# each slot holds the digest of its key, cleared while the writer changes the slot, readers
+# copy a tile and keep it only when the digest matched before and after the copy.
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from numpy import memmap as np_memmap, bool_ as np_bool_, uint8 as np_uint8, frombuffer as np_frombuffer
+from utils.types import type_math_int, type_math_float
+from utils import instrumentation
+
+# files of the store, in the order of the cache's tiles
+STORE_FIELDS = (
+    ("niter", type_math_int),
+    ("z2", type_math_float),
+    ("der2", type_math_float),
+    ("computed", np_bool_),
+)
+INDEX_FILE = "index.json"
+# digest of the key of each slot, sha1
+KEYS_FILE = "keys.dat"
+KEY_BYTES = 20
+# default size of the store files, in bytes
+TILE_STORE_BUDGET = 1024 * 1024 * 1024
+
+# Session state: the open store, None when there is none
+tile_store = None
+# counters since the store was opened, in tiles
+tile_store_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "stale": 0}
+
+
+def format_tile_store_stats(store_stats):
+    hits = store_stats["hits"]
+    misses = store_stats["misses"]
+    writes = store_stats["writes"]
+    evictions = store_stats["evictions"]
+    stale = store_stats["stale"]
+    used = len(tile_store["index"]) if tile_store is not None else 0
+    capacity = tile_store["capacity"] if tile_store is not None else 0
+    return (
+        f"Tile store: {hits} hits | {misses} misses ({stale} stale) | {writes} writes | {evictions} evictions"
+        f" | {used}/{capacity} slots"
+    )
+
+
+def count_store_stat(counter):
+    tile_store_stats[counter] += 1
+    instrumentation.count(f"tile_store.{counter}")
+
+
+def tile_store_open():
+    return tile_store is not None
+
+
+def store_key(grid_key, tx, ty):
+    # stable between processes, unlike hash(), and between numpy versions: the parameters
+    # are python ints and floats, numpy scalars don't always repr the same
+    (params_key, pixel_size, xphase, yphase) = grid_key
+    (fractalmode, max_iterations, power, escape_radius, epsilon, juliaxy, backend, interior_check) = params_key
+    params = (
+        int(fractalmode),
+        int(max_iterations),
+        int(power),
+        float(escape_radius),
+        float(epsilon),
+        float(juliaxy.real),
+        float(juliaxy.imag),
+        int(backend),
+        int(interior_check),
+        int(xphase),
+        int(yphase),
+    )
+    params_hash = hashlib.sha1(repr(params).encode()).hexdigest()[:16]
+    return f"{params_hash}:{float(pixel_size)!r}:{int(tx)}:{int(ty)}"
+
+
+def key_digest(key):
+    return np_frombuffer(hashlib.sha1(key.encode()).digest(), dtype=np_uint8)
+
+
+def read_index(path):
+    with open(os.path.join(path, INDEX_FILE)) as index_file:
+        index_json = json.load(index_file)
+    # tiles are saved least recently used first
+    index = OrderedDict((key, slot) for key, slot in index_json["tiles"])
+    return index_json["tile_size"], index_json["capacity"], index
+
+
+def write_index():
+    # replaced at once, readers never see a partly written index
+    index_path = os.path.join(tile_store["path"], INDEX_FILE)
+    with open(index_path + ".tmp", "w") as index_file:
+        json.dump(
+            {
+                "tile_size": tile_store["tile_size"],
+                "capacity": tile_store["capacity"],
+                "tiles": list(tile_store["index"].items()),
+            },
+            index_file,
+        )
+    os.replace(index_path + ".tmp", index_path)
+    tile_store["index_mtime"] = os.stat(index_path).st_mtime_ns
+    tile_store["dirty"] = False
+
+
+def open_fields(path, tile_size, capacity, mode):
+    return [
+        np_memmap(
+            os.path.join(path, f"{name}.dat"),
+            dtype=dtype,
+            mode=mode,
+            shape=(capacity, tile_size, tile_size),
+        )
+        for name, dtype in STORE_FIELDS
+    ]
+
+
+def open_keys(path, capacity, mode):
+    return np_memmap(os.path.join(path, KEYS_FILE), dtype=np_uint8, mode=mode, shape=(capacity, KEY_BYTES))
+
+
+def open_tile_store(path, tile_size, budget=TILE_STORE_BUDGET, readonly=False):
+    # the files are resized to the budget when it changed, tiles past it are dropped
+    global tile_store
+    close_tile_store()
+    if readonly:
+        (tile_size, capacity, index) = read_index(path)
+        fields = open_fields(path, tile_size, capacity, "r")
+        keys = open_keys(path, capacity, "r")
+    else:
+        slot_bytes = KEY_BYTES + sum(tile_size * tile_size * dtype(0).itemsize for _, dtype in STORE_FIELDS)
+        capacity = max(1, budget // slot_bytes)
+        index = OrderedDict()
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, INDEX_FILE)):
+            (stored_tile_size, _, index) = read_index(path)
+            # a store without slot keys can't be checked, its tiles are dropped
+            if stored_tile_size != tile_size or not os.path.exists(os.path.join(path, KEYS_FILE)):
+                index = OrderedDict()
+        index = OrderedDict((key, slot) for key, slot in index.items() if slot < capacity)
+        file_sizes = [(f"{name}.dat", tile_size * tile_size * dtype(0).itemsize) for name, dtype in STORE_FIELDS]
+        for name, slot_size in file_sizes + [(KEYS_FILE, KEY_BYTES)]:
+            # sparse files, the slots only take disk space once written
+            with open(os.path.join(path, name), "ab") as field_file:
+                field_file.truncate(capacity * slot_size)
+        fields = open_fields(path, tile_size, capacity, "r+")
+        keys = open_keys(path, capacity, "r+")
+    used = set(index.values())
+    tile_store = {
+        "path": path,
+        "readonly": readonly,
+        "tile_size": tile_size,
+        "capacity": capacity,
+        "fields": fields,
+        "keys": keys,
+        "index": index,
+        "free": [slot for slot in range(capacity - 1, -1, -1) if slot not in used],
+        "index_mtime": None,
+        "dirty": False,
+    }
+    if not readonly:
+        write_index()
+    else:
+        tile_store["index_mtime"] = os.stat(os.path.join(path, INDEX_FILE)).st_mtime_ns
+    for counter in tile_store_stats:
+        tile_store_stats[counter] = 0
+
+
+def close_tile_store():
+    global tile_store
+    if tile_store is not None:
+        flush_tile_store()
+        tile_store = None
+
+
+def refresh_tile_store():
+    # readers follow the writer's index, and its size if it reopened the store with another budget
+    if tile_store is None or not tile_store["readonly"]:
+        return
+    index_path = os.path.join(tile_store["path"], INDEX_FILE)
+    index_mtime = os.stat(index_path).st_mtime_ns
+    if index_mtime != tile_store["index_mtime"]:
+        (tile_size, capacity, index) = read_index(tile_store["path"])
+        if (tile_size, capacity) != (tile_store["tile_size"], tile_store["capacity"]):
+            tile_store["fields"] = open_fields(tile_store["path"], tile_size, capacity, "r")
+            tile_store["keys"] = open_keys(tile_store["path"], capacity, "r")
+            tile_store["tile_size"] = tile_size
+            tile_store["capacity"] = capacity
+        tile_store["index"] = index
+        tile_store["index_mtime"] = index_mtime
+
+
+def stored_tile(grid_key, tx, ty):
+    # views of the tile in the memmaps for the writer, a copy for readers, or None
+    if tile_store is None:
+        return None
+    key = store_key(grid_key, tx, ty)
+    slot = tile_store["index"].get(key)
+    if slot is None:
+        count_store_stat("misses")
+        return None
+    digest = key_digest(key)
+    slot_key = tile_store["keys"][slot]
+    if not tile_store["readonly"]:
+        tile = tuple(field[slot] for field in tile_store["fields"])
+    elif (slot_key == digest).all():
+        tile = tuple(field[slot].copy() for field in tile_store["fields"])
+    else:
+        tile = None
+    # the writer reused or is writing the slot since the index was read
+    if tile is None or not (slot_key == digest).all():
+        count_store_stat("stale")
+        count_store_stat("misses")
+        return None
+    tile_store["index"].move_to_end(key)
+    count_store_stat("hits")
+    return tile
+
+
+def write_tile(grid_key, tx, ty, tile):
+    if tile_store is None or tile_store["readonly"]:
+        return
+    key = store_key(grid_key, tx, ty)
+    index = tile_store["index"]
+    if key in index:
+        slot = index[key]
+        index.move_to_end(key)
+    else:
+        if tile_store["free"]:
+            slot = tile_store["free"].pop()
+        else:
+            (_, slot) = index.popitem(last=False)
+            count_store_stat("evictions")
+        index[key] = slot
+    # readers holding an older index see the slot change
+    tile_store["keys"][slot] = 0
+    for field, tile_array in zip(tile_store["fields"], tile):
+        field[slot] = tile_array
+    tile_store["keys"][slot] = key_digest(key)
+    tile_store["dirty"] = True
+    count_store_stat("writes")
+
+
+def flush_tile_store():
+    # the tiles, then the index that points to them
+    if tile_store is not None and not tile_store["readonly"] and tile_store["dirty"]:
+        for field in tile_store["fields"]:
+            field.flush()
+        tile_store["keys"].flush()
+        write_index()
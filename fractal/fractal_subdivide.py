@@ -0,0 +1,347 @@
+# Mariani-Silver subdivision backend: iterate the border of a rectangle, fill its interior
+# when all the border is interior or a single escape band, otherwise split it in 4 and recurse
+# The set and each region niter > n are connected without holes, and all contain the origin
+# (c=0 for mandelbrot, the critical point z=0 for connected julia sets): a uniform border can
+# only enclose other values when it goes around the origin, or around details it misses.
+# Interior pixels (max_iterations, interior checks and derivative exits) aren't colored from
+# niter, z2 or der2, they take the corner's. Escaped pixels of a band get its niter, their z2
+# and der2 are interpolated between the corners: an approximation, so bands are only filled
+# when the normalization doesn't color from z2, and iterated otherwise. Recoloring a frame in
+# a z2 normalization shows the interpolated values until it's computed again.
+# The subdivision runs in a numba kernel, a python loop costs more per rectangle than
+# iterating its pixels on most views, colors use the numba kernel too.
+from typing import List
+from numpy import empty as np_empty, zeros as np_zeros, int64 as np_int64, bool_ as np_bool_
+from utils.types import (
+    type_math_int,
+    type_math_float,
+    type_math_complex,
+    type_enum_int,
+    type_color_int,
+)
+from utils import instrumentation
+from utils.timer import timing_wrapper
+from utils.numba_cpu import cpu_jit, cpu_rebind
+from fractal.fractal_math import Fractal_Mode, Interior_Check
+from fractal.fractal_numba import (
+    fractal_variant,
+    get_fractal_kernels,
+    color_numba,
+)
+from fractal.fractal_cpu import compute_min_max_cpu
+from fractal.colors import Normalization_Mode, Palette_Mode
+
+# rectangles this small are iterated entirely, splitting further costs more than it saves
+MIN_SIZE = 8
+# normalizations coloring escaped pixels from z2
+Z2_NORMALIZATIONS = (Normalization_Mode.R_Z2, Normalization_Mode.LOG_R_Z2, Normalization_Mode.INV_Z2)
+# border kinds of a rectangle
+BORDER_MIXED = 0
+BORDER_INTERIOR = 1
+BORDER_BAND = 2
+
+# Session state: subdivision kernels compiled per fractal kernel variant, and which pixels
+# of the last frame were filled
+subdivide_kernels = {}
+filled_pixels = None
+# pixels iterated, pixels in the frame and rectangles filled of the last frame
+last_subdivide_stats = {}
+
+
+def format_subdivide_stats(subdivide_stats):
+    iterated = subdivide_stats["iterated"]
+    pixels = subdivide_stats["pixels"]
+    filled = subdivide_stats["filled"]
+    return f"Subdivide: iterated {iterated}/{pixels} pixels ({iterated / max(1, pixels):.1%}) | filled {filled} rectangles"
+
+
+@cpu_jit(nogil=True, cache=True)
+def border_kind(host_array_niter, host_array_z2, x0, x1, y0, y1, escape_radius):
+    # BORDER_INTERIOR when no border pixel escaped, BORDER_BAND when all escaped with the
+    # corner's niter, BORDER_MIXED otherwise
+    nb_iter = host_array_niter[x0, y0]
+    interior = True
+    band = True
+    for x in range(x0, x1 + 1):
+        for y in (y0, y1):
+            escaped = host_array_z2[x, y] >= escape_radius
+            interior = interior and not escaped
+            band = band and escaped and host_array_niter[x, y] == nb_iter
+        if not interior and not band:
+            return BORDER_MIXED
+    for y in range(y0 + 1, y1):
+        for x in (x0, x1):
+            escaped = host_array_z2[x, y] >= escape_radius
+            interior = interior and not escaped
+            band = band and escaped and host_array_niter[x, y] == nb_iter
+        if not interior and not band:
+            return BORDER_MIXED
+    return BORDER_INTERIOR if interior else BORDER_BAND
+
+
+@cpu_jit(nogil=True, cache=True)
+def fill_rectangle(host_array_niter, host_array_z2, host_array_der2, host_array_filled, x0, x1, y0, y1, interpolate):
+    # corner's niter, z2 and der2, or z2 and der2 between the values of the 4 corners
+    for x in range(x0 + 1, x1):
+        tx = (x - x0) / (x1 - x0)
+        for y in range(y0 + 1, y1):
+            host_array_filled[x, y] = True
+            host_array_niter[x, y] = host_array_niter[x0, y0]
+            if interpolate:
+                ty = (y - y0) / (y1 - y0)
+                host_array_z2[x, y] = (
+                    (1 - tx) * (1 - ty) * host_array_z2[x0, y0]
+                    + tx * (1 - ty) * host_array_z2[x1, y0]
+                    + (1 - tx) * ty * host_array_z2[x0, y1]
+                    + tx * ty * host_array_z2[x1, y1]
+                )
+                host_array_der2[x, y] = (
+                    (1 - tx) * (1 - ty) * host_array_der2[x0, y0]
+                    + tx * (1 - ty) * host_array_der2[x1, y0]
+                    + (1 - tx) * ty * host_array_der2[x0, y1]
+                    + tx * ty * host_array_der2[x1, y1]
+                )
+            else:
+                host_array_z2[x, y] = host_array_z2[x0, y0]
+                host_array_der2[x, y] = host_array_der2[x0, y0]
+
+
+@cpu_jit(nogil=True, cache=True)
+def push_rectangle(stack, size, x0, x1, y0, y1):
+    stack[size, 0] = x0
+    stack[size, 1] = x1
+    stack[size, 2] = y0
+    stack[size, 3] = y1
+    return size + 1
+
+
+# kernel template, compiled by get_subdivide_kernel with the fractal_tile_kernel of a variant
+def subdivide_kernel_numba(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    host_array_filled,
+    topleft: type_math_complex,
+    xstep: type_math_float,
+    ystep: type_math_float,
+    fractalmode: type_enum_int,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    interior_check: type_enum_int,
+    fill_bands: bool,
+    stack,
+):
+    # (pixels iterated, rectangles filled), stack holds the rectangles left to look at
+    (screenw, screenh) = host_array_niter.shape
+    params = (topleft, xstep, ystep, fractalmode, max_iterations, power, escape_radius, epsilon, juliaxy, interior_check)
+    # pixel coordinates of the origin, inverse of the fractal_xy mapping
+    xorigin = -topleft.real / xstep
+    yorigin = topleft.imag / ystep
+    # rectangles are inclusive of their border rows/columns, neighbours share them
+    fractal_tile_kernel(host_array_niter, host_array_z2, host_array_der2, *params, 0, screenw, 0, 1)
+    fractal_tile_kernel(host_array_niter, host_array_z2, host_array_der2, *params, 0, screenw, screenh - 1, screenh)
+    fractal_tile_kernel(host_array_niter, host_array_z2, host_array_der2, *params, 0, 1, 1, screenh - 1)
+    fractal_tile_kernel(host_array_niter, host_array_z2, host_array_der2, *params, screenw - 1, screenw, 1, screenh - 1)
+    iterated = 2 * screenw + 2 * max(0, screenh - 2) if screenh > 1 else screenw
+    filled = 0
+    size = push_rectangle(stack, 0, 0, screenw - 1, 0, screenh - 1)
+    while size > 0:
+        size -= 1
+        (x0, x1, y0, y1) = (stack[size, 0], stack[size, 1], stack[size, 2], stack[size, 3])
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            continue  # no interior, the border is all there is
+        kind = border_kind(host_array_niter, host_array_z2, x0, x1, y0, y1, escape_radius)
+        # a band border around the origin circles the set and its higher bands
+        around_origin = x0 < xorigin < x1 and y0 < yorigin < y1
+        if kind == BORDER_INTERIOR:
+            fill_rectangle(host_array_niter, host_array_z2, host_array_der2, host_array_filled, x0, x1, y0, y1, False)
+            filled += 1
+        elif kind == BORDER_BAND and fill_bands and not around_origin:
+            # interpolated z2 stays past the escape radius like the corners
+            fill_rectangle(host_array_niter, host_array_z2, host_array_der2, host_array_filled, x0, x1, y0, y1, True)
+            filled += 1
+        elif x1 - x0 <= MIN_SIZE or y1 - y0 <= MIN_SIZE:
+            fractal_tile_kernel(host_array_niter, host_array_z2, host_array_der2, *params, x0 + 1, x1, y0 + 1, y1)
+            iterated += (x1 - x0 - 1) * (y1 - y0 - 1)
+        else:
+            # iterate the cross splitting the interior, then the 4 quarters reuse it as border
+            xmid = (x0 + x1) // 2
+            ymid = (y0 + y1) // 2
+            fractal_tile_kernel(host_array_niter, host_array_z2, host_array_der2, *params, xmid, xmid + 1, y0 + 1, y1)
+            fractal_tile_kernel(host_array_niter, host_array_z2, host_array_der2, *params, x0 + 1, xmid, ymid, ymid + 1)
+            fractal_tile_kernel(host_array_niter, host_array_z2, host_array_der2, *params, xmid + 1, x1, ymid, ymid + 1)
+            iterated += (y1 - y0 - 1) + (x1 - x0 - 2)
+            size = push_rectangle(stack, size, x0, xmid, y0, ymid)
+            size = push_rectangle(stack, size, xmid, x1, y0, ymid)
+            size = push_rectangle(stack, size, x0, xmid, ymid, y1)
+            size = push_rectangle(stack, size, xmid, x1, ymid, y1)
+    return iterated, filled
+
+
+def get_subdivide_kernel(power, epsilon, escape_radius, interior_check):
+    (key, variant) = fractal_variant(power, epsilon, escape_radius, interior_check)
+    if key not in subdivide_kernels:
+        (_, tile_kernel, _) = get_fractal_kernels(power, epsilon, escape_radius, interior_check)
+        subdivide_kernels[key] = cpu_jit(nogil=True, cache=True)(
+            cpu_rebind(subdivide_kernel_numba, variant, fractal_tile_kernel=tile_kernel)
+        )
+    return subdivide_kernels[key]
+
+
+@timing_wrapper
+def fractal_subdivide(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    topleft: type_math_complex,
+    xstep: type_math_float,
+    ystep: type_math_float,
+    fractalmode: Fractal_Mode,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    interior_check: type_enum_int,
+    fill_bands: bool = True,
+):
+    global last_subdivide_stats, filled_pixels
+    (screenw, screenh) = host_array_niter.shape
+    filled_pixels = np_zeros((screenw, screenh), dtype=np_bool_)
+    # each split pops a rectangle and pushes 4, 3 more per level of the frame's size
+    stack = np_empty((4 + 3 * max(screenw, screenh).bit_length(), 4), dtype=np_int64)
+    # cast scalars so the numba kernel is compiled once
+    (iterated, filled) = get_subdivide_kernel(power, epsilon, escape_radius, interior_check)(
+        host_array_niter,
+        host_array_z2,
+        host_array_der2,
+        filled_pixels,
+        type_math_complex(topleft),
+        type_math_float(xstep),
+        type_math_float(ystep),
+        type_enum_int(fractalmode),
+        type_math_int(max_iterations),
+        type_math_int(power),
+        type_math_int(escape_radius),
+        type_math_float(epsilon),
+        type_math_complex(juliaxy),
+        type_enum_int(interior_check),
+        fill_bands,
+        stack,
+    )
+    last_subdivide_stats = {
+        "iterated": int(iterated),
+        "pixels": screenw * screenh,
+        "filled": int(filled),
+    }
+    instrumentation.count("subdivide.pixels_iterated", last_subdivide_stats["iterated"])
+    instrumentation.count("subdivide.rectangles_filled", last_subdivide_stats["filled"])
+    return host_array_niter, host_array_z2, host_array_der2
+
+
+def subdivide_work():
+    # the filled pixels weren't iterated
+    return 0, ~filled_pixels
+
+
+# TODO read stuff from AppState
+@timing_wrapper
+def compute_fractal_subdivide(
+    host_array_niter,
+    niter_min,
+    niter_max,
+    host_array_z2,
+    z2_min,
+    z2_max,
+    host_array_der2,
+    der2_min,
+    der2_max,
+    host_array_k,
+    host_array_rgb,
+    WINDOW_SIZE,
+    xmax: type_math_float,
+    xmin: type_math_float,
+    ymin: type_math_float,
+    ymax: type_math_float,
+    fractalmode: Fractal_Mode,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    normalization_mode: Normalization_Mode,
+    palette_mode: Palette_Mode,
+    custom_palette: List[type_color_int],
+    palette_width: type_math_float,
+    palette_shift: type_math_float,
+    recalc_fractal: bool = True,
+    recalc_color: bool = False,
+    interior_check: type_enum_int = Interior_Check.NONE,
+):
+    # timerstart = default_timer()
+    (screenw, screenh) = WINDOW_SIZE
+    xstep = abs(xmax - xmin) / screenw
+    ystep = abs(ymax - ymin) / screenh
+    topleft = type_math_complex(xmin + 1j * ymax)
+
+    if recalc_fractal:
+        host_array_niter, host_array_z2, host_array_der2 = fractal_subdivide(
+            host_array_niter,
+            host_array_z2,
+            host_array_der2,
+            topleft,
+            xstep,
+            ystep,
+            fractalmode,
+            max_iterations,
+            power,
+            escape_radius,
+            epsilon,
+            juliaxy,
+            interior_check,
+            normalization_mode not in Z2_NORMALIZATIONS,
+        )
+        # compute min/max of niter and z2, so palette step can set k based on min/max niter of current image
+        niter_min, niter_max = compute_min_max_cpu(host_array_niter)
+        z2_min, z2_max = compute_min_max_cpu(host_array_z2)
+        der2_min, der2_max = compute_min_max_cpu(host_array_der2)
+        # TODO: store niter_min, niter_max, z2_min, z2_max, der2_min, der2_max in AppState
+    if recalc_fractal or recalc_color:
+        # color is calculated with fractal when it's called, but can be called by itself
+        host_array_k, host_array_rgb = color_numba(
+            host_array_niter,
+            host_array_z2,
+            host_array_der2,
+            host_array_k,
+            host_array_rgb,
+            niter_min,
+            niter_max,
+            z2_min,
+            z2_max,
+            der2_min,
+            der2_max,
+            max_iterations,
+            escape_radius,
+            normalization_mode,
+            palette_mode,
+            custom_palette,
+            palette_width,
+            palette_shift,
+        )
+    # TODO store stuff from AppState
+    return (
+        host_array_niter,
+        niter_min,
+        niter_max,
+        host_array_z2,
+        z2_min,
+        z2_max,
+        host_array_der2,
+        der2_min,
+        der2_max,
+        host_array_k,
+        host_array_rgb,
+    )
@@ -0,0 +1,246 @@
+# Adaptive supersampling: pixels on an edge, whose color index k differs strongly from a
+# neighbor's or that escaped when a neighbor didn't, are sampled again N x N times inside the
+# pixel. The sub-samples are colored with the frame's min/max and their colors averaged.
+# Smooth areas keep their single sample, so the cost follows the edges, not the image size.
+from time import perf_counter
+from numpy import (
+    arange as np_arange,
+    tile as np_tile,
+    zeros_like as np_zeros_like,
+    minimum as np_minimum,
+    abs as np_abs,
+    nonzero as np_nonzero,
+    empty as np_empty,
+    stack as np_stack,
+    rint as np_rint,
+    uint32 as np_uint32,
+)
+from utils.types import (
+    type_math_int,
+    type_math_float,
+    type_math_complex,
+    type_math_decimal,
+)
+from fractal.fractal import compute_fractal, Compute_Backend
+from fractal.fractal_numba import fractal_points_cpu
+from fractal.fractal_backends import Precision, backend_registry, resolve_backend
+from fractal.fractal_perturbation import fractal_perturbation_points
+
+# sub-samples per pixel side
+SUPERSAMPLE_FACTOR = 4
+# cyclic k difference to a neighbor that makes an edge, k is in [0, 1)
+EDGE_K_THRESHOLD = 0.05
+
+# edge pixels, samples and time of the last supersampled frame or band, added up by callers
+last_supersample_stats = {}
+
+
+def format_supersample_stats(supersample_stats):
+    pixels = supersample_stats["pixels"]
+    edges = supersample_stats["edges"]
+    return (
+        f"Supersampling: {edges} edge pixels of {pixels} ({edges / max(1, pixels):.1%})"
+        f" x {supersample_stats['factor'] ** 2} samples in {supersample_stats['time']:.2f}s"
+    )
+
+
+def edge_pixels(host_array_k, host_array_z2, escape_radius):
+    # pixels differing from one of their 4 neighbors, [x, y] booleans
+    escaped = host_array_z2 > escape_radius
+    edges = np_zeros_like(escaped)
+    for axis_slices in (
+        ((slice(1, None), slice(None)), (slice(None, -1), slice(None))),
+        ((slice(None), slice(1, None)), (slice(None), slice(None, -1))),
+    ):
+        (after, before) = axis_slices
+        k_difference = np_abs(host_array_k[after] - host_array_k[before])
+        edge = (np_minimum(k_difference, 1 - k_difference) > EDGE_K_THRESHOLD) | (
+            escaped[after] != escaped[before]
+        )
+        edges[after] |= edge
+        edges[before] |= edge
+    return edges
+
+
+def subsample_offsets(factor):
+    # offsets of the sub-samples to the pixel's sample, in pixels, centered on it
+    steps = (np_arange(factor, dtype=type_math_float) + 0.5) / factor - 0.5
+    return steps.repeat(factor), np_tile(steps, factor)
+
+
+def compute_subsamples(
+    xs,
+    ys,
+    factor,
+    WINDOW_SIZE,
+    xmax: type_math_float,
+    xmin: type_math_float,
+    ymin: type_math_float,
+    ymax: type_math_float,
+    fractalmode,
+    max_iterations,
+    power,
+    escape_radius,
+    epsilon,
+    juliaxy,
+    backend,
+    interior_check,
+    xcenter: type_math_decimal = None,
+    ycenter: type_math_decimal = None,
+    yheight: type_math_float = None,
+):
+    # (niter, z2, der2) [pixel, sub-sample] of the pixels (xs, ys) of a frame, with the
+    # pixel mapping of the backend compute_fractal picks for it
+    (screenw, screenh) = WINDOW_SIZE
+    (dx, dy) = subsample_offsets(factor)
+    x = xs[:, None] + dx[None, :]
+    y = ys[:, None] + dy[None, :]
+    subsamples = (
+        np_empty(x.shape, dtype=type_math_int),
+        np_empty(x.shape, dtype=type_math_float),
+        np_empty(x.shape, dtype=type_math_float),
+    )
+    backend = resolve_backend(backend, fractalmode, power, yheight)
+    if yheight is not None and backend_registry[backend]["precision"] == Precision.ARBITRARY:
+        step = yheight / screenh
+        dc = ((x - screenw / 2) * step + 1j * ((screenh / 2 - y) * step)).astype(type_math_complex)
+        return fractal_perturbation_points(
+            *subsamples,
+            dc,
+            xcenter,
+            ycenter,
+            step / factor,
+            fractalmode,
+            max_iterations,
+            power,
+            escape_radius,
+            epsilon,
+            juliaxy,
+        )
+    # same mapping as fractal_xy, the other backends run on the cpu
+    xstep = abs(xmax - xmin) / screenw
+    ystep = abs(ymax - ymin) / screenh
+    c = (type_math_complex(xmin + 1j * ymax) + x * xstep - 1j * y * ystep).astype(type_math_complex)
+    return fractal_points_cpu(
+        *subsamples,
+        c,
+        fractalmode,
+        max_iterations,
+        power,
+        escape_radius,
+        epsilon,
+        juliaxy,
+        interior_check,
+    )
+
+
+def supersample(
+    host_array_niter,
+    niter_min,
+    niter_max,
+    host_array_z2,
+    z2_min,
+    z2_max,
+    host_array_der2,
+    der2_min,
+    der2_max,
+    host_array_k,
+    host_array_rgb,
+    WINDOW_SIZE,
+    xmax: type_math_float,
+    xmin: type_math_float,
+    ymin: type_math_float,
+    ymax: type_math_float,
+    fractalmode,
+    max_iterations,
+    power,
+    escape_radius,
+    epsilon,
+    juliaxy,
+    normalization_mode,
+    palette_mode,
+    custom_palette,
+    palette_width,
+    palette_shift,
+    backend=Compute_Backend.AUTO,
+    interior_check=0,
+    xcenter: type_math_decimal = None,
+    ycenter: type_math_decimal = None,
+    yheight: type_math_float = None,
+    factor=SUPERSAMPLE_FACTOR,
+    xstart=0,
+    ystart=0,
+):
+    # averages the colors of the sub-samples of the edge pixels into host_array_rgb, the arrays
+    # can be a band of the frame starting at pixel (xstart, ystart), mins and maxs are the frame's
+    global last_supersample_stats
+    timerstart = perf_counter()
+    (xs, ys) = np_nonzero(edge_pixels(host_array_k, host_array_z2, escape_radius))
+    if xs.size > 0:
+        (subsample_niter, subsample_z2, subsample_der2) = compute_subsamples(
+            (xs + xstart).astype(type_math_float),
+            (ys + ystart).astype(type_math_float),
+            factor,
+            WINDOW_SIZE,
+            xmax,
+            xmin,
+            ymin,
+            ymax,
+            fractalmode,
+            max_iterations,
+            power,
+            escape_radius,
+            epsilon,
+            juliaxy,
+            backend,
+            interior_check,
+            xcenter,
+            ycenter,
+            yheight,
+        )
+        # colored as pixels of the frame, [pixel, sub-sample]
+        (_, _, _, _, _, _, _, _, _, _, subsample_rgb) = compute_fractal(
+            subsample_niter,
+            niter_min,
+            niter_max,
+            subsample_z2,
+            z2_min,
+            z2_max,
+            subsample_der2,
+            der2_min,
+            der2_max,
+            np_empty(subsample_niter.shape, dtype=type_math_float),
+            np_empty(subsample_niter.shape, dtype=type_math_int),
+            subsample_niter.shape,
+            xmax,
+            xmin,
+            ymin,
+            ymax,
+            fractalmode,
+            max_iterations,
+            power,
+            escape_radius,
+            epsilon,
+            juliaxy,
+            normalization_mode,
+            palette_mode,
+            custom_palette,
+            palette_width,
+            palette_shift,
+            False,
+            True,
+            backend,
+            interior_check,
+        )
+        channels = np_stack(
+            [((subsample_rgb >> shift) & 0xFF).mean(axis=1) for shift in (16, 8, 0)]
+        )
+        (r, g, b) = np_rint(channels).astype(np_uint32)
+        host_array_rgb[xs, ys] = (r << 16) | (g << 8) | b
+    last_supersample_stats = {
+        "pixels": host_array_niter.size,
+        "edges": int(xs.size),
+        "factor": factor,
+        "time": perf_counter() - timerstart,
+    }
+    return host_array_rgb
@@ -0,0 +1,160 @@
+# Thread pool backend: small tiles run on gil releasing kernels, balanced by work stealing
+from typing import List
+from utils.types import (
+    type_math_int,
+    type_math_float,
+    type_math_complex,
+    type_enum_int,
+    type_color_int,
+)
+from utils import instrumentation
+from utils.timer import timing_wrapper
+from fractal.fractal_math import Fractal_Mode, Interior_Check
+from fractal.fractal_numba import fractal_tile_cpu
+from fractal.fractal_cpu import compute_min_max_cpu
+from fractal.colors import Normalization_Mode, Palette_Mode, color_cpu
+from fractal.scheduler import split_tiles, run_work_stealing
+
+# per worker busy time, tiles and steals of the last frame
+last_worker_stats = []
+
+
+@timing_wrapper
+def fractal_threads(
+    host_array_niter,
+    host_array_z2,
+    host_array_der2,
+    topleft: type_math_complex,
+    xstep: type_math_float,
+    ystep: type_math_float,
+    fractalmode: Fractal_Mode,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    interior_check: type_enum_int,
+):
+    global last_worker_stats
+    # cast scalars so the numba kernel is compiled once
+    params = (
+        type_math_complex(topleft),
+        type_math_float(xstep),
+        type_math_float(ystep),
+        type_enum_int(fractalmode),
+        type_math_int(max_iterations),
+        type_math_int(power),
+        type_math_int(escape_radius),
+        type_math_float(epsilon),
+        type_math_complex(juliaxy),
+        type_enum_int(interior_check),
+    )
+
+    def run_tile(tile):
+        fractal_tile_cpu(host_array_niter, host_array_z2, host_array_der2, params, tile)
+
+    last_worker_stats = run_work_stealing(split_tiles(host_array_niter.shape), run_tile)
+    # busy time of each worker, its spread shows the load balance
+    for worker_stats in last_worker_stats:
+        instrumentation.observe("threads.worker_busy", int(worker_stats["busy"] * 1e9))
+        instrumentation.count("threads.steals", worker_stats["steals"])
+    return host_array_niter, host_array_z2, host_array_der2
+
+
+# TODO read stuff from AppState
+@timing_wrapper
+def compute_fractal_threads(
+    host_array_niter,
+    niter_min,
+    niter_max,
+    host_array_z2,
+    z2_min,
+    z2_max,
+    host_array_der2,
+    der2_min,
+    der2_max,
+    host_array_k,
+    host_array_rgb,
+    WINDOW_SIZE,
+    xmax: type_math_float,
+    xmin: type_math_float,
+    ymin: type_math_float,
+    ymax: type_math_float,
+    fractalmode: Fractal_Mode,
+    max_iterations: type_math_int,
+    power: type_math_int,
+    escape_radius: type_math_int,
+    epsilon: type_math_float,
+    juliaxy: type_math_complex,
+    normalization_mode: Normalization_Mode,
+    palette_mode: Palette_Mode,
+    custom_palette: List[type_color_int],
+    palette_width: type_math_float,
+    palette_shift: type_math_float,
+    recalc_fractal: bool = True,
+    recalc_color: bool = False,
+    interior_check: type_enum_int = Interior_Check.NONE,
+):
+    # timerstart = default_timer()
+    (screenw, screenh) = WINDOW_SIZE
+    xstep = abs(xmax - xmin) / screenw
+    ystep = abs(ymax - ymin) / screenh
+    topleft = type_math_complex(xmin + 1j * ymax)
+
+    if recalc_fractal:
+        host_array_niter, host_array_z2, host_array_der2 = fractal_threads(
+            host_array_niter,
+            host_array_z2,
+            host_array_der2,
+            topleft,
+            xstep,
+            ystep,
+            fractalmode,
+            max_iterations,
+            power,
+            escape_radius,
+            epsilon,
+            juliaxy,
+            interior_check,
+        )
+        # compute min/max of niter and z2, so palette step can set k based on min/max niter of current image
+        niter_min, niter_max = compute_min_max_cpu(host_array_niter)
+        z2_min, z2_max = compute_min_max_cpu(host_array_z2)
+        der2_min, der2_max = compute_min_max_cpu(host_array_der2)
+        # TODO: store niter_min, niter_max, z2_min, z2_max, der2_min, der2_max in AppState
+    if recalc_fractal or recalc_color:
+        # color is calculated with fractal when it's called, but can be called by itself
+        host_array_k, host_array_rgb = color_cpu(
+            host_array_niter,
+            host_array_z2,
+            host_array_der2,
+            host_array_k,
+            host_array_rgb,
+            niter_min,
+            niter_max,
+            z2_min,
+            z2_max,
+            der2_min,
+            der2_max,
+            max_iterations,
+            escape_radius,
+            normalization_mode,
+            palette_mode,
+            custom_palette,
+            palette_width,
+            palette_shift,
+        )
+    # TODO store stuff from AppState
+    return (
+        host_array_niter,
+        niter_min,
+        niter_max,
+        host_array_z2,
+        z2_min,
+        z2_max,
+        host_array_der2,
+        der2_min,
+        der2_max,
+        host_array_k,
+        host_array_rgb,
+    )
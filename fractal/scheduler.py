@@ -0,0 +1,100 @@
+# Work-stealing tile scheduler
+# Each worker owns a deque of tiles, pops its own from the tail, and steals from the head of
+# the others once it's empty: interior tiles cost max_iterations per pixel, exterior ones a
+# few iterations, so static splits leave most workers idle near the set boundary.
+import atexit
+from os import cpu_count
+from collections import deque
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+
+TILE_SIZE = 32
+
+# Session state: the thread pool is created once, then reused by every frame
+executor = None
+executor_workers = 0
+
+
+def shutdown_executor():
+    if executor is not None:
+        executor.shutdown()
+
+
+def get_executor(nb_workers):
+    # all workers must run at once, or the late ones would only find emptied deques
+    global executor, executor_workers
+    if executor is None:
+        atexit.register(shutdown_executor)
+    if executor_workers < nb_workers:
+        shutdown_executor()
+        executor = ThreadPoolExecutor(max_workers=nb_workers)
+        executor_workers = nb_workers
+    return executor
+
+
+def split_tiles(shape, tile_size=TILE_SIZE):
+    # (xstart, xend, ystart, yend) of each tile, in x then y order
+    (screenw, screenh) = shape
+    return [
+        (x, min(x + tile_size, screenw), y, min(y + tile_size, screenh))
+        for x in range(0, screenw, tile_size)
+        for y in range(0, screenh, tile_size)
+    ]
+
+
+def steal_worker(worker_id, deques, run_task, worker_stats):
+    own_deque = deques[worker_id]
+    busy = 0.0
+    tiles = 0
+    steals = 0
+    while True:
+        try:
+            task = own_deque.pop()
+        except IndexError:
+            # idle: steal the oldest tile of the next worker that still has some
+            task = None
+            for offset in range(1, len(deques)):
+                try:
+                    task = deques[(worker_id + offset) % len(deques)].popleft()
+                    steals += 1
+                    break
+                except IndexError:
+                    continue
+            if task is None:
+                # no tile is ever added back, so all the work is taken
+                break
+        start = perf_counter()
+        run_task(task)
+        busy += perf_counter() - start
+        tiles += 1
+    worker_stats[worker_id] = {"busy": busy, "tiles": tiles, "steals": steals}
+
+
+def run_work_stealing(tasks, run_task, nb_workers=None):
+    # run_task should release the gil (numba nogil, numpy) for the threads to scale
+    if nb_workers is None:
+        nb_workers = cpu_count()
+    # contiguous blocks of neighbouring tiles, like a static split, stealing evens them out
+    deques = [
+        deque(tasks[i * len(tasks) // nb_workers : (i + 1) * len(tasks) // nb_workers])
+        for i in range(nb_workers)
+    ]
+    worker_stats = [None] * nb_workers
+    futures = [
+        get_executor(nb_workers).submit(steal_worker, i, deques, run_task, worker_stats)
+        for i in range(nb_workers)
+    ]
+    for future in futures:
+        future.result()
+    return worker_stats
+
+
+def format_worker_stats(worker_stats, wall_time):
+    # parallel efficiency: share of the workers wall time spent computing tiles
+    total_busy = sum(stats["busy"] for stats in worker_stats)
+    efficiency = total_busy / (len(worker_stats) * wall_time) if wall_time > 0 else 0
+    workers = ", ".join(
+        f"{stats['busy']:.4f}s/{stats['tiles']}/{stats['steals']}"
+        for stats in worker_stats
+    )
+    return f"Workers busy/tiles/steals: {workers} | efficiency: {efficiency:.0%}"
@@ -1,4 +1,8 @@
 import cProfile
-import fractal
-# cProfile.run('re.compile("foo|bar")')
-cProfile.run('fractal.create_image_profiling()')
+from fractal.fractal import Compute_Backend
+from bench.views import view_appstate
+from bench.run import compute_frame
+
+# profile of one benchmark frame, the stages are timed by python -m bench run
+appstate = view_appstate("seahorse_valley", (640, 480))
+cProfile.run("compute_frame(appstate, Compute_Backend.NUMBA)", sort="cumtime")
@@ -0,0 +1,37 @@
+import os
+import io
+import sys
+from tempfile import TemporaryDirectory
+from contextlib import redirect_stdout
+from numpy import asarray, count_nonzero
+from PIL import Image
+from utils.appState import AppState
+from fractal.colors import Normalization_Mode
+from ui.render import render
+
+# renders with different band heights, pixels may only differ where the band's pixel
+# coordinates round differently, a band offset or per band colors would change whole rows
+SIZE = (400, 300)
+BAND_HEIGHTS = (300, 37)
+MISMATCH_SHARE = 0.001
+NORMALIZATION_MODES = (Normalization_Mode.ITER_NORMALIZED, Normalization_Mode.R_Z2)
+
+failed = False
+with TemporaryDirectory() as render_dir:
+    for normalization_mode in NORMALIZATION_MODES:
+        images = []
+        for band_height in BAND_HEIGHTS:
+            appstate = AppState()
+            appstate.normalization_mode = normalization_mode
+            filename = os.path.join(render_dir, f"{normalization_mode.name}-{band_height}.png")
+            with redirect_stdout(io.StringIO()):
+                render(appstate, SIZE, filename, band_height)
+            images.append(asarray(Image.open(filename).convert("RGB")))
+        mismatches = count_nonzero((images[0] != images[1]).any(axis=2))
+        share = mismatches / (SIZE[0] * SIZE[1])
+        failed |= share > MISMATCH_SHARE
+        print(
+            f"{normalization_mode.name:<16} band heights {BAND_HEIGHTS} | {mismatches} pixels differ ({share:.3%})"
+            f" {'FAILED' if share > MISMATCH_SHARE else 'ok'}"
+        )
+sys.exit(1 if failed else 0)
@@ -0,0 +1,52 @@
+import io
+import sys
+from decimal import Decimal
+from contextlib import redirect_stdout
+from numpy import empty, count_nonzero, abs as np_abs
+from utils.types import type_math_int, type_math_float
+from fractal import fractal_perturbation
+
+# niter with and without the series approximation, they may only differ on a few pixels
+# where float64 rounding decides the exit, like perturbation and direct iteration do
+SIZE = (200, 150)
+MISMATCH_SHARE = 0.002
+# name, center, height, fractal mode, max iterations, julia c
+VIEWS = [
+    ("seahorse_1e-4", "-0.7453", "0.1127", 1e-4, 0, 2000, 0j),
+    ("julia_rabbit_1e-3", "0.3", "0.2", 1e-3, 1, 2000, -0.123 + 0.745j),
+    ("elephant_1e-8", "0.29097468966250666663497621371", "0.01649358848014666669740193409", 1e-8, 0, 10000, 0j),
+]
+
+
+def view_niter(view, series_terms):
+    (_, xcenter, ycenter, yheight, fractalmode, max_iterations, juliaxy) = view
+    fractal_perturbation.SERIES_TERMS = series_terms
+    fractal_perturbation.reference_cache = None
+    fractal_perturbation.series_cache = None
+    (screenw, screenh) = SIZE
+    arrays = (
+        empty(SIZE, dtype=type_math_int),
+        empty(SIZE, dtype=type_math_float),
+        empty(SIZE, dtype=type_math_float),
+    )
+    with redirect_stdout(io.StringIO()):
+        fractal_perturbation.fractal_perturbation(
+            *arrays, Decimal(xcenter), Decimal(ycenter), yheight, fractalmode, max_iterations, 2, 4, 0.001, juliaxy
+        )
+    return arrays[0], fractal_perturbation.last_perturbation_stats["skipped_iterations"]
+
+
+series_terms = fractal_perturbation.SERIES_TERMS
+failed = False
+for view in VIEWS:
+    (niter, _) = view_niter(view, 0)
+    (series_niter, skip) = view_niter(view, series_terms)
+    mismatches = count_nonzero(niter != series_niter)
+    share = mismatches / niter.size
+    failed |= share > MISMATCH_SHARE
+    print(
+        f"{view[0]:<20} {skip:5d} iterations skipped | {mismatches} niter mismatches ({share:.2%})"
+        f" max difference {int(np_abs(niter - series_niter).max())}"
+        f" {'FAILED' if share > MISMATCH_SHARE else 'ok'}"
+    )
+sys.exit(1 if failed else 0)
@@ -0,0 +1,434 @@
+# Zoom animation: frames from a start view to an end view, yheight interpolated exponentially
+# Pixels are only reused at integer zoom rates, which an exponential zoom doesn't step by: every
+# power of 2 of the zoom lands on a keyframe instead, the frames of each doubling are spread
+# evenly between them, so the zoom speed varies by up to a frame per doubling. A keyframe keeps
+# the pixels of the previous one (a quarter of its pixels), its center is snapped to them, at most
+# a pixel off the path; the frames between keyframes, and the last one, are computed on the path.
+# Zooms of less than 2, or of more than 2 per frame, have no keyframes: a frame reuses the
+# previous one when their rate is an integer.
+# Frames are computed in order by the kernels' own parallel
+# pool, on the main thread: numba's tbb layer hangs at exit when first started from another one.
+# They're encoded to PNG files or a Y4M video on a thread pool, a bounded number in flight
+# With an exponential map, the zoom's samples are computed once on a log-polar strip, and each
+# frame is a lookup in it: the cost grows with the zoom depth, not the frame count
+import argparse
+from os import cpu_count
+from math import log2, floor
+from time import perf_counter
+from collections import deque
+from decimal import localcontext
+from concurrent.futures import ThreadPoolExecutor
+from numpy import (
+    concatenate as np_concatenate,
+    clip as np_clip,
+    rint as np_rint,
+    uint8 as np_uint8,
+    float32 as np_float32,
+)
+from utils.appState import AppState
+from utils.types import type_math_int, type_math_float, type_math_decimal
+from utils import const
+from utils.png_writer import open_png, write_png_rows, close_png, packed_to_rows
+from fractal.fractal import init_arrays, compute_fractal, Compute_Backend
+from fractal.fractal_reuse import compute_fractal_zoom
+from fractal.fractal_expmap import exponential_map, strip_geometry, frame_polar, strip_frame
+from fractal.fractal_cpu import compute_min_max_cpu
+from fractal.fractal_perturbation import decimal_digits
+from fractal.colors import Palette_Mode
+from fractal.palette import palettes_definitions, prepare_palettes, get_computed_palette
+from ui.screenshot import load_metada
+
+# computed frames waiting to be encoded, per encoding worker
+FRAMES_PER_WORKER = 2
+# zoom rates this close to an integer keep the previous keyframe's pixels
+RATE_TOLERANCE = 1e-9
+
+# frames, frames that reused the previous keyframe and time of the last animation
+last_animation_stats = {}
+
+
+def format_animation_stats(animation_stats):
+    frames = animation_stats["frames"]
+    time = animation_stats["time"]
+    return (
+        f"Animation: {frames} frames in {time:.1f}s ({frames / max(time, 1e-9):.2f} frames/s)"
+        f" | {animation_stats['reused']} reused the previous keyframe"
+        f" | compute {animation_stats['compute_time']:.1f}s | encode wait {animation_stats['encode_wait']:.1f}s"
+    )
+
+
+def interpolate_view(start, end, t):
+    # (xcenter, ycenter, yheight) at t in [0, 1], yheight is exponential, and the center moves
+    # like it so the end center is still in view when zooming on it
+    (xstart, ystart, hstart) = start
+    (xend, yend, hend) = end
+    yheight = hstart * (hend / hstart) ** t
+    center_t = t if hstart == hend else (hstart - yheight) / (hstart - hend)
+    with localcontext(prec=decimal_digits(min(hstart, hend))):
+        xcenter = xstart + (xend - xstart) * type_math_decimal(center_t)
+        ycenter = ystart + (yend - ystart) * type_math_decimal(center_t)
+    return xcenter, ycenter, type_math_float(yheight)
+
+
+def frame_steps(hstart, hend, nb_frames):
+    # (t, keyframe) of each frame, t for interpolate_view: keyframes are where the zoom from the
+    # start is a power of 2, or all the frames when there aren't more frames than doublings
+    steps = nb_frames - 1
+    doublings = abs(log2(hend / hstart)) if hstart != hend else 0
+    if doublings < 1 or steps < doublings:
+        return [(frame_index / max(1, steps), True) for frame_index in range(nb_frames)]
+    # frame of each power of 2, rounded up from halves so they stay at least a frame apart
+    keyframes = [floor(doubling * steps / doublings + 0.5) for doubling in range(floor(doublings) + 1)]
+    # the last doubling to the end view is partial
+    bounds = list(zip(keyframes, range(len(keyframes))))
+    if keyframes[-1] < steps:
+        bounds.append((steps, doublings))
+    frames = []
+    for (first, first_doubling), (last, last_doubling) in zip(bounds, bounds[1:]):
+        for frame_index in range(first, last):
+            doubling = first_doubling + (last_doubling - first_doubling) * (frame_index - first) / (last - first)
+            frames.append((doubling / doublings, frame_index == first))
+    frames.append((1.0, keyframes[-1] == steps))
+    return frames
+
+
+def integer_rate(zoom_rate):
+    # the integer rate, or inverse of an integer, close to zoom_rate, or None
+    for rate, inverse in ((zoom_rate, False), (1 / zoom_rate, True)):
+        if rate > 1.5 and abs(rate - round(rate)) < RATE_TOLERANCE * rate:
+            return 1 / round(rate) if inverse else round(rate)
+    return None
+
+
+def rgb_to_y4m(rows):
+    # full range BT.601 4:2:0, chroma averaged on 2x2 pixels, odd sizes repeat their last row/column
+    rgb = rows.astype(np_float32)
+    (r, g, b) = (rgb[..., 0], rgb[..., 1], rgb[..., 2])
+    luma = 0.299 * r + 0.587 * g + 0.114 * b
+    cb = 128 - 0.168736 * r - 0.331264 * g + 0.5 * b
+    cr = 128 + 0.5 * r - 0.418688 * g - 0.081312 * b
+    planes = [luma]
+    for chroma in (cb, cr):
+        if chroma.shape[0] % 2:
+            chroma = np_concatenate((chroma, chroma[-1:]), axis=0)
+        if chroma.shape[1] % 2:
+            chroma = np_concatenate((chroma, chroma[:, -1:]), axis=1)
+        planes.append((chroma[0::2, 0::2] + chroma[1::2, 0::2] + chroma[0::2, 1::2] + chroma[1::2, 1::2]) / 4)
+    return b"FRAME\n" + b"".join(np_clip(np_rint(plane), 0, 255).astype(np_uint8).tobytes() for plane in planes)
+
+
+def frame_palette(appstate):
+    if appstate.palette_mode == Palette_Mode.CUSTOM:
+        return get_computed_palette(
+            prepare_palettes(palettes_definitions, appstate.max_iterations),
+            appstate.custom_palette_name,
+        )
+    return []
+
+
+def encode_frames(frames, output, size, fps):
+    # frames: (frame index, rows, info table) in order, encoded while the next ones are computed,
+    # returns the time spent waiting for the encoders
+    (width, height) = size
+
+    def encode_png(frame_index, rows, info_table):
+        png = open_png(output % frame_index, width, height, info_table)
+        write_png_rows(png, rows)
+        close_png(png)
+
+    y4m = output.lower().endswith(".y4m")
+    assert y4m or "%" in output, "PNG output needs a %d pattern for the frame number"
+    y4m_file = None
+    if y4m:
+        y4m_file = open(output, "wb")
+        y4m_file.write(f"YUV4MPEG2 W{width} H{height} F{fps}:1 Ip A1:1 C420jpeg XCOLORRANGE=FULL\n".encode())
+    nb_workers = cpu_count() or 1
+    encode_wait = 0
+    with ThreadPoolExecutor(max_workers=nb_workers) as encode_executor:
+        # encoded frames, in order: the y4m file takes them one after the other
+        pending = deque()
+
+        def write_encoded(max_pending):
+            nonlocal encode_wait
+            while len(pending) > max_pending:
+                wait_timerstart = perf_counter()
+                encoded = pending.popleft().result()
+                encode_wait += perf_counter() - wait_timerstart
+                if y4m:
+                    y4m_file.write(encoded)
+
+        for frame_index, rows, info_table in frames:
+            if y4m:
+                pending.append(encode_executor.submit(rgb_to_y4m, rows))
+            else:
+                pending.append(encode_executor.submit(encode_png, frame_index, rows, info_table))
+            write_encoded(FRAMES_PER_WORKER * nb_workers)
+        write_encoded(0)
+    if y4m:
+        y4m_file.close()
+    return encode_wait
+
+
+def animate(appstate, start, end, nb_frames, size, output, fps=30):
+    # start and end: (xcenter, ycenter, yheight), output: a .y4m file or a %d pattern of PNG files
+    global last_animation_stats
+    timerstart = perf_counter()
+    appstate.set_window_size(size)
+    (width, height) = size
+    custom_palette = frame_palette(appstate)
+    reused = 0
+    compute_time = 0
+
+    def compute_frames():
+        # generator, the keyframe arrays are kept for the next keyframe, only the PNG rows are yielded
+        nonlocal reused, compute_time
+        # (frame, (xcenter, ycenter, yheight)) of the last keyframe
+        keyframe = None
+        # arrays of the frames between keyframes
+        between_arrays = None
+        for frame_index, (t, is_keyframe) in enumerate(frame_steps(start[2], end[2], nb_frames)):
+            frame_timerstart = perf_counter()
+            # the last frame is exactly the end view, snapped keyframes aren't on the path
+            last_frame = frame_index == nb_frames - 1
+            (xcenter, ycenter, yheight) = end if last_frame else interpolate_view(start, end, t)
+            zoom_rate = None
+            if is_keyframe and not last_frame and keyframe is not None:
+                zoom_rate = integer_rate(keyframe[1][2] / yheight)
+            if zoom_rate is not None:
+                # zoom on the pixel where the new center is, snapped so the keyframe's pixels are on the new grid
+                (appstate.xcenter, appstate.ycenter, appstate.yheight) = keyframe[1]
+                pixel_size = appstate.yheight / height
+                pixel_move = appstate.zoom(
+                    zoom_rate,
+                    (
+                        width / 2 + float(xcenter - appstate.xcenter) / pixel_size,
+                        height / 2 - float(ycenter - appstate.ycenter) / pixel_size,
+                    ),
+                )
+            else:
+                (appstate.xcenter, appstate.ycenter, appstate.yheight) = (xcenter, ycenter, yheight)
+            appstate.recalc_size()
+            fractal_args = (
+                appstate.WINDOW_SIZE,
+                appstate.xmax,
+                appstate.xmin,
+                appstate.ymin,
+                appstate.ymax,
+                appstate.fractal_mode,
+                appstate.max_iterations,
+                appstate.power,
+                appstate.escape_radius,
+                appstate.epsilon,
+                appstate.juliaxy,
+                appstate.normalization_mode,
+                appstate.palette_mode,
+                custom_palette,
+                appstate.palette_width,
+                appstate.palette_shift,
+            )
+            if zoom_rate is not None:
+                for frame in compute_fractal_zoom(
+                    *keyframe[0],
+                    *fractal_args,
+                    appstate.backend,
+                    appstate.interior_check,
+                    appstate.xcenter,
+                    appstate.ycenter,
+                    appstate.yheight,
+                    *pixel_move,
+                ):
+                    pass
+                reused += 1
+            else:
+                if is_keyframe and keyframe is not None:
+                    (host_array_niter, _, _, host_array_z2, _, _, host_array_der2, _, _, host_array_k, host_array_rgb) = keyframe[0]
+                elif is_keyframe:
+                    (host_array_niter, host_array_z2, host_array_der2, host_array_k, host_array_rgb) = init_arrays(size)
+                else:
+                    if between_arrays is None:
+                        between_arrays = init_arrays(size)
+                    (host_array_niter, host_array_z2, host_array_der2, host_array_k, host_array_rgb) = between_arrays
+                frame = compute_fractal(
+                    host_array_niter,
+                    0,
+                    0,
+                    host_array_z2,
+                    0,
+                    0,
+                    host_array_der2,
+                    0,
+                    0,
+                    host_array_k,
+                    host_array_rgb,
+                    *fractal_args,
+                    True,
+                    True,
+                    appstate.backend,
+                    appstate.interior_check,
+                    appstate.xcenter,
+                    appstate.ycenter,
+                    appstate.yheight,
+                )
+            if is_keyframe:
+                keyframe = (frame, (appstate.xcenter, appstate.ycenter, appstate.yheight))
+            compute_time += perf_counter() - frame_timerstart
+            yield frame_index, packed_to_rows(frame[10]), appstate.get_info_table()
+
+    encode_wait = encode_frames(compute_frames(), output, size, fps)
+    last_animation_stats = {
+        "frames": nb_frames,
+        "reused": reused,
+        "time": perf_counter() - timerstart,
+        "compute_time": compute_time,
+        "encode_wait": encode_wait,
+    }
+    print(format_animation_stats(last_animation_stats))
+    print(f"Saved animation to {output}")
+
+
+def animate_exponential_map(appstate, start_yheight, end, nb_frames, size, output, fps=30, strip_path="strip"):
+    # zoom on the end center from start_yheight, every frame looked up in the exponential map
+    # strip saved in strip_path, computed first if it doesn't cover the zoom
+    global last_animation_stats
+    timerstart = perf_counter()
+    appstate.set_window_size(size)
+    (appstate.xcenter, appstate.ycenter, end_yheight) = end
+    custom_palette = frame_palette(appstate)
+    strip = exponential_map(
+        strip_path,
+        *strip_geometry(size, start_yheight, end_yheight),
+        appstate.xcenter,
+        appstate.ycenter,
+        appstate.fractal_mode,
+        appstate.max_iterations,
+        appstate.power,
+        appstate.escape_radius,
+        appstate.epsilon,
+        appstate.juliaxy,
+    )
+    compute_time = perf_counter() - timerstart
+
+    def compute_frames():
+        nonlocal compute_time
+        (host_array_niter, host_array_z2, host_array_der2, host_array_k, host_array_rgb) = init_arrays(size)
+        # colors don't use der2
+        host_array_der2[:] = 0
+        polar = frame_polar(strip, size)
+        for frame_index in range(nb_frames):
+            frame_timerstart = perf_counter()
+            (_, _, appstate.yheight) = interpolate_view(
+                (appstate.xcenter, appstate.ycenter, start_yheight),
+                end,
+                frame_index / max(1, nb_frames - 1),
+            )
+            appstate.recalc_size()
+            strip_frame(strip, polar, size, appstate.yheight, host_array_niter, host_array_z2)
+            (niter_min, niter_max) = compute_min_max_cpu(host_array_niter)
+            (_, _, _, _, _, _, _, _, _, _, host_array_rgb) = compute_fractal(
+                host_array_niter,
+                niter_min,
+                niter_max,
+                host_array_z2,
+                0,
+                0,
+                host_array_der2,
+                0,
+                0,
+                host_array_k,
+                host_array_rgb,
+                size,
+                appstate.xmax,
+                appstate.xmin,
+                appstate.ymin,
+                appstate.ymax,
+                appstate.fractal_mode,
+                appstate.max_iterations,
+                appstate.power,
+                appstate.escape_radius,
+                appstate.epsilon,
+                appstate.juliaxy,
+                appstate.normalization_mode,
+                appstate.palette_mode,
+                custom_palette,
+                appstate.palette_width,
+                appstate.palette_shift,
+                False,
+                True,
+                appstate.backend,
+                appstate.interior_check,
+            )
+            compute_time += perf_counter() - frame_timerstart
+            yield frame_index, packed_to_rows(host_array_rgb), appstate.get_info_table()
+
+    encode_wait = encode_frames(compute_frames(), output, size, fps)
+    last_animation_stats = {
+        "frames": nb_frames,
+        "reused": 0,
+        "time": perf_counter() - timerstart,
+        "compute_time": compute_time,
+        "encode_wait": encode_wait,
+    }
+    print(format_animation_stats(last_animation_stats))
+    print(f"Saved animation to {output}")
+
+
+def view_from(source, xcenter, ycenter, yheight, appstate):
+    # (xcenter, ycenter, yheight) of a screenshot's metadata, or of the defaults, with overrides
+    if source is not None:
+        load_metada(source, appstate)
+    return (
+        appstate.xcenter if xcenter is None else type_math_decimal(xcenter),
+        appstate.ycenter if ycenter is None else type_math_decimal(ycenter),
+        appstate.yheight if yheight is None else type_math_float(yheight),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="render a zoom from a start view to an end view, without a window")
+    parser.add_argument("-s", "--start", help="PNG to read the start view from, the defaults otherwise")
+    parser.add_argument("-e", "--end", help="PNG to read the end view and fractal parameters from")
+    parser.add_argument("--start-xcenter")
+    parser.add_argument("--start-ycenter")
+    parser.add_argument("--start-yheight", type=float)
+    parser.add_argument("--xcenter", help="end view center x, all its digits are kept")
+    parser.add_argument("--ycenter", help="end view center y, all its digits are kept")
+    parser.add_argument("--yheight", help="end view height", type=float)
+    parser.add_argument("-n", "--frames", help="number of frames", type=int, default=60)
+    parser.add_argument("-o", "--output", help="a .y4m video, or PNG files with a %%d pattern", default="zoom_%05d.png")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument(
+        "-x",
+        "--exponential-map",
+        metavar="STRIP_DIR",
+        help="zoom on the end center, frames looked up in a log-polar strip of all the scales,"
+        " saved in STRIP_DIR and reused by the next renders of the same zoom",
+    )
+    parser.add_argument("--height", help="frame height in pixels", type=int, default=const.DISPLAY_HEIGTH)
+    parser.add_argument("--width", help="frame width in pixels, from the display ratio by default", type=int)
+    parser.add_argument("-i", "--max-iterations", type=int)
+    parser.add_argument(
+        "-b",
+        "--backend",
+        help="compute backend, auto picks the machine's fastest one",
+        choices=[b.name.lower() for b in Compute_Backend],
+    )
+    args = parser.parse_args()
+    start = view_from(args.start, args.start_xcenter, args.start_ycenter, args.start_yheight, AppState())
+    # the end view's parameters are used for all the frames
+    appstate = AppState()
+    end = view_from(args.end, args.xcenter, args.ycenter, args.yheight, appstate)
+    if args.max_iterations is not None:
+        appstate.max_iterations = type_math_int(args.max_iterations)
+    if args.backend is not None:
+        appstate.backend = Compute_Backend[args.backend.upper()]
+    width = args.width if args.width is not None else int(args.height * const.DISPLAY_RATIO)
+    if args.exponential_map is not None:
+        animate_exponential_map(
+            appstate, start[2], end, args.frames, (width, args.height), args.output, args.fps, args.exponential_map
+        )
+    else:
+        animate(appstate, start, end, args.frames, (width, args.height), args.output, args.fps)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import pygame
 import pygame.freetype as ft
 from fractal.colors import Normalization_Mode, Palette_Mode
 from fractal.fractal import Fractal_Mode
+from fractal import fractal_cost
 from ui.keys_config import (
     key_shift,
     key_quit,
@@ -25,6 +26,7 @@ from ui.keys_config import (
     key_reset,
     key_help,
     key_display_info,
+    key_cost_heatmap,
 )
 from pygame.key import name as key_name
 from utils import defaults
@@ -45,6 +47,8 @@ def print_info(
     padding = 1
     line_spacing = 5
     lines = appstate.get_info()
+    if fractal_cost.last_frame_cost_stats:
+        lines.append(fractal_cost.format_frame_cost_stats(fractal_cost.last_frame_cost_stats))
     if ni is not None:
         lines.append(f"niter: {ni} ({niter_min}-{niter_max})")
     if z2 is not None:
@@ -83,6 +87,18 @@ def print_info(
     pygame.display.flip()
 
 
+# opacity of the cost heatmap over the image
+COST_HEATMAP_ALPHA = 208
+
+
+def draw_cost_heatmap(screen_surface, host_array_niter, max_iterations):
+    # iterations of each pixel, log scale from black to white, over the image
+    heatmap_surface = pygame.Surface(host_array_niter.shape)
+    pygame.pixelcopy.array_to_surface(heatmap_surface, fractal_cost.cost_heatmap(host_array_niter, max_iterations))
+    heatmap_surface.set_alpha(COST_HEATMAP_ALPHA)
+    screen_surface.blit(heatmap_surface, (0, 0))
+
+
 def print_help(appstate):
     print("Help:")
     print("key(s): role, value")
@@ -94,7 +110,9 @@ def print_help(appstate):
         print(i)
     print(f"{key_name(key_epsilon_reset)}: epsilon=0")
     print(f"{key_name(key_display_info)}: display info")
+    print(f"{key_name(key_cost_heatmap)}: cost heatmap, iterations per pixel from black to white")
     print(f"{key_name(key_screenshot)}: screenshot")
+    print(f"{key_name(key_shift)}+{key_name(key_screenshot)}: anti-aliased screenshot, edges supersampled")
     print(f"{key_name(key_help)}: help")
     print(f"{key_name(key_reset)}: reset")
     print(f"{key_name(key_quit)}: quit")
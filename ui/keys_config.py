@@ -7,6 +7,8 @@ key_screenshot = pygame.K_s
 key_reset = pygame.K_BACKSPACE
 key_help = pygame.K_h
 key_display_info = pygame.K_d
+key_progressive = pygame.K_g
+key_cost_heatmap = pygame.K_o
 
 # fractal
 key_zoom = pygame.K_z
@@ -20,6 +22,7 @@ key_epsilon_reset = pygame.K_a
 key_epsilon = pygame.K_e
 key_power = pygame.K_p
 key_julia = pygame.K_j
+key_interior_check = pygame.K_k
 
 # colors
 key_normalization_mode = pygame.K_n
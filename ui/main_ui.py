@@ -4,9 +4,19 @@ import pygame
 import pygame.freetype as ft
 import argparse
 from utils.appState import AppState
-from fractal.fractal import init_arrays, compute_fractal
-from ui.info import print_info, print_help
-from ui.screenshot import screenshot, load_metada
+from utils.timer import timing_wrapper
+from fractal.fractal import init_arrays, compute_fractal, Compute_Backend
+from fractal.fractal_progressive import compute_fractal_progressive
+from fractal.fractal_reuse import (
+    compute_fractal_pan,
+    compute_fractal_zoom,
+    compute_fractal_cached,
+)
+from fractal.fractal_cache import TILE_SIZE, caching_enabled, set_tile_cache_budget
+from fractal.fractal_store import TILE_STORE_BUDGET, open_tile_store, close_tile_store
+from ui.info import print_info, print_help, draw_cost_heatmap
+from fractal.fractal_cost import frame_cost, reset_executed_iterations
+from ui.screenshot import screenshot, supersampled_screenshot, load_metada
 from fractal.palette import (
     prepare_palettes,
     palettes_definitions,
@@ -28,6 +38,7 @@ from ui.keys_config import (
     key_epsilon,
     key_power,
     key_julia,
+    key_interior_check,
     key_normalization_mode,
     key_palette_mode,
     key_color_palette,
@@ -36,13 +47,16 @@ from ui.keys_config import (
     key_reset,
     key_help,
     key_display_info,
+    key_progressive,
+    key_cost_heatmap,
     key_ctrl,
     key_ctrl_r,
 )
 from fractal.colors import Palette_Mode
 
 
-def pygamemain(src_image=None):
+def pygamemain(src_image=None, backend=None):
+    @timing_wrapper
     def redraw(
         screen_surface,
         appstate,
@@ -59,6 +73,7 @@ def pygamemain(src_image=None):
         host_array_rgb,
         recalc_fractal=True,
         recalc_color=True,
+        pixel_move=None,
     ):
         appstate.recalc_size()
         if appstate.palette_mode == Palette_Mode.CUSTOM:
@@ -68,20 +83,7 @@ def pygamemain(src_image=None):
             )
         else:
             custom_palette = []
-        # Compute fractal
-        (
-            host_array_niter,
-            niter_min,
-            niter_max,
-            host_array_z2,
-            z2_min,
-            z2_max,
-            host_array_der2,
-            der2_min,
-            der2_max,
-            host_array_k,
-            host_array_rgb,
-        ) = compute_fractal(
+        fractal_args = (
             host_array_niter,
             niter_min,
             niter_max,
@@ -109,13 +111,92 @@ def pygamemain(src_image=None):
             custom_palette,
             appstate.palette_width,
             appstate.palette_shift,
-            recalc_fractal,
-            recalc_color,
         )
-        pygame.pixelcopy.array_to_surface(screen_surface, host_array_rgb)
-        if appstate.show_info:
-            print_info(appstate, screen_surface)
-        pygame.display.flip()
+        if recalc_fractal:
+            reset_executed_iterations()
+        # Compute fractal
+        if recalc_fractal and pixel_move is not None and pixel_move[2] == 1:
+            # the view only moved, keep the pixels still on screen
+            frames = [
+                compute_fractal_pan(
+                    *fractal_args,
+                    appstate.backend,
+                    appstate.interior_check,
+                    appstate.xcenter,
+                    appstate.ycenter,
+                    appstate.yheight,
+                    *pixel_move[:2],
+                )
+            ]
+        elif recalc_fractal and pixel_move is not None:
+            # zoom: scaled preview of the previous frame, then only the missing samples
+            frames = compute_fractal_zoom(
+                *fractal_args,
+                appstate.backend,
+                appstate.interior_check,
+                appstate.xcenter,
+                appstate.ycenter,
+                appstate.yheight,
+                *pixel_move,
+            )
+        elif recalc_fractal and appstate.progressive:
+            # coarse levels first, each one is displayed as soon as it's computed
+            frames = compute_fractal_progressive(
+                *fractal_args,
+                appstate.backend,
+                appstate.interior_check,
+                appstate.xcenter,
+                appstate.ycenter,
+                appstate.yheight,
+            )
+        elif recalc_fractal and caching_enabled():
+            # the tiles already computed for these parameters come from the cache
+            frames = [
+                compute_fractal_cached(
+                    *fractal_args,
+                    appstate.backend,
+                    appstate.interior_check,
+                    appstate.xcenter,
+                    appstate.ycenter,
+                    appstate.yheight,
+                )
+            ]
+        else:
+            frames = [
+                compute_fractal(
+                    *fractal_args,
+                    recalc_fractal,
+                    recalc_color,
+                    appstate.backend,
+                    appstate.interior_check,
+                    appstate.xcenter,
+                    appstate.ycenter,
+                    appstate.yheight,
+                )
+            ]
+        for (
+            host_array_niter,
+            niter_min,
+            niter_max,
+            host_array_z2,
+            z2_min,
+            z2_max,
+            host_array_der2,
+            der2_min,
+            der2_max,
+            host_array_k,
+            host_array_rgb,
+        ) in frames:
+            if recalc_fractal:
+                frame_cost(host_array_niter, host_array_z2, appstate.max_iterations, appstate.escape_radius)
+            pygame.pixelcopy.array_to_surface(screen_surface, host_array_rgb)
+            if appstate.show_cost:
+                draw_cost_heatmap(screen_surface, host_array_niter, appstate.max_iterations)
+            if appstate.show_info:
+                print_info(appstate, screen_surface)
+            pygame.display.flip()
+            # keep the window responsive between levels
+            pygame.event.pump()
         return (
             host_array_niter,
             niter_min,
@@ -137,6 +218,8 @@ def pygamemain(src_image=None):
     # Load metadata from image if present
     if src_image is not None:
         load_metada(src_image, appstate)
+    if backend is not None:
+        appstate.backend = backend
     # Init the display
     screen_surface = pygame.display.set_mode(appstate.WINDOW_SIZE, pygame.HWSURFACE)
     print_help(appstate)
@@ -190,6 +273,7 @@ def pygamemain(src_image=None):
     ):
         recalc_fractal = False
         recalc_color = False
+        pixel_move = None
         if event.type == pygame.QUIT:
             running = False
         elif event.type == pygame.KEYDOWN:
@@ -205,23 +289,41 @@ def pygamemain(src_image=None):
                 running = False
             elif event.key == key_zoom:
                 if shift:
-                    appstate.zoom_out()
+                    pixel_move = appstate.zoom_out()
                 else:
-                    appstate.zoom_in()
+                    pixel_move = appstate.zoom_in()
                 recalc_fractal = True
             elif event.key == key_screenshot:
-                screenshot(screen_surface,appstate)
+                if shift:
+                    supersampled_screenshot(
+                        appstate,
+                        (
+                            host_array_niter,
+                            niter_min,
+                            niter_max,
+                            host_array_z2,
+                            z2_min,
+                            z2_max,
+                            host_array_der2,
+                            der2_min,
+                            der2_max,
+                            host_array_k,
+                            host_array_rgb,
+                        ),
+                    )
+                else:
+                    screenshot(screen_surface,appstate)
             elif event.key == key_pan_up:
-                appstate.pan(0, 1)
+                pixel_move = appstate.pan(0, 1)
                 recalc_fractal = True
             elif event.key == key_pan_down:
-                appstate.pan(0, -1)
+                pixel_move = appstate.pan(0, -1)
                 recalc_fractal = True
             elif event.key == key_pan_left:
-                appstate.pan(-1, 0)
+                pixel_move = appstate.pan(-1, 0)
                 recalc_fractal = True
             elif event.key == key_pan_right:
-                appstate.pan(1, 0)
+                pixel_move = appstate.pan(1, 0)
                 recalc_fractal = True
             elif event.key == key_iter:
                 if shift:
@@ -258,6 +360,9 @@ def pygamemain(src_image=None):
             elif event.key == key_julia:
                 appstate.change_fractal_mode(pygame.mouse.get_pos())
                 recalc_fractal = True
+            elif event.key == key_interior_check:
+                appstate.change_interior_check()
+                recalc_fractal = True
             elif event.key == key_normalization_mode:
                 appstate.change_normalization_mode()
                 recalc_color = True
@@ -290,13 +395,18 @@ def pygamemain(src_image=None):
                 print_help(appstate)
             elif event.key == key_display_info:
                 appstate.toggle_info()
+            elif event.key == key_progressive:
+                appstate.toggle_progressive()
+            elif event.key == key_cost_heatmap:
+                appstate.toggle_cost()
+                recalc_color = True
         elif event.type == pygame.MOUSEBUTTONDOWN:
             recalc_fractal = True
             # 1 - left click, 2 - middle click, 3 - right click, 4 - scroll up, 5 - scroll down
             if event.button == 1 or event.button == 4:
-                appstate.zoom_in(pygame.mouse.get_pos())
+                pixel_move = appstate.zoom_in(pygame.mouse.get_pos())
             elif event.button == 3 or event.button == 5:
-                appstate.zoom_out(pygame.mouse.get_pos())
+                pixel_move = appstate.zoom_out(pygame.mouse.get_pos())
             elif event.button == 2:
                 appstate.change_fractal_mode(pygame.mouse.get_pos())
         elif event.type == pygame.MOUSEMOTION:
@@ -322,12 +432,12 @@ def pygamemain(src_image=None):
                 k,
                 rgb,
             )
-        return recalc_fractal, recalc_color
+        return recalc_fractal, recalc_color, pixel_move
     # Run the game loop
     running = True
     while running:
         for event in pygame.event.get():
-            recalc_fractal, recalc_color = handle_event(event, appstate, screen_surface, host_array_niter, host_array_z2
+            recalc_fractal, recalc_color, pixel_move = handle_event(event, appstate, screen_surface, host_array_niter, host_array_z2
             , host_array_der2
             , host_array_k
             , host_array_rgb)
@@ -360,6 +470,7 @@ def pygamemain(src_image=None):
                     host_array_rgb,
                     recalc_fractal,
                     recalc_color,
+                    pixel_move,
                 )
             # NOTE - get_pressed() gives current state, not state of event
             # pygame.key.get_pressed()[pygame.K_q]
@@ -376,15 +487,54 @@ def main():
     )
     parser.add_argument("-s", "--source", help="source image")
     parser.add_argument("-c", "--cpu", help="compute on cpu only", action="store_true")
+    parser.add_argument(
+        "-b",
+        "--backend",
+        help="compute backend, auto picks the machine's fastest one",
+        choices=[b.name.lower() for b in Compute_Backend],
+    )
+    parser.add_argument(
+        "--cache-budget",
+        help="memory of the tile cache in MB, 0 disables it",
+        type=int,
+    )
+    parser.add_argument("--tile-store", help="directory of the on-disk tile store")
+    parser.add_argument(
+        "--tile-store-budget",
+        help="size of the on-disk tile store in MB",
+        type=int,
+    )
+    parser.add_argument(
+        "--tile-store-readonly",
+        help="only read the tile store, another process writes it",
+        action="store_true",
+    )
     args = parser.parse_args()
+    if args.cache_budget is not None:
+        set_tile_cache_budget(args.cache_budget * 1024 * 1024)
+    if args.tile_store is not None:
+        open_tile_store(
+            args.tile_store,
+            TILE_SIZE,
+            TILE_STORE_BUDGET
+            if args.tile_store_budget is None
+            else args.tile_store_budget * 1024 * 1024,
+            args.tile_store_readonly,
+        )
+    backend = None
+    if args.backend is not None:
+        backend = Compute_Backend[args.backend.upper()]
+    elif args.cpu:
+        backend = Compute_Backend.CPU
     if args.profile:
         # https://docs.python.org/3.8/library/profile.html#module-cProfile
-        cProfile.run("pygamemain()", sort="cumtime")
+        cProfile.runctx("pygamemain(None, backend)", globals(), locals(), sort="cumtime")
     else:
         if args.source is not None:
-            pygamemain(args.source)
+            pygamemain(args.source, backend)
         else:
-            pygamemain()
+            pygamemain(None, backend)
+    close_tile_store()
 
 
 if __name__ == "__main__":
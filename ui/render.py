@@ -0,0 +1,255 @@
+# Headless renderer: renders a view at any size without a window, in bands of rows so memory
+# stays bounded, and writes it as a PNG with the view in its metadata
+# Colors use the niter min/max of the whole image, but each band is iterated as its own frame:
+# its pixel coordinates round differently in the last bit, so a few pixels where float64
+# decides the exit can change with the band height, like the real axis row of a view centered
+# on it, which a band only passes near
+# The iteration kernels use all the cores, the png writer compresses on its own pool
+import os
+import argparse
+from time import perf_counter
+from tempfile import TemporaryDirectory
+from numpy import (
+    fromfile as np_fromfile,
+    empty as np_empty,
+    zeros as np_zeros,
+    ascontiguousarray as np_ascontiguousarray,
+)
+from utils.appState import AppState
+from utils.types import type_math_int, type_math_float, type_math_decimal
+from utils import const
+from utils.png_writer import open_png, write_png_rows, close_png, packed_to_rows
+from fractal.fractal import compute_fractal, Compute_Backend
+from fractal.fractal_cpu import compute_min_max_cpu
+from fractal.fractal_progressive import compute_subgrid_arrays
+from fractal import fractal_supersample
+from fractal.colors import Normalization_Mode, Palette_Mode
+from fractal.palette import palettes_definitions, prepare_palettes, get_computed_palette
+from ui.screenshot import load_metada
+
+# pixels per band, each takes about 40 bytes while its band is computed and colored
+BAND_PIXELS = 4 * 1024 * 1024
+
+# size, time and bands of the last render
+last_render_stats = {}
+
+
+def format_render_stats(render_stats):
+    (width, height) = render_stats["size"]
+    pixels = width * height
+    time = render_stats["time"]
+    compute_time = render_stats["compute_time"]
+    return (
+        f"Render: {width}x{height} {pixels / 1e6:.1f} Mpixels in {time:.1f}s"
+        f" ({pixels / 1e6 / max(time, 1e-9):.2f} Mpixel/s"
+        f", compute {pixels / 1e6 / max(compute_time, 1e-9):.2f} Mpixel/s)"
+        f" | {render_stats['bands']} bands | {render_stats['passes']} passes"
+        + (
+            f" | {render_stats['edges']} edge pixels supersampled {render_stats['supersample']}x{render_stats['supersample']}"
+            if render_stats["supersample"] is not None and render_stats["supersample"] > 1
+            else ""
+        )
+    )
+
+
+def read_band(scratch_file, dtype, ystart, yend, width):
+    # rows [ystart, yend) of a scratch file, back to [x, y]
+    scratch_file.seek(ystart * width * dtype(0).itemsize)
+    rows = np_fromfile(scratch_file, dtype=dtype, count=(yend - ystart) * width)
+    return np_ascontiguousarray(rows.reshape(yend - ystart, width).T)
+
+
+def render(appstate, size, filename, band_height=None, supersample_factor=None):
+    # supersample_factor: edge pixels are sampled factor x factor times, None or 1 for one sample
+    global last_render_stats
+    timerstart = perf_counter()
+    (width, height) = size
+    appstate.set_window_size(size)
+    if appstate.palette_mode == Palette_Mode.CUSTOM:
+        custom_palette = get_computed_palette(
+            prepare_palettes(palettes_definitions, appstate.max_iterations),
+            appstate.custom_palette_name,
+        )
+    else:
+        custom_palette = []
+    fractal_args = (
+        appstate.fractal_mode,
+        appstate.max_iterations,
+        appstate.power,
+        appstate.escape_radius,
+        appstate.epsilon,
+        appstate.juliaxy,
+        appstate.normalization_mode,
+        appstate.palette_mode,
+        custom_palette,
+        appstate.palette_width,
+        appstate.palette_shift,
+    )
+    if band_height is None:
+        band_height = max(1, BAND_PIXELS // width)
+    bands = [(ystart, min(ystart + band_height, height)) for ystart in range(0, height, band_height)]
+    compute_time = 0
+    edges = 0
+
+    def compute_band(ystart, yend):
+        nonlocal compute_time
+        band_timerstart = perf_counter()
+        band = compute_subgrid_arrays(
+            (0, width, ystart, yend),
+            1,
+            size,
+            appstate.xmax,
+            appstate.xmin,
+            appstate.ymin,
+            appstate.ymax,
+            fractal_args,
+            appstate.backend,
+            appstate.interior_check,
+            appstate.xcenter,
+            appstate.ycenter,
+            appstate.yheight,
+        )
+        compute_time += perf_counter() - band_timerstart
+        return band
+
+    def color_band(ystart, band_niter, band_z2, niter_min, niter_max):
+        nonlocal compute_time, edges
+        # colors don't use der2
+        band = compute_fractal(
+            band_niter,
+            niter_min,
+            niter_max,
+            band_z2,
+            0,
+            0,
+            np_zeros(band_niter.shape, dtype=type_math_float),
+            0,
+            0,
+            np_empty(band_niter.shape, dtype=type_math_float),
+            np_empty(band_niter.shape, dtype=type_math_int),
+            band_niter.shape,
+            appstate.xmax,
+            appstate.xmin,
+            appstate.ymin,
+            appstate.ymax,
+            *fractal_args,
+            False,
+            True,
+            appstate.backend,
+            appstate.interior_check,
+        )
+        band_rgb = band[10]
+        if supersample_factor is not None and supersample_factor > 1:
+            # edges between bands are only seen from the pixels' other neighbors
+            band_rgb = fractal_supersample.supersample(
+                *band,
+                size,
+                appstate.xmax,
+                appstate.xmin,
+                appstate.ymin,
+                appstate.ymax,
+                *fractal_args,
+                appstate.backend,
+                appstate.interior_check,
+                appstate.xcenter,
+                appstate.ycenter,
+                appstate.yheight,
+                supersample_factor,
+                0,
+                ystart,
+            )
+            compute_time += fractal_supersample.last_supersample_stats["time"]
+            edges += fractal_supersample.last_supersample_stats["edges"]
+        return packed_to_rows(band_rgb)
+
+    png = open_png(filename, width, height, appstate.get_info_table())
+    if appstate.normalization_mode == Normalization_Mode.ITER_NORMALIZED:
+        # colors need niter min/max of the whole image: compute all the bands to scratch
+        # files next to the output, then color them
+        passes = 2
+        with TemporaryDirectory(dir=os.path.dirname(os.path.abspath(filename))) as scratch_dir:
+            # written and read with plain file calls, mapped pages would count in memory
+            scratch_files = [
+                open(os.path.join(scratch_dir, name), "w+b") for name in ("niter.dat", "z2.dat")
+            ]
+            niter_min = niter_max = None
+            for ystart, yend in bands:
+                (band_niter, band_z2, _) = compute_band(ystart, yend)
+                (band_min, band_max) = compute_min_max_cpu(band_niter)
+                niter_min = band_min if niter_min is None else min(niter_min, band_min)
+                niter_max = band_max if niter_max is None else max(niter_max, band_max)
+                # bands are appended in order, as rows
+                for scratch_file, band_array in zip(scratch_files, (band_niter, band_z2)):
+                    np_ascontiguousarray(band_array.T).tofile(scratch_file)
+            for ystart, yend in bands:
+                (band_niter, band_z2) = (
+                    read_band(scratch_file, dtype, ystart, yend, width)
+                    for scratch_file, dtype in zip(scratch_files, (type_math_int, type_math_float))
+                )
+                write_png_rows(png, color_band(ystart, band_niter, band_z2, niter_min, niter_max))
+            for scratch_file in scratch_files:
+                scratch_file.close()
+    else:
+        passes = 1
+        for ystart, yend in bands:
+            (band_niter, band_z2, _) = compute_band(ystart, yend)
+            # compressed on the png writer's pool while the next band computes
+            write_png_rows(png, color_band(ystart, band_niter, band_z2, 0, 0))
+    close_png(png)
+    last_render_stats = {
+        "size": size,
+        "time": perf_counter() - timerstart,
+        "compute_time": compute_time,
+        "bands": len(bands),
+        "passes": passes,
+        "edges": edges,
+        "supersample": supersample_factor,
+    }
+    print(format_render_stats(last_render_stats))
+    print(f"Saved render to {filename}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="render a fractal view to a PNG, without a window")
+    parser.add_argument("-o", "--output", help="output PNG", default="render.png")
+    parser.add_argument("-s", "--source", help="PNG to read the view from, like the ui's screenshots")
+    parser.add_argument("--height", help="image height in pixels", type=int, default=const.DISPLAY_HEIGTH)
+    parser.add_argument("--width", help="image width in pixels, from the display ratio by default", type=int)
+    parser.add_argument("--xcenter", help="view center x, all its digits are kept")
+    parser.add_argument("--ycenter", help="view center y, all its digits are kept")
+    parser.add_argument("--yheight", help="view height", type=float)
+    parser.add_argument("-i", "--max-iterations", type=int)
+    parser.add_argument(
+        "-b",
+        "--backend",
+        help="compute backend, auto picks the machine's fastest one",
+        choices=[b.name.lower() for b in Compute_Backend],
+    )
+    parser.add_argument("--band-height", help="rows computed together", type=int)
+    parser.add_argument(
+        "-a",
+        "--supersample",
+        help="anti-aliasing: edge pixels are sampled N x N times",
+        metavar="N",
+        type=int,
+    )
+    args = parser.parse_args()
+    appstate = AppState()
+    if args.source is not None:
+        load_metada(args.source, appstate)
+    if args.xcenter is not None:
+        appstate.xcenter = type_math_decimal(args.xcenter)
+    if args.ycenter is not None:
+        appstate.ycenter = type_math_decimal(args.ycenter)
+    if args.yheight is not None:
+        appstate.yheight = type_math_float(args.yheight)
+    if args.max_iterations is not None:
+        appstate.max_iterations = type_math_int(args.max_iterations)
+    if args.backend is not None:
+        appstate.backend = Compute_Backend[args.backend.upper()]
+    width = args.width if args.width is not None else int(args.height * const.DISPLAY_RATIO)
+    render(appstate, (width, args.height), args.output, args.band_height, args.supersample)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,76 @@
 import pygame
 from PIL import Image
-from PIL.PngImagePlugin import PngInfo
+from utils.png_writer import open_png, write_png_rows, close_png, packed_to_rows
+from fractal import fractal_supersample
+from fractal.colors import Palette_Mode
+from fractal.palette import palettes_definitions, prepare_palettes, get_computed_palette
+
+# rows filtered and handed to the png writer at once
+SCREENSHOT_BAND = 256
+
 
 def screenshot(screen_surface, appstate):
     filename = "screenshot.png"
     # TODO - add timestamp to screenshot filename
-    pygame.image.save(screen_surface, filename)
-    # add metadata
+    # pixels and metadata are encoded together, in one pass
     metadata_info = appstate.get_info_table()
-    targetImage = Image.open(filename)
-    metadata = PngInfo()
     for key, value in metadata_info.items():
         print(f"Adding metadata {key}:{value}")
-        metadata.add_text(key, f"{value}")
-    targetImage.save(filename, pnginfo=metadata)
+    (width, height) = screen_surface.get_size()
+    png = open_png(filename, width, height, metadata_info)
+    # [x, y, channel] view of the surface, it stays locked until deleted
+    pixels = pygame.surfarray.pixels3d(screen_surface)
+    for ystart in range(0, height, SCREENSHOT_BAND):
+        write_png_rows(png, pixels[:, ystart : ystart + SCREENSHOT_BAND].transpose(1, 0, 2))
+    del pixels
+    close_png(png)
     print(f"Saved screenshot to {filename}")
 
+
+def supersampled_screenshot(appstate, frame, factor=fractal_supersample.SUPERSAMPLE_FACTOR):
+    # the frame's colors without the info overlay, edge pixels sampled factor x factor times
+    filename = "screenshot.png"
+    if appstate.palette_mode == Palette_Mode.CUSTOM:
+        custom_palette = get_computed_palette(
+            prepare_palettes(palettes_definitions, appstate.max_iterations),
+            appstate.custom_palette_name,
+        )
+    else:
+        custom_palette = []
+    host_array_rgb = fractal_supersample.supersample(
+        *frame[:10],
+        frame[10].copy(),
+        appstate.WINDOW_SIZE,
+        appstate.xmax,
+        appstate.xmin,
+        appstate.ymin,
+        appstate.ymax,
+        appstate.fractal_mode,
+        appstate.max_iterations,
+        appstate.power,
+        appstate.escape_radius,
+        appstate.epsilon,
+        appstate.juliaxy,
+        appstate.normalization_mode,
+        appstate.palette_mode,
+        custom_palette,
+        appstate.palette_width,
+        appstate.palette_shift,
+        appstate.backend,
+        appstate.interior_check,
+        appstate.xcenter,
+        appstate.ycenter,
+        appstate.yheight,
+        factor,
+    )
+    print(fractal_supersample.format_supersample_stats(fractal_supersample.last_supersample_stats))
+    (width, height) = host_array_rgb.shape
+    png = open_png(filename, width, height, appstate.get_info_table())
+    for ystart in range(0, height, SCREENSHOT_BAND):
+        write_png_rows(png, packed_to_rows(host_array_rgb[:, ystart : ystart + SCREENSHOT_BAND]))
+    close_png(png)
+    print(f"Saved supersampled screenshot to {filename}")
+
 def load_metada(filename, appstate):
     print(f"Loading metadata from {filename}")
     srcImage = Image.open(filename)
@@ -23,4 +78,4 @@ def load_metada(filename, appstate):
     info_table = srcImage.info
     print(f"Metadata info_table: {info_table}")
     appstate.set_from_info_table(info_table)
-    return info_table
\ No newline at end of file
+    return info_table
@@ -1,13 +1,19 @@
 import math
 from dataclasses import dataclass
+from decimal import localcontext
 from utils.types import (
     type_math_complex,
     type_math_float,
     type_math_int,
+    type_math_decimal,
     type_enum_int,
 )
 from fractal.colors import Normalization_Mode, Palette_Mode
 from fractal.fractal import Fractal_Mode
+from fractal.fractal_math import Interior_Check
+from fractal.fractal_perturbation import decimal_digits
+from fractal.fractal_cache import tile_cache_stats, format_tile_cache_stats
+from fractal.fractal_store import tile_store_open, tile_store_stats, format_tile_store_stats
 from fractal.palette import palettes_definitions
 from utils import defaults
 from utils import const
@@ -17,11 +23,14 @@ from ui.keys_config import (
     key_epsilon,
     key_power,
     key_julia,
+    key_interior_check,
     key_normalization_mode,
     key_palette_mode,
     key_color_palette,
     key_palette_shift,
     key_palette_width,
+    key_progressive,
+    key_cost_heatmap,
 )
 from pygame.key import name as key_name
 
@@ -29,7 +38,7 @@ from pygame.key import name as key_name
 class AppState:
     def __init__(self):
         # uses default values from defaults.py
-        # fractal variables
+        # fractal variables, the center is arbitrary precision for deep zooms
         self.xcenter = defaults.xcenter
         self.ycenter = defaults.ycenter
         self.yheight = defaults.yheight
@@ -39,6 +48,7 @@ class AppState:
         self.epsilon = defaults.epsilon
         self.fractal_mode = defaults.fractal_mode
         self.juliaxy = defaults.juliaxy
+        self.interior_check = defaults.interior_check
 
         # fractal info
         self.niter_min= None
@@ -58,6 +68,9 @@ class AppState:
 
         # UI variables
         self.show_info = defaults.show_info
+        self.progressive = defaults.progressive
+        self.show_cost = defaults.show_cost
+        self.backend = defaults.backend
 
         # Const
         self.ZOOM_RATE = const.ZOOM_RATE
@@ -72,30 +85,51 @@ class AppState:
 
     def reset(self):
         print("Reset ")
+        backend = self.backend
         self.__init__()
+        self.backend = backend
 
     def zoom_in(self, mousePos=None):
-        self._zoom(self.ZOOM_RATE, mousePos)
+        return self._zoom(self.ZOOM_RATE, mousePos)
+
+    def zoom(self, zoom_rate, mousePos=None):
+        return self._zoom(zoom_rate, mousePos)
 
     def zoom_out(self, mousePos=None):
-        self._zoom(1 / self.ZOOM_RATE, mousePos)
+        return self._zoom(1 / self.ZOOM_RATE, mousePos)
 
     def _zoom(self, zoom_rate, mousePos):
+        # returns (xorigin, yorigin, zoom_rate): new pixel (x, y) was at
+        # (xorigin + x / zoom_rate, yorigin + y / zoom_rate), or None
         if mousePos is not None:
             (mouseX, mouseY) = mousePos
         else:
             (mouseX, mouseY) = (self.DISPLAY_WIDTH / 2, self.DISPLAY_HEIGTH / 2)
-        self.xcenter = self.xmin + mouseX * (self.xmax - self.xmin) / self.DISPLAY_WIDTH
-        self.ycenter = (
-            self.ymin
-            + (self.DISPLAY_HEIGTH - mouseY)
-            * (self.ymax - self.ymin)
-            / self.DISPLAY_HEIGTH
-        )
+        # the pixel at the top left corner of the new frame
+        xorigin = mouseX - self.DISPLAY_WIDTH / 2 / zoom_rate
+        yorigin = mouseY - self.DISPLAY_HEIGTH / 2 / zoom_rate
+        pixel_move = None
+        if float(zoom_rate).is_integer() or float(1 / zoom_rate).is_integer():
+            # snap it to a pixel, so samples of the new frame are exactly previous pixels
+            xorigin = round(xorigin)
+            yorigin = round(yorigin)
+            pixel_move = (xorigin, yorigin, zoom_rate)
+        # move the center by a float offset, so it keeps all its digits
+        pixel_size = self.yheight / self.DISPLAY_HEIGTH
         self.yheight /= zoom_rate
+        with localcontext(prec=decimal_digits(self.yheight)):
+            self.xcenter += type_math_decimal(
+                (xorigin + self.DISPLAY_WIDTH / 2 / zoom_rate - self.DISPLAY_WIDTH / 2)
+                * pixel_size
+            )
+            self.ycenter += type_math_decimal(
+                (self.DISPLAY_HEIGTH / 2 - yorigin - self.DISPLAY_HEIGTH / 2 / zoom_rate)
+                * pixel_size
+            )
         print(
             f"Zoom {mouseX},{mouseY}, ({self.xcenter},{self.ycenter}), factor {zoom_rate}"
         )
+        return pixel_move
 
     def change_normalization_mode(self):
         self.normalization_mode = (self.normalization_mode + 1) % len(Normalization_Mode)
@@ -159,20 +193,45 @@ class AppState:
         self.juliaxy = type_math_complex(juliax + juliay * 1j)
         print(f"Fractal mode: {Fractal_Mode(self.fractal_mode).name}")
 
+    def change_interior_check(self):
+        self.interior_check = (self.interior_check + 1) % len(Interior_Check)
+        print(f"Interior check: {Interior_Check(self.interior_check).name}")
+
+    def set_window_size(self, size):
+        # the view keeps its yheight on all the rows, whatever their number
+        (self.DISPLAY_WIDTH, self.DISPLAY_HEIGTH) = size
+        self.WINDOW_SIZE = size
+        self.recalc_size()
+
     def recalc_size(self):
+        # float bounds for the float64 backends, they collapse on deep zooms
         xwidth = self.yheight * self.DISPLAY_WIDTH / self.DISPLAY_HEIGTH
-        self.xmin = self.xcenter - xwidth / 2
-        self.xmax = self.xcenter + xwidth / 2
-        self.ymin = self.ycenter - self.yheight / 2
-        self.ymax = self.ycenter + self.yheight / 2
+        self.xmin = type_math_float(self.xcenter) - xwidth / 2
+        self.xmax = type_math_float(self.xcenter) + xwidth / 2
+        self.ymin = type_math_float(self.ycenter) - self.yheight / 2
+        self.ymax = type_math_float(self.ycenter) + self.yheight / 2
 
     def pan(self, x, y):
-        self.xcenter += x * self.PAN_SPEED * (self.xmax - self.xmin)
-        self.ycenter += y * self.PAN_SPEED * (self.ymax - self.ymin)
+        # move by whole pixels, so the pixels still on screen can be kept
+        # returns (xshift, yshift, 1) like _zoom, screen y goes down
+        xshift = round(x * self.PAN_SPEED * self.DISPLAY_WIDTH)
+        yshift = -round(y * self.PAN_SPEED * self.DISPLAY_HEIGTH)
+        pixel_size = self.yheight / self.DISPLAY_HEIGTH
+        with localcontext(prec=decimal_digits(self.yheight)):
+            self.xcenter += type_math_decimal(xshift * pixel_size)
+            self.ycenter -= type_math_decimal(yshift * pixel_size)
+        return xshift, yshift, 1
 
     def toggle_info(self):
         self.show_info = not self.show_info
 
+    def toggle_progressive(self):
+        self.progressive = not self.progressive
+        print(f"Progressive: {self.progressive}")
+
+    def toggle_cost(self):
+        self.show_cost = not self.show_cost
+
     def get_info(self):
         info_list = []
         info_list.append(f"{key_name(key_julia)}: fractal mode: {Fractal_Mode(self.fractal_mode).name}")
@@ -188,6 +247,12 @@ class AppState:
         info_list.append(f"{key_name(key_power)}: power: {self.power}")
         info_list.append(f"{key_name(key_escape_radius)}: escape radius: {self.escape_radius}")
         info_list.append(f"{key_name(key_epsilon)}: epsilon: {self.epsilon}")
+        info_list.append(f"{key_name(key_interior_check)}: interior check: {Interior_Check(self.interior_check).name}")
+        info_list.append(f"{key_name(key_progressive)}: progressive: {self.progressive}")
+        info_list.append(f"{key_name(key_cost_heatmap)}: cost heatmap: {self.show_cost}")
+        info_list.append(format_tile_cache_stats(tile_cache_stats))
+        if tile_store_open():
+            info_list.append(format_tile_store_stats(tile_store_stats))
         return info_list
 
     def get_info_table(self):
@@ -197,6 +262,10 @@ class AppState:
         info_table["xmax"] = self.xmax
         info_table["ymin"] = self.ymin
         info_table["ymax"] = self.ymax
+        # str of a Decimal keeps all its digits
+        info_table["xcenter"] = self.xcenter
+        info_table["ycenter"] = self.ycenter
+        info_table["yheight"] = self.yheight
         info_table["normalization_mode"] = self.normalization_mode
         info_table["palette_mode"] = self.palette_mode
         info_table["custom_palette_name"] = self.custom_palette_name
@@ -206,6 +275,7 @@ class AppState:
         info_table["power"] = self.power
         info_table["escape_radius"] = self.escape_radius
         info_table["epsilon"] = self.epsilon
+        info_table["interior_check"] = self.interior_check
         return info_table
 
     def get_info_table_value(self, info_table, key, default):
@@ -265,7 +335,15 @@ class AppState:
         self.epsilon = type_math_float(
             self.get_info_table_value(info_table, "epsilon", defaults.epsilon)
         )
-        # recalc derived variables
-        self.xcenter = type_math_float(self.xmin + (self.xmax - self.xmin) / 2)
-        self.ycenter = type_math_float(self.ymin + (self.ymax - self.ymin) / 2)
-        self.yheight = type_math_float(self.ymax - self.ymin)
+        self.interior_check = type_enum_int(
+            self.get_info_table_value(info_table, "interior_check", defaults.interior_check)
+        )
+        # recalc derived variables, from the exact center when the metadata has it
+        if "xcenter" in info_table and "ycenter" in info_table and "yheight" in info_table:
+            self.xcenter = type_math_decimal(info_table["xcenter"])
+            self.ycenter = type_math_decimal(info_table["ycenter"])
+            self.yheight = type_math_float(info_table["yheight"])
+        else:
+            self.xcenter = type_math_decimal(float(self.xmin + (self.xmax - self.xmin) / 2))
+            self.ycenter = type_math_decimal(float(self.ymin + (self.ymax - self.ymin) / 2))
+            self.yheight = type_math_float(self.ymax - self.ymin)
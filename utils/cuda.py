@@ -13,6 +13,10 @@ try:
         reduce as cuda_reduce,
     )
 
+    # numba may be installed for the cpu backend on machines without a gpu
+    if not cuda_available():
+        raise ImportError("no cuda device")
+
     def compute_threadsperblock(screenw, screenh):
         gpu = cuda_get_current_device()
         # https://stackoverflow.com/questions/48654403/how-do-i-know-the-maximum-number-of-threads-per-block-in-python-code-with-either
@@ -37,7 +41,7 @@ try:
         return device_array.copy_to_host()
 
 except ImportError:
-    print("numba cuda not installed")
+    print("numba cuda not installed or no cuda device")
 
     # If numba cuda is not installed, use noop operations
     def cuda_jit(
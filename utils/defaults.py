@@ -2,10 +2,12 @@ from utils.types import (
     type_math_complex,
     type_math_float,
     type_math_int,
+    type_math_decimal,
     type_enum_int,
 )
 from fractal.colors import Normalization_Mode, Palette_Mode
-from fractal.fractal import Fractal_Mode
+from fractal.fractal import Fractal_Mode, Compute_Backend
+from fractal.fractal_math import Interior_Check
 from fractal.palette import palettes_definitions
 
 # fractal variables
@@ -13,15 +15,18 @@ xmin = type_math_float(-2.5)
 xmax = type_math_float(1.5)
 ymin = type_math_float(-1.5)
 ymax = type_math_float(1.5)
-xcenter = type_math_float(-0.5)
-ycenter = type_math_float(0)
+xcenter = type_math_decimal("-0.5")
+ycenter = type_math_decimal("0")
 yheight = type_math_float(3)
 max_iterations = type_math_int(1000)
 power = type_math_int(2)
 escape_radius = type_math_int(4)
-epsilon = type_math_float(0.001)
+# 0: interior pixels stop on interior_check (the exact cardioid and bulb test, then the
+# periodicity check), which only runs without the derivative exit and is faster than it
+epsilon = type_math_float(0)
 fractal_mode = type_enum_int(Fractal_Mode.MANDELBROT)
 juliaxy = type_math_complex(0 + 0j)
+interior_check = type_enum_int(Interior_Check.ALL)
 
 # color variables
 palette_mode = type_enum_int(Palette_Mode.HUE)
@@ -32,3 +37,6 @@ custom_palette_name = list(palettes_definitions.keys())[0]
 
 # UI variables
 show_info = True
+progressive = True
+show_cost = False
+backend = type_enum_int(Compute_Backend.AUTO)
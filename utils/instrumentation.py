@@ -0,0 +1,175 @@
+# Hot path instrumentation: nested spans timed with perf_counter_ns, counters and histograms.
+# Spans and counter changes are kept in a ring buffer of the last events, for a timeline of
+# the last frames, histograms of span durations and counter totals cover the whole session.
+# Enabled by FRACTAL_INSTRUMENT: 1 records, a path also writes the events when the program
+# exits, as a Chrome trace (.json, for chrome://tracing or Perfetto) or JSON Lines (.jsonl).
+# Disabled, a timed call costs a global lookup.
+import os
+import json
+import atexit
+import threading
+from collections import deque
+from time import perf_counter_ns
+
+INSTRUMENT_ENV = "FRACTAL_INSTRUMENT"
+# events kept, the oldest are dropped
+RING_SIZE = 65536
+# histogram buckets are powers of 2 of the values, durations in ns
+HISTOGRAM_BUCKETS = 64
+
+# Session state
+enabled = False
+events = deque(maxlen=RING_SIZE)
+counters = {}
+histograms = {}
+# span depth of each thread
+span_state = threading.local()
+
+
+def enable(ring_size=RING_SIZE):
+    global enabled, events
+    if events.maxlen != ring_size:
+        events = deque(events, maxlen=ring_size)
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    events.clear()
+    counters.clear()
+    histograms.clear()
+
+
+def span_start():
+    # start time of a span, nested spans are one level deeper
+    span_state.depth = getattr(span_state, "depth", 0) + 1
+    return perf_counter_ns()
+
+
+def span_end(name, start):
+    # duration of the span started at start, recorded when enabled
+    end = perf_counter_ns()
+    span_state.depth -= 1
+    if enabled:
+        duration = end - start
+        events.append(("span", name, start, duration, threading.get_ident(), span_state.depth))
+        observe(name, duration)
+    return end - start
+
+
+class span:
+    # with span("name"): ... times its block
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = span_start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        span_end(self.name, self.start)
+
+
+def count(name, value=1):
+    if enabled:
+        total = counters.get(name, 0) + value
+        counters[name] = total
+        events.append(("counter", name, perf_counter_ns(), total, threading.get_ident(), 0))
+
+
+def observe(name, value):
+    # adds a value to the histogram name: count, sum, min, max and power of 2 buckets
+    if enabled:
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = {
+                "count": 0,
+                "sum": 0,
+                "min": value,
+                "max": value,
+                "buckets": [0] * HISTOGRAM_BUCKETS,
+            }
+        histogram["count"] += 1
+        histogram["sum"] += value
+        histogram["min"] = min(histogram["min"], value)
+        histogram["max"] = max(histogram["max"], value)
+        histogram["buckets"][min(HISTOGRAM_BUCKETS - 1, max(0, int(value)).bit_length())] += 1
+
+
+def histogram_quantile(histogram, quantile):
+    # upper bound of the bucket holding the quantile
+    rank = quantile * histogram["count"]
+    seen = 0
+    for bucket, bucket_count in enumerate(histogram["buckets"]):
+        seen += bucket_count
+        if seen >= rank and bucket_count > 0:
+            return min(histogram["max"], (1 << bucket) - 1)
+    return histogram["max"]
+
+
+def format_histograms():
+    lines = []
+    for name, histogram in sorted(histograms.items(), key=lambda item: -item[1]["sum"]):
+        lines.append(
+            f"{name:<36} {histogram['count']:7d} calls {histogram['sum'] / 1e9:9.3f}s"
+            f" | mean {histogram['sum'] / histogram['count'] / 1e6:9.3f} ms"
+            f" p50 < {histogram_quantile(histogram, 0.5) / 1e6:9.3f} ms"
+            f" p99 < {histogram_quantile(histogram, 0.99) / 1e6:9.3f} ms"
+        )
+    return "\n".join(lines)
+
+
+def write_jsonl(path):
+    # one event per line, then the counters and histograms
+    with open(path, "w") as jsonl_file:
+        for kind, name, start, value, thread, depth in list(events):
+            if kind == "span":
+                event = {"type": kind, "name": name, "start_ns": start, "duration_ns": value, "thread": thread, "depth": depth}
+            else:
+                event = {"type": kind, "name": name, "time_ns": start, "total": value, "thread": thread}
+            jsonl_file.write(json.dumps(event) + "\n")
+        for name, total in counters.items():
+            jsonl_file.write(json.dumps({"type": "counter_total", "name": name, "total": total}) + "\n")
+        for name, histogram in histograms.items():
+            jsonl_file.write(json.dumps({"type": "histogram", "name": name, **histogram}) + "\n")
+
+
+def write_chrome_trace(path):
+    # complete events for spans and counter events, times in microseconds
+    pid = os.getpid()
+    trace_events = []
+    for kind, name, start, value, thread, _ in list(events):
+        if kind == "span":
+            trace_events.append(
+                {"name": name, "ph": "X", "ts": start / 1000, "dur": value / 1000, "pid": pid, "tid": thread}
+            )
+        else:
+            trace_events.append({"name": name, "ph": "C", "ts": start / 1000, "pid": pid, "args": {name: value}})
+    with open(path, "w") as trace_file:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, trace_file)
+
+
+def write_events(path):
+    if path.endswith(".jsonl"):
+        write_jsonl(path)
+    else:
+        write_chrome_trace(path)
+    print(f"Saved {len(events)} instrumentation events to {path}")
+
+
+def enable_from_environment():
+    setting = os.environ.get(INSTRUMENT_ENV, "")
+    if setting in ("", "0"):
+        return
+    enable()
+    if setting != "1":
+        atexit.register(write_events, setting)
+
+
+enable_from_environment()
@@ -0,0 +1,58 @@
+from types import FunctionType
+
+try:
+    from numba import njit as cpu_jit, prange as cpu_prange
+
+    def numba_available():
+        return True
+
+except ImportError:
+    print("numba not installed")
+
+    # If numba is not installed, use noop operations
+    def cpu_jit(
+        signature_or_function=None,
+        locals={},
+        cache=False,
+        pipeline_class=None,
+        boundscheck=None,
+        **options,
+    ):
+        def wrapper(func):
+            return func
+
+        return wrapper
+
+    cpu_prange = range
+
+    def numba_available():
+        return False
+
+
+def cpu_rebind(func, variant=None, **functions):
+    # Python source of a jitted function (py_func when numba compiled it), with the
+    # functions it calls rebound. Numba caches on disk by name, so each variant needs its own
+    py_func = getattr(func, "py_func", func)
+    func_globals = dict(py_func.__globals__)
+    func_globals.update(functions)
+    name = py_func.__name__ if variant is None else f"{py_func.__name__}_{variant}"
+    rebound_func = FunctionType(
+        py_func.__code__,
+        func_globals,
+        name,
+        py_func.__defaults__,
+        py_func.__closure__,
+    )
+    rebound_func.__qualname__ = (
+        py_func.__qualname__ if variant is None else f"{py_func.__qualname__}_{variant}"
+    )
+    rebound_func.__module__ = py_func.__module__
+    return rebound_func
+
+
+def cpu_device(func, variant=None, **device_functions):
+    # Recompile a @cuda_jit device function for the cpu, with the device functions
+    # it calls rebound to their cpu compiled versions
+    return cpu_jit(nogil=True, cache=True)(
+        cpu_rebind(func, variant, **device_functions)
+    )
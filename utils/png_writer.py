@@ -0,0 +1,143 @@
+# Streaming PNG writer: rows are filtered and written as they come, so the image is never
+# whole in memory, whatever its size
+# The zlib stream is cut in chunks compressed at once on a thread pool (zlib releases the gil),
+# each primed with the end of the previous one so matches still reach across chunks
+import atexit
+import zlib
+from os import cpu_count
+from struct import pack
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from numpy import (
+    zeros as np_zeros,
+    concatenate as np_concatenate,
+    stack as np_stack,
+    uint8 as np_uint8,
+)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# 8 bits per channel, RGB
+PNG_BIT_DEPTH = 8
+PNG_COLOR_TYPE_RGB = 2
+# each row is stored as its difference with the row above, fractals have large flat areas
+PNG_FILTER_UP = 2
+# zlib header: deflate with a 32 KB window, no preset dictionary
+ZLIB_HEADER = b"\x78\x9c"
+# deflate matches reach 32 KB back, the priming dictionary of each chunk
+DEFLATE_WINDOW = 32 * 1024
+# uncompressed bytes per chunk, and chunks in flight per worker
+CHUNK_SIZE = 1024 * 1024
+CHUNKS_PER_WORKER = 2
+
+# Session state: the compression pool is created once, then reused by every image
+compress_executor = None
+compress_workers = 0
+
+
+def shutdown_compress_executor():
+    if compress_executor is not None:
+        compress_executor.shutdown()
+
+
+def get_compress_executor():
+    global compress_executor, compress_workers
+    if compress_executor is None:
+        atexit.register(shutdown_compress_executor)
+        compress_workers = cpu_count() or 1
+        compress_executor = ThreadPoolExecutor(max_workers=compress_workers)
+    return compress_executor
+
+
+def png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return (
+        pack(">I", len(data))
+        + chunk_type
+        + data
+        + pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+    )
+
+
+def packed_to_rows(host_array_rgb):
+    # packed 0xRRGGBB [x, y] to PNG rows [y, x, channel]
+    rows = host_array_rgb.T
+    return np_stack((rows >> 16, rows >> 8, rows), axis=-1).astype(np_uint8)
+
+
+def compress_chunk(data, dictionary, level, last):
+    # raw deflate, ended on a byte boundary so the chunks can be concatenated
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def open_png(filename, width, height, text=None, level=6):
+    # text: {keyword: value} saved as tEXt chunks, before the image data
+    png_file = open(filename, "wb")
+    png_file.write(PNG_SIGNATURE)
+    png_file.write(
+        png_chunk(
+            b"IHDR",
+            pack(">IIBBBBB", width, height, PNG_BIT_DEPTH, PNG_COLOR_TYPE_RGB, 0, 0, 0),
+        )
+    )
+    for keyword, value in (text or {}).items():
+        png_file.write(
+            png_chunk(b"tEXt", f"{keyword}".encode("latin-1") + b"\0" + f"{value}".encode("latin-1"))
+        )
+    png_file.write(png_chunk(b"IDAT", ZLIB_HEADER))
+    return {
+        "file": png_file,
+        "width": width,
+        "rows_left": height,
+        "level": level,
+        "previous_row": np_zeros((width, 3), dtype=np_uint8),
+        "buffer": bytearray(),
+        "dictionary": b"",
+        "adler": zlib.adler32(b""),
+        "executor": get_compress_executor(),
+        "max_pending": CHUNKS_PER_WORKER * compress_workers,
+        "pending": deque(),
+    }
+
+
+def write_pending(png, max_pending):
+    # chunks are written in order, waiting for the oldest ones
+    while len(png["pending"]) > max_pending:
+        png["file"].write(png_chunk(b"IDAT", png["pending"].popleft().result()))
+
+
+def submit_chunk(png, data, last):
+    png["pending"].append(
+        png["executor"].submit(compress_chunk, data, png["dictionary"], png["level"], last)
+    )
+    png["adler"] = zlib.adler32(data, png["adler"])
+    png["dictionary"] = bytes(data[-DEFLATE_WINDOW:])
+    write_pending(png, png["max_pending"])
+
+
+def write_png_rows(png, rows):
+    # rows: uint8 array (nb rows, width, 3), top to bottom
+    (nb_rows, width, _) = rows.shape
+    assert width == png["width"] and nb_rows <= png["rows_left"], "rows don't fit the image"
+    if nb_rows == 0:
+        return
+    above = np_concatenate((png["previous_row"][None], rows[:-1]))
+    filtered = (rows - above).reshape(nb_rows, width * 3)
+    filter_bytes = np_zeros((nb_rows, 1), dtype=np_uint8) + PNG_FILTER_UP
+    png["buffer"] += np_concatenate((filter_bytes, filtered), axis=1).tobytes()
+    png["previous_row"] = rows[-1].copy()
+    png["rows_left"] -= nb_rows
+    while len(png["buffer"]) >= CHUNK_SIZE:
+        submit_chunk(png, bytes(png["buffer"][:CHUNK_SIZE]), False)
+        del png["buffer"][:CHUNK_SIZE]
+
+
+def close_png(png):
+    assert png["rows_left"] == 0, f"{png['rows_left']} rows missing"
+    submit_chunk(png, bytes(png["buffer"]), True)
+    write_pending(png, 0)
+    png["file"].write(png_chunk(b"IDAT", pack(">I", png["adler"] & 0xFFFFFFFF)))
+    png["file"].write(png_chunk(b"IEND", b""))
+    png["file"].close()
@@ -1,13 +1,36 @@
 from functools import wraps
-from time import time
+from utils import instrumentation
+
+# Session state: when a list, every timed call is also appended to it as (name, seconds),
+# benchmarks read the stages of a frame from it
+timing_records = None
+
+
+def start_timing_records():
+    global timing_records
+    timing_records = []
+
+
+def stop_timing_records():
+    # the calls timed since start_timing_records, innermost first
+    global timing_records
+    (records, timing_records) = (timing_records, None)
+    return records
+
 
 def timing_wrapper(func):
+    # a span of the instrumentation, nothing is timed when it's disabled and no records are kept
+    name = func.__name__
+
     @wraps(func)
     def wrap(*args, **kwargs):
-        start_time = time()
-        result = func(*args, **kwargs)
-        end_time = time()
-        # print(f'Function: {func.__name__} | Args: {args} | Took: {end_time - start_time:.4f} sec')
-        print(f'Function: {func.__name__} Took: {end_time - start_time:.4f}s')
-        return result
+        if not instrumentation.enabled and timing_records is None:
+            return func(*args, **kwargs)
+        start = instrumentation.span_start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            duration = instrumentation.span_end(name, start)
+            if timing_records is not None:
+                timing_records.append((name, duration / 1e9))
     return wrap
@@ -1,4 +1,5 @@
 from numpy import uint8, uint32, int32, float64, complex128
+from decimal import Decimal
 
 type_math_complex = complex128
 type_math_float = float64
@@ -8,4 +9,7 @@ type_enum_int = uint8
 
 type_color_float = float64
 type_color_int = uint32
-type_color_int_small = uint8
\ No newline at end of file
+type_color_int_small = uint8
+
+# arbitrary precision center coordinates, for deep zooms
+type_math_decimal = Decimal